@@ -0,0 +1,104 @@
+"""Benchmark the lazy bencode decoder against an eager decoder on large
+synthetic torrents.
+
+Usage: python -m benchmarks.bench_bencode [number of files ...]
+"""
+import hashlib
+import sys
+import timeit
+
+from nyaalib import Torrent
+
+
+def make_torrent(file_count, piece_count=None):
+    """Build a multi-file `.torrent` file with `file_count` files."""
+    if piece_count is None:
+        piece_count = file_count * 4
+    files = b''.join(
+        b'd6:lengthi' + str(1000 + i).encode() + b'e4:pathl7:Season' +
+        str(i % 10).encode() + b'11:episode.mkvee' for i in range(file_count))
+    pieces = b'\x01' * (20 * piece_count)
+    info = (b'd5:filesl' + files + b'e4:name6:Series12:piece lengthi262144e'
+            b'6:pieces' + str(len(pieces)).encode() + b':' + pieces + b'e')
+    return b'd8:announce23:udp://tracker.test:13374:info' + info + b'e'
+
+
+def eager_decode(data, i=0):
+    """A conventional decoder that builds `bytes`, `list` and `dict`
+    objects for the whole structure.
+    """
+    c = data[i:i + 1]
+    if c == b'i':
+        end = data.index(b'e', i)
+        return int(data[i + 1:end]), end + 1
+    if c == b'l':
+        i += 1
+        values = []
+        while data[i:i + 1] != b'e':
+            value, i = eager_decode(data, i)
+            values.append(value)
+        return values, i + 1
+    if c == b'd':
+        i += 1
+        values = {}
+        while data[i:i + 1] != b'e':
+            key, i = eager_decode(data, i)
+            values[key], i = eager_decode(data, i)
+        return values, i + 1
+    colon = data.index(b':', i)
+    start = colon + 1
+    end = start + int(data[i:colon])
+    return data[start:end], end
+
+
+def eager_encode(value):
+    if isinstance(value, int):
+        return b'i' + str(value).encode() + b'e'
+    if isinstance(value, bytes):
+        return str(len(value)).encode() + b':' + value
+    if isinstance(value, list):
+        return b'l' + b''.join(eager_encode(v) for v in value) + b'e'
+    return b'd' + b''.join(
+        eager_encode(k) + eager_encode(value[k]) for k in sorted(value)) + b'e'
+
+
+def eager_infohash(data):
+    info = eager_decode(data)[0][b'info']
+    return hashlib.sha1(eager_encode(info)).hexdigest()
+
+
+def eager_total_size(data):
+    info = eager_decode(data)[0][b'info']
+    return sum(f[b'length'] for f in info[b'files'])
+
+
+def bench(function, repeat=5):
+    number = 3
+    best = min(timeit.repeat(function, number=number, repeat=repeat))
+    return best / number * 1000
+
+
+def main(file_counts):
+    print('{0:>8} {1:<12} {2:>10} {3:>10} {4:>8}'.format(
+        'files', 'operation', 'eager ms', 'lazy ms', 'speedup'))
+    for file_count in file_counts:
+        data = make_torrent(file_count)
+        assert eager_infohash(data) == Torrent('1', data).infohash
+        assert eager_total_size(data) == Torrent('1', data).total_size
+        cases = [
+            ('infohash', lambda: eager_infohash(data),
+             lambda: Torrent('1', data).infohash),
+            ('total_size', lambda: eager_total_size(data),
+             lambda: Torrent('1', data).total_size),
+            ('name', lambda: eager_decode(data)[0][b'info'][b'name'],
+             lambda: Torrent('1', data).metainfo[b'info'][b'name']),
+        ]
+        for name, eager, lazy in cases:
+            eager_ms = bench(eager)
+            lazy_ms = bench(lazy)
+            print('{0:>8} {1:<12} {2:>10.2f} {3:>10.2f} {4:>7.1f}x'.format(
+                file_count, name, eager_ms, lazy_ms, eager_ms / lazy_ms))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000])
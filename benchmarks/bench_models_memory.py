@@ -0,0 +1,66 @@
+"""Compare the memory used by search results held as the old `__dict__`
+based models, the slotted models and a :class:`TorrentStubTable`.
+
+Usage: python -m benchmarks.bench_models_memory [number of torrents]
+"""
+import sys
+import tracemalloc
+
+from nyaalib import Category, TorrentStub
+from nyaalib.columnar import TorrentStubTable
+
+
+class DictTorrentStub(object):
+    """The :class:`TorrentStub` as it was before it had `__slots__`."""
+    def __init__(self, torrent_id, name, category, seeders, leechers,
+                 file_size, downloads):
+        self.tid = torrent_id
+        self.name = name
+        self.category = category
+        self.seeders = seeders
+        self.leechers = leechers
+        self.file_size = file_size
+        self.downloads = downloads
+
+
+def make_rows(count):
+    """Build the attribute values of `count` torrents as the extraction code
+    would: fresh `str` and `int` objects for every row.
+    """
+    categories = list(Category)
+    for i in range(count):
+        yield (str(100000 + i), u'[Group] Show - {0:02d} [720p].mkv'.format(i),
+               categories[i % len(categories)], (i * 7) % 5000,
+               (i * 3) % 700, u'{0}.{1} MiB'.format(100 + i % 900, i % 10),
+               (i * 13) % 100000)
+
+
+def measure(build, count):
+    tracemalloc.start()
+    container = build(count)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(container) == count
+    return current, peak
+
+
+def main(count):
+    cases = [
+        ('dict models', lambda n: [DictTorrentStub(*row)
+                                   for row in make_rows(n)]),
+        ('slotted models', lambda n: [TorrentStub(*row)
+                                      for row in make_rows(n)]),
+        ('TorrentStubTable', lambda n: TorrentStubTable(
+            TorrentStub(*row) for row in make_rows(n))),
+    ]
+    print('{0} torrents'.format(count))
+    print('{0:<18} {1:>12} {2:>12} {3:>14}'.format(
+        'representation', 'retained MB', 'peak MB', 'bytes/torrent'))
+    for name, build in cases:
+        current, peak = measure(build, count)
+        print('{0:<18} {1:>12.1f} {2:>12.1f} {3:>14.0f}'.format(
+            name, current / 1e6, peak / 1e6, float(current) / count))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,302 @@
+"""Benchmark page parsing and extraction offline, replaying the recorded
+pages of `test/fixtures/pages` (the search page has 100 rows) and a synthetic
+multi-page search through a mocked transport, both on the threads of the
+client and through a :class:`nyaalib.pipeline.ParsePipeline`.
+
+For every case, this reports the median latency of a call, the number of
+pages processed per second and the peak memory allocated by one call. The
+peak memory is measured with :mod:`tracemalloc`, which does not see the
+memory allocated by lxml itself. The results can be saved as a baseline, and
+later runs compared against it::
+
+    python -m benchmarks.bench_parsing --save baseline.json
+    python -m benchmarks.bench_parsing --compare baseline.json --threshold 0.2
+
+With `--compare`, the exit status is 1 if any case is slower than its
+baseline by more than the threshold (a fraction of the baseline latency).
+"""
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import timeit
+import tracemalloc
+
+import requests_mock
+
+from nyaalib import (
+    NyaaClient, SWARM_STATS_FIELDS, extract_url_query_parameter,
+)
+from nyaalib.pipeline import ParsePipeline
+
+
+test_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, 'test')
+pages_path = os.path.join(test_path, 'fixtures', 'pages')
+
+# the search page builder is shared with the tests
+sys.path.insert(0, test_path)
+import conftest  # noqa: E402
+
+nyaa_url = conftest.nyaa_url
+
+_DESCRIPTION = re.compile(
+    r'(<div class="viewdescription">)(.*?)(</div>)', re.S)
+
+
+def read_page(name):
+    with io.open(os.path.join(pages_path, name), 'rb') as f:
+        return f.read()
+
+
+def make_search_page(row_count, page=1, total_pages=1):
+    """Build a search page of `row_count` rows by repeating the rows of a
+    recorded page, with a distinct torrent ID per row and a pager linking to
+    `total_pages` pages.
+    """
+    rows = conftest.search_page_rows()
+    first_tid = 1000000 - page * row_count
+    return conftest.make_search_page(
+        (conftest.with_row_tid(rows[i % len(rows)], first_tid - i)
+         for i in range(row_count)),
+        total_pages).encode('utf-8')
+
+
+def make_view_page(description_lines):
+    """Build a torrent page with a long description of `description_lines`
+    lines of links and text, like a batch release listing its episodes.
+    """
+    html = read_page('view_tid_486766.html').decode('utf-8')
+    description = u''.join(
+        u'<a href="http://example.com/{0}" rel="nofollow">Episode {0}</a> '
+        u'<b>[720p]</b> <i>CRC32 {0:08X}</i><br>'.format(i)
+        for i in range(description_lines))
+    html = _DESCRIPTION.sub(
+        lambda match: match.group(1) + description + match.group(3), html)
+    return html.encode('utf-8')
+
+
+def extract_all_fields(client, torrent_id, content):
+    """Extract a torrent page, including its deferred fields."""
+    torrent_page = client._extract_torrent_page(torrent_id, content)
+    torrent_page.date_created
+    torrent_page.description
+    return torrent_page
+
+
+def fetch(client, m, content, params=None):
+    """Return a :class:`requests.Response` of `content` read through the
+    mocked transport.
+    """
+    m.get(nyaa_url, content=content)
+    response = client._get(params or {})
+    response.content
+    return response
+
+
+def make_cases(client, pipeline, m, page_count):
+    search_page = read_page('search_love_live_seeders_descending.html')
+    view_page = read_page('view_tid_486766.html')
+    empty_page = read_page('search_no_torrents_found.html')
+    feed = read_page('rss_love_live.xml')
+
+    search_response = fetch(client, m, search_page)
+    view_response = fetch(client, m, view_page)
+    search_content = client._get_page_content(search_response)
+    view_content = client._get_page_content(view_response)
+    long_view_page = make_view_page(500)
+    long_view_content = client._get_page_content(
+        fetch(client, m, long_view_page))
+
+    url = ('http://www.nyaa.se/?page=search&cats=1_37&term=love+live&sort=2'
+           '&offset=3')
+
+    pages = dict(
+        (page, make_search_page(100, page, page_count))
+        for page in range(1, page_count + 1))
+
+    def serve_pages():
+        m.get(nyaa_url, content=lambda request, context: pages[
+            int(request.qs.get('offset', ['1'])[0])])
+
+    def search_all_pages():
+        serve_pages()
+        stubs = list(client.iter_search('', max_pages=page_count))
+        assert len(stubs) == 100 * page_count
+
+    def pipeline_search_all_pages():
+        serve_pages()
+        stubs = list(pipeline.iter_search('', max_pages=page_count))
+        assert len(stubs) == 100 * page_count
+
+    def search_page_end_to_end(content):
+        def search():
+            m.get(nyaa_url, content=content)
+            client.search('love live')
+        return search
+
+    def view_page_end_to_end(content, fields=None):
+        def view_torrent():
+            m.get(nyaa_url, content=content)
+            torrent_page = client.view_torrent('486766', fields)
+            if fields is None:
+                torrent_page.date_created
+                torrent_page.description
+        return view_torrent
+
+    def search_rss():
+        m.get(nyaa_url, content=feed)
+        list(client.search_rss('love live'))
+
+    # (name, function, number of pages processed by a call)
+    return [
+        ('get_page_content/search', lambda: client._get_page_content(
+            search_response), 1),
+        ('get_page_content/view', lambda: client._get_page_content(
+            view_response), 1),
+        ('iter_torrent_stubs/search', lambda: list(
+            client._iter_torrent_stubs(search_content)), 1),
+        ('extract_torrent_page/view', lambda: extract_all_fields(
+            client, '486766', view_content), 1),
+        ('extract_torrent_page/view_stats', lambda: (
+            client._extract_torrent_page(
+                '486766', view_content, SWARM_STATS_FIELDS)), 1),
+        ('extract_torrent_page/long_description', lambda: (
+            extract_all_fields(client, '486766', long_view_content)), 1),
+        ('extract_torrent_page/long_description_stats', lambda: (
+            client._extract_torrent_page(
+                '486766', long_view_content, SWARM_STATS_FIELDS)), 1),
+        ('view_torrent/long_description', view_page_end_to_end(
+            long_view_page), 1),
+        ('view_torrent/long_description_stats', view_page_end_to_end(
+            long_view_page, SWARM_STATS_FIELDS), 1),
+        ('extract_url_query_parameter', lambda: extract_url_query_parameter(
+            url, 'offset'), 0),
+        ('search/empty', search_page_end_to_end(empty_page), 1),
+        ('search/search', search_page_end_to_end(search_page), 1),
+        ('search_rss/search', search_rss, 1),
+        ('iter_search/{0}_pages'.format(page_count), search_all_pages,
+         page_count),
+        ('pipeline/iter_search/{0}_pages'.format(page_count),
+         pipeline_search_all_pages, page_count),
+    ]
+
+
+def measure(function, pages, repeat):
+    """Return the median seconds per call, the pages per second and the peak
+    `bytes` allocated by one call of `function`.
+    """
+    # run the function for at least about 20ms per sample
+    number = 1
+    while timeit.timeit(function, number=number) < 0.02:
+        number *= 2
+    samples = sorted(
+        t / number for t in timeit.repeat(function, number=number,
+                                          repeat=repeat))
+    median = samples[len(samples) // 2]
+
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'median_ms': median * 1000,
+        'pages_per_second': pages / median if pages else None,
+        'peak_kb': peak / 1024.0,
+    }
+
+
+def run(parser, page_count, repeat, only=None, parse_workers=None):
+    client = NyaaClient(nyaa_url, parser=parser)
+    results = {}
+    with requests_mock.mock() as m, ParsePipeline(
+            client, parse_workers=parse_workers) as pipeline:
+        for name, function, pages in make_cases(
+                client, pipeline, m, page_count):
+            if only and not re.search(only, name):
+                continue
+            results[name] = measure(function, pages, repeat)
+    return results
+
+
+def report(results, baseline=None):
+    print('{0:<44} {1:>10} {2:>10} {3:>10} {4:>9}'.format(
+        'case', 'ms/call', 'pages/s', 'peak KB', 'change'))
+    for name in sorted(results):
+        result = results[name]
+        pages_per_second = result['pages_per_second']
+        change = ''
+        if baseline and name in baseline:
+            change = '{0:+.1%}'.format(
+                result['median_ms'] / baseline[name]['median_ms'] - 1)
+        print('{0:<44} {1:>10.3f} {2:>10} {3:>10.1f} {4:>9}'.format(
+            name, result['median_ms'],
+            '-' if pages_per_second is None
+            else '{0:.0f}'.format(pages_per_second),
+            result['peak_kb'], change))
+
+
+def find_regressions(results, baseline, threshold):
+    """Return the `(name, ratio)` of the cases slower than their baseline by
+    more than `threshold`, where `ratio` is the latency relative to the
+    baseline.
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        ratio = results[name]['median_ms'] / baseline[name]['median_ms']
+        if ratio - 1 > threshold:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    arg_parser.add_argument('--parser', default='html5lib')
+    arg_parser.add_argument('--pages', type=int, default=5,
+                            help='the number of pages of the multi-page case')
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--parse-workers', type=int,
+                            help='the number of parse processes of the '
+                                 'pipeline case, defaulting to the CPUs')
+    arg_parser.add_argument('--only', help='a regex of the cases to run')
+    arg_parser.add_argument('--save', metavar='PATH',
+                            help='save the results as a JSON baseline')
+    arg_parser.add_argument('--compare', metavar='PATH',
+                            help='compare the results with a JSON baseline')
+    arg_parser.add_argument('--threshold', type=float, default=0.2,
+                            help='the tolerated slowdown, as a fraction')
+    args = arg_parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with io.open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['parser'] != args.parser:
+            arg_parser.error('the baseline was recorded with the {0} '
+                             'parser'.format(baseline['parser']))
+        baseline = baseline['results']
+
+    results = run(args.parser, args.pages, args.repeat, args.only,
+                  args.parse_workers)
+    report(results, baseline)
+
+    if args.save:
+        with io.open(args.save, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'parser': args.parser, 'results': results},
+                               indent=2, sort_keys=True))
+
+    if baseline is not None:
+        regressions = find_regressions(results, baseline, args.threshold)
+        for name, ratio in regressions:
+            print('REGRESSION {0}: {1:.2f}x the baseline'.format(name, ratio))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
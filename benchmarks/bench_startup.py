@@ -0,0 +1,64 @@
+"""Benchmark the startup time of `import nyaalib` and of the command line
+interface, each in a new interpreter.
+
+For every case, this reports the median wall time of a run and whether the
+heavy dependencies (requests, html5lib and lxml) were imported. The time of
+an interpreter that imports nothing is reported first, as the baseline.
+
+Usage: python -m benchmarks.bench_startup [number of runs]
+"""
+import os
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ('requests', 'html5lib', 'lxml')
+
+_REPORT_IMPORTS = (
+    '; import sys; sys.stderr.write(",".join(sorted(set({0!r}) & '
+    'set(sys.modules))))'.format(HEAVY_MODULES))
+
+CASES = [
+    ('python (baseline)', ['-c', 'pass' + _REPORT_IMPORTS]),
+    ('import nyaalib', ['-c', 'import nyaalib' + _REPORT_IMPORTS]),
+    ('import nyaalib.cli', ['-c', 'import nyaalib.cli' + _REPORT_IMPORTS]),
+    ('NyaaClient()', [
+        '-c', 'import nyaalib; nyaalib.NyaaClient().session' +
+        _REPORT_IMPORTS]),
+    ('nyaalib --help', ['-m', 'nyaalib', '--help']),
+    ('nyaalib search --help', ['-m', 'nyaalib', 'search', '--help']),
+]
+
+
+def measure(args, runs):
+    """Return the median seconds of running the interpreter with `args`,
+    and the heavy modules it reported importing.
+    """
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir)
+    samples = []
+    imported = ''
+    for _ in range(runs):
+        start = time.time()
+        process = subprocess.Popen(
+            [sys.executable] + args, cwd=root, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        _, stderr = process.communicate()
+        samples.append(time.time() - start)
+        imported = stderr.decode('utf-8', 'replace').strip()
+    samples.sort()
+    return samples[len(samples) // 2], imported
+
+
+def main(runs):
+    print('{0:<24} {1:>10} {2}'.format('case', 'median ms', 'imported'))
+    for name, args in CASES:
+        median, imported = measure(args, runs)
+        if args[0] == '-m':
+            imported = '-'
+        print('{0:<24} {1:>10.1f} {2}'.format(
+            name, median * 1000, imported or 'none'))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
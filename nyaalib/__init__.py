@@ -1,39 +1,58 @@
-import datetime
-from xml.etree import ElementTree
+import threading
+import time
+from concurrent import futures
 try:
     from urllib.parse import urlparse, parse_qs
 except ImportError:
     # Python 2
     from urlparse import urlparse, parse_qs
 
-import html5lib
-import requests
-
+from .concurrency import SingleFlight, iter_completed
 from .models import (
     Category, SearchSortKey, SearchOrderKey, SearchResultPage, TorrentPage,
-    Torrent, TorrentStub, User
+    TorrentPageFailure, Torrent, TorrentStub, User, SWARM_STATS_FIELDS,
+    TORRENT_PAGE_FIELDS,
 )
+from .metrics import NULL_TIMER, start_timer
+from .parsers import get_parser
+from .schema import NYAA_SCHEMA
+from .throttle import RETRY_STATUSES, monotonic
 
 TORRENT_NOT_FOUND_TEXT = \
     u'The torrent you are looking for does not appear to be in the database.'
 
+DEFAULT_TIMEOUT = (5, 30)
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# the number of bytes of a page fed at a time to an incremental parser
+PAGE_CHUNK_SIZE = 16 * 1024
+
+_SWARM_STATS_FIELDS = frozenset(SWARM_STATS_FIELDS)
+
 
 class TorrentNotFoundError(Exception):
     pass
 
 
-class NyaaClient(object):
-    """The Nyaa client.
-
-    Provides configuration and methods to access Nyaa.
+class BaseNyaaClient(object):
+    """The transport-independent parts of the Nyaa clients: turning the
+    HTML of Nyaa pages into models.
     """
 
-    def __init__(self, url='http://www.nyaa.se'):
-        """Initialize the :class:`NyaaClient`.
-
+    def __init__(self, url='http://www.nyaa.se', parser='html5lib',
+                 schema=NYAA_SCHEMA):
+        """
         :param url: the base URL of the Nyaa or Nyaa-like torrent tracker
+        :param parser: the HTML parser backend, either a name (`'html5lib'`,
+            the default, the much faster `'lxml'`, or `'streaming'`) or a
+            :class:`nyaalib.parsers.ParserBackend`
+        :param schema: the :class:`nyaalib.schema.SiteSchema` describing the
+            layout of the pages of the site
         """
         self.base_url = url
+        self.parser = get_parser(parser)
+        self.schema = schema
 
     def _get_page_content(self, response):
         """Given a :class:`requests.Response`, return the
@@ -42,43 +61,24 @@ class NyaaClient(object):
         :param response: a :class:`requests.Response` to parse
         :returns: the :class:`Element` of the first content `div` or `None`
         """
-        document = html5lib.parse(
-            response.content,
-            encoding=response.encoding,
-            treebuilder='etree',
-            namespaceHTMLElements=False
-        )
-        # etree doesn't fully support XPath, so we can't just search
-        # the attribute values for "content"
-        divs = document.findall(
-            ".//body//div[@class]")
-        content_div = None
-        for div in divs:
-            if "content" in div.attrib['class'].split(' '):
-                content_div = div
-                break
-
-        # The `Element` object is False-y when there are no subelements,
-        # so compare to `None`
-        if content_div is None:
-            return None
-        return content_div
-
-    def view_torrent(self, torrent_id):
-        """Retrieves and parses the torrent page for a given `torrent_id`.
-
-        :param torrent_id: the ID of the torrent to view
-        :raises TorrentNotFoundError: if the torrent does not exist
-        :returns: a :class:`TorrentPage` with a snapshot view of the torrent
-            detail page
+        return self.parser.parse(response.content, response.encoding)
+
+    def _extract_torrent_page(self, torrent_id, content, fields=None):
+        """Extract the :class:`TorrentPage` from the content `div` of a
+        torrent detail page.
+
+        `date_created` and `description` are extracted when they are first
+        read, so the page holds on to the content `div` until then.
+
+        :param torrent_id: the ID of the viewed torrent
+        :param content: the content :class:`Element` of the page
+        :param fields: the names of the attributes to extract (see
+            :data:`TORRENT_PAGE_FIELDS`), or `None` for all of them; the
+            other attributes are `None`
+        :raises TorrentNotFoundError: if the page says the torrent does not
+            exist
+        :returns: a :class:`TorrentPage`
         """
-        params = {
-            'page': 'view',
-            'tid': torrent_id,
-        }
-        r = requests.get(self.base_url, params=params)
-        content = self._get_page_content(r)
-
         # Check if the content div has any child elements
         if not len(content):
             # The "torrent not found" text in the page has some unicode junk
@@ -87,56 +87,450 @@ class NyaaClient(object):
             if TORRENT_NOT_FOUND_TEXT in text:
                 raise TorrentNotFoundError(TORRENT_NOT_FOUND_TEXT)
 
-        cell_td_elems = content.findall('.//td')
-        name = cell_td_elems[3].text
-
-        category_href = content\
-            .findall(".//td[@class='viewcategory']/a[2]")[0]\
-            .attrib['href']
-        category_value = category_href.split('cats=')[1]
-        category = Category.lookup_category(category_value)
-
-        # parse the submitter details
-        submitter_a_elem = cell_td_elems[7].findall('a')[0]
-        submitter_id = submitter_a_elem.attrib['href'].split('=')[1]
-        submitter_name = submitter_a_elem.findall('span')[0].text
-        submitter = User(submitter_id, submitter_name)
-
-        tracker = cell_td_elems[11].text
-        date_created = datetime.datetime.strptime(
-            cell_td_elems[5].text, '%Y-%m-%d, %H:%M %Z')
-
-        seeders = int(content.findall(".//span[@class='viewsn']")[0].text)
-        leechers = int(content.findall(".//span[@class='viewln']")[0].text)
-        downloads = int(content.findall(".//span[@class='viewdn']")[0].text)
-
-        file_size = cell_td_elems[21].text
-
-        # note that the tree returned by html5lib might not exactly match the
-        # original contents of the description div
-        description = ElementTree.tostring(
-            content.findall(".//div[@class='viewdescription']")[0],
-            encoding='utf8', method='html')
-        return TorrentPage(
-            torrent_id, name, submitter, category, tracker, date_created,
-            seeders, leechers, downloads, file_size, description)
-
-    def get_torrent(self, torrent_id):
+        fields = _check_fields(fields)
+        values = self.schema.extract_view(content, fields)
+
+        submitter = None
+        if 'submitter' in fields:
+            submitter = User(values['submitter_id'], values['submitter_name'])
+        torrent_page = TorrentPage(
+            torrent_id, values.get('name'), submitter, values.get('category'),
+            values.get('tracker'), None, values.get('seeders'),
+            values.get('leechers'), values.get('downloads'),
+            values.get('file_size'), None)
+        if 'file_size' not in fields:
+            torrent_page.file_size = None
+        if 'size' not in fields:
+            torrent_page.size = None
+
+        if 'date_created' in fields:
+            torrent_page._defer('date_created', values['date_created'])
+        if 'description' in fields:
+            description_element = values['description']
+            torrent_page._defer('description', lambda: self.parser.tostring(
+                description_element()))
+        return torrent_page
+
+    def _extract_search_result_page(self, content, terms, category, page,
+                                    sort_key, order_key):
+        """Extract the :class:`SearchResultPage` from the content `div` of a
+        search page.
+
+        :param content: the content :class:`Element` of the page
+        :returns: a :class:`SearchResultPage`
+        """
+        total_pages = self._extract_total_pages(content)
+        torrent_stubs = list(self._iter_torrent_stubs(content))
+        return SearchResultPage(
+            terms, category, sort_key, order_key, page, total_pages,
+            torrent_stubs)
+
+    def _extract_total_pages(self, content):
+        """Extract the total number of pages of results from the content
+        `div` of a search page.
+        """
+        return self.schema.extract_total_pages(content)
+
+    def _iter_torrent_stubs(self, content):
+        """Extract the :class:`TorrentStub` objects from the content `div`
+        of a search page, one row at a time, so that a caller can stop
+        before the whole page has been extracted.
+        """
+        for values in self.schema.iter_rows(content):
+            yield TorrentStub(
+                values['tid'], values['name'], values['category'],
+                values['seeders'], values['leechers'], values['file_size'],
+                values['downloads'])
+
+
+class NyaaClient(BaseNyaaClient):
+    """The Nyaa client.
+
+    Provides configuration and methods to access Nyaa.
+    """
+
+    def __init__(self, url='http://www.nyaa.se', session=None,
+                 pool_connections=10, pool_maxsize=10, max_retries=0,
+                 timeout=DEFAULT_TIMEOUT, keep_alive=True, parser='html5lib',
+                 cache=None, torrent_store=None, rate_limiter=None,
+                 retry_policy=None, concurrency_limiter=None, hooks=None,
+                 schema=NYAA_SCHEMA, coalesce=False):
+        """Initialize the :class:`NyaaClient`.
+
+        Requests go through pooled keep-alive connections. Unless a `session`
+        is given, each thread gets its own :class:`requests.Session`, but all
+        of them share one :class:`requests.adapters.HTTPAdapter` (and thus
+        one connection pool), so a single client can be shared by a pool of
+        worker threads.
+
+        :param url: the base URL of the Nyaa or Nyaa-like torrent tracker
+        :param session: an optional :class:`requests.Session` to use for every
+            request instead of the client-managed sessions. The caller is
+            responsible for its configuration and thread-safety.
+        :param pool_connections: the number of connection pools (one per
+            host) to cache
+        :param pool_maxsize: the maximum number of connections kept alive per
+            host; set it to at least the number of threads sharing the client
+        :param max_retries: the number of connection-level retries, passed to
+            the :class:`requests.adapters.HTTPAdapter`
+        :param timeout: the default timeout of each request, either a number
+            of seconds or a `(connect, read)` tuple; `None` waits forever
+        :param keep_alive: if `False`, ask the server to close the connection
+            after every response
+        :param parser: the HTML parser backend, either a name (`'html5lib'`,
+            the default, the much faster `'lxml'`, or `'streaming'`, which
+            parses the pages while they are downloaded) or a
+            :class:`nyaalib.parsers.ParserBackend`
+        :param cache: an optional :class:`nyaalib.cache.ResponseCache` of
+            torrent pages and search results
+        :param torrent_store: an optional :class:`nyaalib.store.TorrentStore`
+            that downloaded `.torrent` files are saved to and served from
+        :param rate_limiter: an optional :class:`nyaalib.throttle.TokenBucket`
+            that every request (including retries) takes a token from
+        :param retry_policy: an optional :class:`nyaalib.throttle.RetryPolicy`
+            for retrying connection errors, timeouts and transient HTTP
+            errors
+        :param concurrency_limiter: an optional
+            :class:`nyaalib.throttle.AdaptiveConcurrencyLimiter` bounding the
+            number of requests in flight across threads
+        :param hooks: an optional list of callables, each called with a
+            :class:`nyaalib.metrics.RequestEvent` after every request,
+            including the failed ones, such as a
+            :class:`nyaalib.metrics.MetricsRecorder`. More can be appended to
+            `hooks` later.
+        :param schema: the :class:`nyaalib.schema.SiteSchema` describing the
+            layout of the pages of the site
+        :param coalesce: if `True`, concurrent calls of :meth:`view_torrent`
+            or :meth:`search` for the same page share a single request and
+            its result, which is the same object for every caller. The
+            counts of calls and of coalesced calls are kept in
+            `single_flight.stats`.
+        """
+        super(NyaaClient, self).__init__(url, parser, schema)
+        self.cache = cache
+        self.torrent_store = torrent_store
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.concurrency_limiter = concurrency_limiter
+        self.hooks = list(hooks) if hooks else []
+        self.single_flight = SingleFlight() if coalesce else None
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self._session = session
+        self._adapter = None
+        if session is None:
+            # requests is imported when it is first needed, so that
+            # `import nyaalib` (eg: by the command line interface) stays fast
+            from requests.adapters import HTTPAdapter
+            self._adapter = HTTPAdapter(
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+                max_retries=max_retries)
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """The :class:`requests.Session` used by the calling thread."""
+        if self._session is not None:
+            return self._session
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            session = requests.Session()
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+            if not self.keep_alive:
+                session.headers['Connection'] = 'close'
+            self._local.session = session
+        return session
+
+    def close(self):
+        """Release the pooled connections held by the client.
+
+        An injected `session` is left open.
+        """
+        if self._adapter is not None:
+            self._adapter.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get(self, params, **kwargs):
+        """Send a `GET` request for the base URL with the given `params`
+        through the pooled session, applying the client's rate limit,
+        concurrency limit and retry policy.
+
+        :param params: a `dict` of URL query parameters
+        :raises requests.HTTPError: if the response still has a transient
+            error status once the retries are exhausted
+        :returns: the :class:`requests.Response`
+        """
+        import requests
+        kwargs.setdefault('timeout', self.timeout)
+        retry_policy = self.retry_policy
+        retry = 0
+        while True:
+            response = None
+            try:
+                response = self._send(params, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if retry_policy is None or retry >= retry_policy.max_retries:
+                    raise
+            else:
+                if (retry_policy is None or
+                        not retry_policy.is_retryable(response)):
+                    return response
+                if retry >= retry_policy.max_retries:
+                    try:
+                        response.raise_for_status()
+                    except requests.HTTPError:
+                        response.close()
+                        raise
+                    return response
+                response.close()
+            time.sleep(retry_policy.backoff(retry, response))
+            retry += 1
+
+    def _fetch_page_content(self, params, timer=NULL_TIMER, timeout=None):
+        """Retrieve a page and return its content `div`.
+
+        With an incremental parser backend, the response is streamed into
+        the parser, which stops reading it once the content `div` is closed.
+
+        :param params: a `dict` of URL query parameters
+        :param timer: the :class:`nyaalib.metrics.RequestTimer` of the
+            request
+        :param timeout: the timeout of the request, or `None` for the
+            client's default
+        :returns: the :class:`Element` of the content `div` or `None`
+        """
+        kwargs = {} if timeout is None else {'timeout': timeout}
+        if not self.parser.incremental:
+            r = self._get(params, **kwargs)
+            timer.fetched(r)
+            content = self._get_page_content(r)
+        else:
+            r = self._get(params, stream=True, **kwargs)
+            timer.responded(r)
+            try:
+                content = self.parser.parse_chunks(
+                    timer.count(r.iter_content(PAGE_CHUNK_SIZE)),
+                    r.encoding)
+            finally:
+                r.close()
+            timer.fetched(r)
+        timer.parsed()
+        return content
+
+    def _send(self, params, **kwargs):
+        """Send a single `GET` request once the rate and concurrency limits
+        allow it.
+
+        The concurrency slot of a streamed response is held until the
+        response is closed, since its body is still being read until then.
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        limiter = self.concurrency_limiter
+        if limiter is None:
+            return self.session.get(self.base_url, params=params, **kwargs)
+
+        limiter.acquire()
+        start = monotonic()
+        try:
+            response = self.session.get(
+                self.base_url, params=params, **kwargs)
+        except BaseException:
+            limiter.release(False, monotonic() - start)
+            raise
+        statuses = (RETRY_STATUSES if self.retry_policy is None
+                    else self.retry_policy.statuses)
+        success = response.status_code not in statuses
+        latency = monotonic() - start
+        if not kwargs.get('stream'):
+            limiter.release(success, latency)
+            return response
+
+        # the latency is still that of the headers, since the time spent
+        # reading the body depends on its size
+        close = response.close
+        released = []
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if not released:
+                    released.append(True)
+                    limiter.release(success, latency)
+
+        response.close = close_and_release
+        return response
+
+    def view_torrent(self, torrent_id, fields=None, use_cache=True):
+        """Retrieves and parses the torrent page for a given `torrent_id`.
+
+        :param torrent_id: the ID of the torrent to view
+        :param fields: the names of the attributes of the :class:`TorrentPage`
+            to extract, or `None` for all of them. The other attributes are
+            `None`. For example, :data:`SWARM_STATS_FIELDS` only extracts the
+            number of seeders, leechers and downloads, which is much cheaper.
+            Pages with only some fields are not cached, but refresh the
+            cached swarm statistics when they include them.
+        :param use_cache: if `False`, always retrieve the page, for callers
+            that must see the latest swarm statistics. The page retrieved
+            still refreshes the cache.
+        :raises TorrentNotFoundError: if the torrent does not exist
+        :raises ValueError: if a field is unknown
+        :returns: a :class:`TorrentPage` with a snapshot view of the torrent
+            detail page
+        """
+        return self._view_torrent(
+            torrent_id, _check_fields(fields), use_cache=use_cache)
+
+    def _view_torrent(self, torrent_id, fields, timeout=None, use_cache=True):
+        metadata = None
+        if self.cache is not None and use_cache:
+            # the cache module is already imported by whoever made the cache
+            from .cache import with_swarm_stats
+            metadata = self.cache.get_torrent_metadata(torrent_id)
+            if metadata is not None:
+                swarm_stats = self.cache.get_swarm_stats(torrent_id)
+                if swarm_stats is not None:
+                    return with_swarm_stats(metadata, swarm_stats)
+                # the metadata is still valid: only the statistics are
+                # extracted from the page
+                fields = _SWARM_STATS_FIELDS
+
+        params = _view_params(torrent_id)
+        if self.single_flight is not None:
+            torrent_page = self.single_flight.do(
+                ('view', _params_key(params), fields),
+                self._fetch_torrent_page, torrent_id, params, fields, timeout)
+        else:
+            torrent_page = self._fetch_torrent_page(
+                torrent_id, params, fields, timeout)
+        if metadata is not None:
+            return with_swarm_stats(metadata, (
+                torrent_page.seeders, torrent_page.leechers,
+                torrent_page.downloads))
+        return torrent_page
+
+    def _fetch_torrent_page(self, torrent_id, params, fields, timeout=None):
+        with start_timer(self.hooks, 'view', params) as timer:
+            content = self._fetch_page_content(params, timer, timeout)
+            torrent_page = self._extract_torrent_page(
+                torrent_id, content, fields)
+        if self.cache is not None:
+            if fields is TORRENT_PAGE_FIELDS:
+                self.cache.set_torrent_page(torrent_page)
+            elif _SWARM_STATS_FIELDS.issubset(fields):
+                self.cache.set_swarm_stats(
+                    torrent_id, torrent_page.seeders, torrent_page.leechers,
+                    torrent_page.downloads)
+        return torrent_page
+
+    def view_torrents(self, torrent_ids, workers=None, timeout=None,
+                      ordered=False, fields=None):
+        """Retrieves and parses the torrent pages of many torrents on a pool
+        of worker threads.
+
+        A torrent that cannot be retrieved does not stop the batch: it is
+        reported as a :class:`TorrentPageFailure` holding the exception.
+        `torrent_ids` is consumed lazily, so it can be a long generator.
+
+        :param torrent_ids: an iterable of torrent IDs
+        :param workers: the number of concurrent requests, defaulting to the
+            size of the connection pool
+        :param timeout: the total number of seconds allowed for the batch, or
+            `None`. The torrents not retrieved in time are reported as
+            failures with a :class:`concurrent.futures.TimeoutError`, and the
+            timeout of each request is capped to the time left, so that the
+            requests in flight at the deadline stop soon after it.
+        :param ordered: if `True`, yield in the order of `torrent_ids`;
+            otherwise yield each torrent page as soon as it is ready
+        :param fields: the attributes to extract, see :meth:`view_torrent`
+        :returns: a generator of :class:`TorrentPage` and
+            :class:`TorrentPageFailure` objects
+        """
+        if workers is None:
+            workers = self.pool_maxsize
+        fields = _check_fields(fields)
+        deadline = None if timeout is None else time.time() + timeout
+
+        def view_torrent(torrent_id):
+            if deadline is None:
+                return self._view_torrent(torrent_id, fields)
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise futures.TimeoutError('The batch deadline was exceeded')
+            return self._view_torrent(
+                torrent_id, fields, _cap_timeout(self.timeout, remaining))
+
+        results = iter_completed(
+            view_torrent, torrent_ids, workers, ordered=ordered,
+            timeout=timeout)
+        try:
+            for torrent_id, future in results:
+                error = future.exception()
+                if error is not None:
+                    yield TorrentPageFailure(torrent_id, error)
+                else:
+                    yield future.result()
+        finally:
+            results.close()
+
+    def get_torrent(self, torrent_id, dest=None,
+                    chunk_size=DOWNLOAD_CHUNK_SIZE):
         """Gets the `.torrent` data for the given `torrent_id`.
 
+        When the client has a `torrent_store` that already holds the torrent,
+        no request is made. Otherwise the download is streamed in chunks into
+        the store and/or `dest`, and only held in memory when neither is
+        given.
+
         :param torrent_id: the ID of the torrent to download
+        :param dest: an optional path or writable binary file object to write
+            the `.torrent` file to. A path is written through a temporary
+            file renamed into place, so a failed download leaves no partial
+            file behind.
+        :param chunk_size: the `int` number of bytes read at a time
         :raises TorrentNotFoundError: if the torrent does not exist
-        :returns: :class:`Torrent` of the associated torrent
-        """
-        params = {
-            'page': 'download',
-            'tid': torrent_id,
-        }
-        r = requests.get(self.base_url, params=params)
-        if r.headers.get('content-type') != 'application/x-bittorrent':
-            raise TorrentNotFoundError(TORRENT_NOT_FOUND_TEXT)
-        torrent_data = r.content
-        return Torrent(torrent_id, torrent_data)
+        :returns: :class:`Torrent` of the associated torrent. Its `data` is
+            `None` when the file was only written to `dest`.
+        """
+        store = self.torrent_store
+        if store is None or torrent_id not in store:
+            params = _download_params(torrent_id)
+            with start_timer(self.hooks, 'download', params) as timer:
+                r = self._get(params, stream=True)
+                timer.responded(r)
+                try:
+                    # the content type is checked before anything is written
+                    _check_torrent_content_type(r.headers)
+                    if store is None and dest is None:
+                        torrent = Torrent(torrent_id, r.content)
+                    else:
+                        chunks = timer.count(r.iter_content(chunk_size))
+                        if store is None:
+                            torrent = _write_chunks(torrent_id, chunks, dest)
+                        else:
+                            store.add_chunks(torrent_id, chunks)
+                    timer.fetched(r)
+                finally:
+                    r.close()
+            if store is None:
+                return torrent
+
+        if dest is None:
+            return store.get(torrent_id)
+        with open(store.path(torrent_id), 'rb') as f:
+            chunks = iter(lambda: f.read(chunk_size), b'')
+            return _write_chunks(torrent_id, chunks, dest)
 
     def search(self, terms, category=Category.all_categories, page=1,
                sort_key=SearchSortKey.date,
@@ -150,58 +544,235 @@ class NyaaClient(object):
         :param order_key: the :class:`SearchOrderkey` of the results list
         :return: a :class:`SearchPage` of results
         """
-        params = {
-            'page': 'search',
-            'term': terms,
-            'cats': category.value,
-            'sort': sort_key.value,
-            'order': order_key.value,
-        }
-        r = requests.get(self.base_url, params=params)
-        content = self._get_page_content(r)
-
-        # first, get the total number of pages returned. this findall returns
-        # two results (one from the top half of the page, one from the bottom),
-        # so only take the first element.
-        a_to_last_page = content.findall('.//div[@class="rightpages"]/a[2]')
-        if not a_to_last_page:
-            total_pages = 1
-        else:
-            last_page_url = a_to_last_page[0].attrib['href']
-            offset = extract_url_query_parameter(last_page_url, "offset")[0]
-            total_pages = int(offset)
-
-        torrent_stubs = []
-        rows = (x for x in content.findall('.//table//tr')
-                if 'tlistrow' in x.attrib.get('class', ''))
-        for row in rows:
-            cell_td_elems = row.findall('td')
-
-            category_value = extract_url_query_parameter(
-                cell_td_elems[0].find('a').attrib['href'],
-                'cats')[0]
-            category = Category.lookup_category(category_value)
-            torrent_id = extract_url_query_parameter(
-                cell_td_elems[1].find('a').attrib['href'],
-                "tid")[0]
-            name = cell_td_elems[1].find('a').text
-            file_size = cell_td_elems[3].text
-            if cell_td_elems[4].text.isdigit():
-                seeders = int(cell_td_elems[4].text)
-            else:
-                seeders = None
-            if cell_td_elems[5].text.isdigit():
-                leechers = int(cell_td_elems[5].text)
-            else:
-                leechers = None
-            downloads = int(cell_td_elems[6].text)
+        if self.cache is not None:
+            search_result_page = self.cache.get_search_result_page(
+                terms, category, page, sort_key, order_key)
+            if search_result_page is not None:
+                return search_result_page
+
+        params = _search_params(terms, category, page, sort_key, order_key)
+        if self.single_flight is not None:
+            return self.single_flight.do(
+                ('search', _params_key(params)),
+                self._fetch_search_result_page, params, terms, category,
+                page, sort_key, order_key)
+        return self._fetch_search_result_page(
+            params, terms, category, page, sort_key, order_key)
+
+    def _fetch_search_result_page(self, params, terms, category, page,
+                                  sort_key, order_key):
+        with start_timer(self.hooks, 'search', params) as timer:
+            content = self._fetch_page_content(params, timer)
+            search_result_page = self._extract_search_result_page(
+                content, terms, category, page, sort_key, order_key)
+        if self.cache is not None:
+            self.cache.set_search_result_page(search_result_page)
+        return search_result_page
+
+    def fetch_search_page(self, terms, category=Category.all_categories,
+                          page=1, sort_key=SearchSortKey.date,
+                          order_key=SearchOrderKey.descending):
+        """Retrieve a search page without going through the cache, for
+        callers that must see the latest uploads and swarm statistics.
+
+        The torrents are extracted one row at a time as they are iterated
+        over, so a caller can stop before the whole page is extracted.
 
-            stub = TorrentStub(torrent_id, name, category, seeders, leechers,
-                               file_size, downloads)
-            torrent_stubs.append(stub)
-        return SearchResultPage(
-            terms, category, sort_key, order_key, page, total_pages,
-            torrent_stubs)
+        :param terms: the `str` needle
+        :param category: the desired :class:`Category` of the results
+        :param page: the 1-based page to return the result
+        :param sort_key: the :class:`SearchSortKey` of the results list
+        :param order_key: the :class:`SearchOrderkey` of the results list
+        :returns: a `(total_pages, torrent_stubs)` tuple, where
+            `torrent_stubs` is an iterator of :class:`TorrentStub` objects
+        """
+        params = _search_params(terms, category, page, sort_key, order_key)
+        with start_timer(self.hooks, 'search', params) as timer:
+            content = self._fetch_page_content(params, timer)
+            total_pages = self._extract_total_pages(content)
+        return total_pages, self._iter_torrent_stubs(content)
+
+    def search_rss(self, terms, category=Category.all_categories,
+                   sort_key=SearchSortKey.date,
+                   order_key=SearchOrderKey.descending):
+        """Iterate over the torrents that match the given search term, read
+        from the RSS feed of the search instead of the search page.
+
+        The feed is much smaller than the search page, and is parsed while it
+        is downloaded, one torrent at a time. It is not paginated, and it is
+        not cached. The request is only sent once the iteration starts.
+
+        :param terms: the `str` needle
+        :param category: the desired :class:`Category` of the results
+        :param sort_key: the :class:`SearchSortKey` of the results list
+        :param order_key: the :class:`SearchOrderkey` of the results list
+        :returns: a generator of :class:`TorrentStub` objects
+        """
+        # imported here since the rss module depends on this one
+        from .rss import iter_torrent_stubs
+
+        params = _rss_params(terms, category, sort_key, order_key)
+        with start_timer(self.hooks, 'rss', params) as timer:
+            r = self._get(params, stream=True)
+            timer.responded(r)
+            try:
+                r.raw.decode_content = True
+                for stub in iter_torrent_stubs(r.raw, category):
+                    yield stub
+                timer.fetched(r, r.raw.tell())
+            finally:
+                r.close()
+
+    def iter_search(self, terms, category=Category.all_categories,
+                    sort_key=SearchSortKey.date,
+                    order_key=SearchOrderKey.descending, max_pages=None,
+                    workers=4, ordered=True):
+        """Iterate over the torrents on every page of a search.
+
+        The first page is fetched to learn the total number of pages, then
+        the remaining pages are fetched concurrently by `workers` threads.
+        Only about `workers` pages are fetched ahead of the consumer, and no
+        more requests are sent once the iteration is stopped, so it is cheap
+        to take only the first few results.
+
+        :param terms: the `str` needle
+        :param category: the desired :class:`Category` of the results
+        :param sort_key: the :class:`SearchSortKey` of the results list
+        :param order_key: the :class:`SearchOrderkey` of the results list
+        :param max_pages: the maximum number of pages to fetch, or `None` for
+            all of them
+        :param workers: the number of pages fetched concurrently
+        :param ordered: if `True`, yield the torrents in page order;
+            otherwise yield the torrents of each page as soon as it arrives
+        :returns: a generator of :class:`TorrentStub` objects
+        """
+        first_page = self.search(terms, category, 1, sort_key, order_key)
+        for stub in first_page.torrent_stubs:
+            yield stub
+
+        last_page = first_page.total_pages
+        if max_pages is not None:
+            last_page = min(last_page, max_pages)
+
+        def search_page(page):
+            return self.search(terms, category, page, sort_key, order_key)
+
+        pages = iter_completed(
+            search_page, range(2, last_page + 1), workers, ordered=ordered)
+        try:
+            for _, future in pages:
+                for stub in future.result().torrent_stubs:
+                    yield stub
+        finally:
+            pages.close()
+
+
+def _view_params(torrent_id):
+    """Return the URL query parameters of the detail page of a torrent."""
+    return {
+        'page': 'view',
+        'tid': torrent_id,
+    }
+
+
+def _download_params(torrent_id):
+    """Return the URL query parameters of the `.torrent` download of a
+    torrent.
+    """
+    return {
+        'page': 'download',
+        'tid': torrent_id,
+    }
+
+
+def _search_params(terms, category, page, sort_key, order_key):
+    """Return the URL query parameters of a search page."""
+    return {
+        'page': 'search',
+        'term': terms,
+        'cats': category.value,
+        'sort': sort_key.value,
+        'order': order_key.value,
+        'offset': page,
+    }
+
+
+def _params_key(params):
+    """Return a hashable key identifying the URL query parameters of a
+    page, whatever the types of their values.
+    """
+    return tuple(sorted((name, str(value)) for name, value in params.items()))
+
+
+def _rss_params(terms, category, sort_key, order_key):
+    """Return the URL query parameters of the RSS feed of a search."""
+    return {
+        'page': 'rss',
+        'term': terms,
+        'cats': category.value,
+        'sort': sort_key.value,
+        'order': order_key.value,
+    }
+
+
+def _cap_timeout(timeout, limit):
+    """Return a request `timeout`, a number of seconds, a `(connect, read)`
+    tuple or `None`, with every part at most `limit` seconds.
+    """
+    if isinstance(timeout, tuple):
+        return tuple(_cap_timeout(part, limit) for part in timeout)
+    if timeout is None:
+        return limit
+    return min(timeout, limit)
+
+
+def _check_fields(fields):
+    """Return the `fields` of a :class:`TorrentPage` to extract as a
+    `frozenset`, or :data:`TORRENT_PAGE_FIELDS` for `None`.
+
+    :raises ValueError: if a field is unknown
+    """
+    if fields is None or fields is TORRENT_PAGE_FIELDS:
+        return TORRENT_PAGE_FIELDS
+    fields = frozenset(fields)
+    unknown = fields.difference(TORRENT_PAGE_FIELDS)
+    if unknown:
+        raise ValueError("Unknown fields: {0}".format(
+            ', '.join(sorted(unknown))))
+    if len(fields) == len(TORRENT_PAGE_FIELDS):
+        return TORRENT_PAGE_FIELDS
+    return fields
+
+
+def _check_torrent_content_type(headers):
+    """Raise if the headers of a download response do not describe a
+    `.torrent` file, which is how Nyaa reports unknown torrents.
+
+    :param headers: the case-insensitive `dict` of response headers
+    :raises TorrentNotFoundError: if the content type is not
+        `application/x-bittorrent`
+    """
+    if headers.get('content-type') != 'application/x-bittorrent':
+        raise TorrentNotFoundError(TORRENT_NOT_FOUND_TEXT)
+
+
+def _write_chunks(torrent_id, chunks, dest):
+    """Write the chunks of a `.torrent` file to `dest`, a path or a writable
+    binary file object. A path is only replaced once every chunk was
+    written.
+
+    :returns: a :class:`Torrent` without `data`
+    """
+    if hasattr(dest, 'write'):
+        for chunk in chunks:
+            dest.write(chunk)
+        return Torrent(torrent_id, None, path=getattr(dest, 'name', None))
+    # imported here, since only downloads to a path need it
+    from .store import open_atomically
+    with open_atomically(dest) as f:
+        for chunk in chunks:
+            f.write(chunk)
+    return Torrent(torrent_id, None, path=dest)
 
 
 def extract_url_query_parameter(url, parameter):
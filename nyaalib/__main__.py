@@ -0,0 +1,6 @@
+"""Run the command line interface with `python -m nyaalib`."""
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,155 @@
+"""An asyncio Nyaa client built on `httpx`.
+
+This module requires Python 3.7+ and the optional `httpx` dependency, so it
+is not imported by :mod:`nyaalib` itself.
+"""
+import asyncio
+
+import httpx
+
+from . import (
+    BaseNyaaClient, _check_torrent_content_type, _download_params,
+    _search_params, _view_params,
+)
+from .models import Category, SearchOrderKey, SearchSortKey, Torrent
+from .schema import NYAA_SCHEMA
+
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
+
+class AsyncNyaaClient(BaseNyaaClient):
+    """The asyncio Nyaa client.
+
+    All requests share one :class:`httpx.AsyncClient` connection pool, and
+    at most `max_concurrency` of them are in flight at once. Parsing the HTML
+    of a page is CPU-bound, so by default it is run in an executor instead of
+    on the event loop.
+
+    Use it as an asynchronous context manager, or call :meth:`aclose` when
+    done::
+
+        async with AsyncNyaaClient() as client:
+            page = await client.view_torrent('486766')
+    """
+
+    def __init__(self, url='http://www.nyaa.se', client=None,
+                 max_concurrency=10, max_keepalive_connections=None,
+                 timeout=DEFAULT_TIMEOUT, parser='html5lib',
+                 offload_parsing=True, parse_executor=None,
+                 schema=NYAA_SCHEMA):
+        """
+        :param url: the base URL of the Nyaa or Nyaa-like torrent tracker
+        :param client: an optional :class:`httpx.AsyncClient` to send the
+            requests with. It is not closed by :meth:`aclose`.
+        :param max_concurrency: the maximum number of requests in flight,
+            which is also the size of the connection pool
+        :param max_keepalive_connections: the number of idle connections to
+            keep alive, defaulting to `max_concurrency`
+        :param timeout: the default timeout of each request, as accepted by
+            :class:`httpx.AsyncClient`
+        :param parser: the HTML parser backend, either a name or a
+            :class:`nyaalib.parsers.ParserBackend`
+        :param offload_parsing: if `True`, parse pages with
+            :meth:`asyncio.loop.run_in_executor` so that the event loop is not
+            blocked
+        :param parse_executor: the :class:`concurrent.futures.Executor` used
+            when `offload_parsing` is set, or `None` for the loop's default
+            executor
+        :param schema: the :class:`nyaalib.schema.SiteSchema` describing the
+            layout of the pages of the site
+        """
+        super(AsyncNyaaClient, self).__init__(url, parser, schema)
+        self.max_concurrency = max_concurrency
+        self.offload_parsing = offload_parsing
+        self.parse_executor = parse_executor
+        self._owns_client = client is None
+        if client is None:
+            if max_keepalive_connections is None:
+                max_keepalive_connections = max_concurrency
+            client = httpx.AsyncClient(
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=max_concurrency,
+                    max_keepalive_connections=max_keepalive_connections))
+        self.client = client
+        # created lazily so that it belongs to the running event loop
+        self._semaphore = None
+
+    async def aclose(self):
+        """Close the connection pool, unless the client was injected."""
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def _get(self, params):
+        """Send a `GET` request for the base URL with the given `params`,
+        waiting for a free concurrency slot first.
+
+        :param params: a `dict` of URL query parameters
+        :returns: the :class:`httpx.Response`, with its body read
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            return await self.client.get(self.base_url, params=params)
+
+    async def _run_parser(self, function, *args):
+        if not self.offload_parsing:
+            return function(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.parse_executor, function, *args)
+
+    def _parse_torrent_page(self, torrent_id, response):
+        content = self._get_page_content(response)
+        return self._extract_torrent_page(torrent_id, content)
+
+    def _parse_search_result_page(self, response, *search_args):
+        content = self._get_page_content(response)
+        return self._extract_search_result_page(content, *search_args)
+
+    async def view_torrent(self, torrent_id):
+        """Retrieves and parses the torrent page for a given `torrent_id`.
+
+        :param torrent_id: the ID of the torrent to view
+        :raises TorrentNotFoundError: if the torrent does not exist
+        :returns: a :class:`TorrentPage` with a snapshot view of the torrent
+            detail page
+        """
+        r = await self._get(_view_params(torrent_id))
+        return await self._run_parser(
+            self._parse_torrent_page, torrent_id, r)
+
+    async def get_torrent(self, torrent_id):
+        """Gets the `.torrent` data for the given `torrent_id`.
+
+        :param torrent_id: the ID of the torrent to download
+        :raises TorrentNotFoundError: if the torrent does not exist
+        :returns: :class:`Torrent` of the associated torrent
+        """
+        r = await self._get(_download_params(torrent_id))
+        _check_torrent_content_type(r.headers)
+        return Torrent(torrent_id, r.content)
+
+    async def search(self, terms, category=Category.all_categories, page=1,
+                     sort_key=SearchSortKey.date,
+                     order_key=SearchOrderKey.descending):
+        """Get a list of torrents that match the given search term
+
+        :param terms: the `str` needle
+        :param category: the desired :class:`Category` of the results
+        :param page: the 1-based page to return the result
+        :param sort_key: the :class:`SearchSortKey` of the results list
+        :param order_key: the :class:`SearchOrderkey` of the results list
+        :return: a :class:`SearchPage` of results
+        """
+        r = await self._get(_search_params(
+            terms, category, page, sort_key, order_key))
+        return await self._run_parser(
+            self._parse_search_result_page, r,
+            terms, category, page, sort_key, order_key)
@@ -0,0 +1,340 @@
+"""Reading bencoded `.torrent` data without copying it.
+
+The data can be `bytes`, a `bytearray`, an :class:`mmap.mmap` of a file on
+disk, or a :class:`memoryview` of any of them.
+
+:func:`decode` returns lazy containers: a :class:`BencodeDict` or
+:class:`BencodeList` only finds the offsets of its items when it is first
+used, and only decodes an item when that item is accessed. Strings are
+returned as :class:`memoryview` slices of the data, so large values such as
+`pieces` are never copied. On Python 2, where only the items of a
+`bytearray` are `int` objects, other data is copied into a `bytearray`
+first.
+"""
+import hashlib
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    # Python 2
+    from collections import Mapping, Sequence
+
+_DICT = ord('d')
+_LIST = ord('l')
+_INT = ord('i')
+_END = ord('e')
+_ZERO = ord('0')
+_NINE = ord('9')
+
+_PY2 = bytes is str
+
+
+class BencodeError(ValueError):
+    """Raised when data is not valid bencode."""
+
+
+class _Document(object):
+    """The bencoded data shared by the lazy containers decoded from it.
+
+    `ends` maps the offset of every container scanned so far to the offset
+    just past it, so each container is only walked once no matter how many
+    times its parents are scanned.
+    """
+    __slots__ = ('data', 'buf', 'ends')
+
+    def __init__(self, data):
+        if isinstance(data, memoryview):
+            # the underlying object is used for its fast `find`, unless the
+            # view only covers part of it
+            if _PY2:
+                data = data.tobytes()
+            elif data.obj is not None and data.nbytes == len(data.obj):
+                data = data.obj
+            else:
+                data = data.tobytes()
+        if _PY2 and not isinstance(data, bytearray):
+            # indexing `str` or `mmap.mmap` data returns characters
+            data = bytearray(data[:])
+        self.data = data
+        self.buf = memoryview(data)
+        self.ends = {}
+
+    def skip(self, i):
+        """Return the offset just past the value starting at `i`."""
+        data = self.data
+        size = len(data)
+        find = data.find
+        ends = self.ends
+        starts = []
+        # whether the next value of the innermost container is a dictionary
+        # key (`True`) or value (`False`), or `None` in a list; the states of
+        # the outer containers are kept in `states`
+        state = None
+        states = []
+        try:
+            while True:
+                c = data[i]
+                if c == _END:
+                    if not starts:
+                        raise BencodeError("Unexpected end at {0}".format(i))
+                    if state is False:
+                        raise BencodeError(
+                            "Missing dictionary value at {0}".format(i))
+                    i += 1
+                    ends[starts.pop()] = i
+                    state = states.pop()
+                    if not starts:
+                        return i
+                    continue
+                if state is not None:
+                    if state and not _ZERO <= c <= _NINE:
+                        raise BencodeError(
+                            "Dictionary key at {0} is not a string".format(i))
+                    state = not state
+                if c == _DICT or c == _LIST:
+                    end = ends.get(i)
+                    if end is None:
+                        starts.append(i)
+                        states.append(state)
+                        state = True if c == _DICT else None
+                        i += 1
+                        continue
+                    i = end
+                elif c == _INT:
+                    end = find(b'e', i)
+                    if end < 0:
+                        raise BencodeError(
+                            "Unterminated integer at {0}".format(i))
+                    i = end + 1
+                else:
+                    # inlined `string_span`, since strings are the most
+                    # common values
+                    colon = find(b':', i, i + 21)
+                    length = -1
+                    if colon > i:
+                        try:
+                            length = int(data[i:colon])
+                        except ValueError:
+                            pass
+                    if length < 0:
+                        raise BencodeError(
+                            "Invalid string length at {0}".format(i))
+                    end = colon + 1 + length
+                    if end > size:
+                        raise BencodeError(
+                            "String at {0} overruns the data".format(i))
+                    i = end
+                if not starts:
+                    return i
+        except IndexError:
+            # a container is not closed before the end of the data
+            raise BencodeError("Unexpected end of data")
+
+    def string_span(self, i):
+        """Return the `(start, end)` offsets of the contents of the string
+        starting at `i`.
+        """
+        data = self.data
+        colon = data.find(b':', i, i + 21)
+        length = -1
+        if colon > i:
+            try:
+                length = int(data[i:colon])
+            except ValueError:
+                pass
+        if length < 0:
+            raise BencodeError("Invalid string length at {0}".format(i))
+        end = colon + 1 + length
+        if end > len(data):
+            raise BencodeError("String at {0} overruns the data".format(i))
+        return colon + 1, end
+
+    def decode_at(self, i):
+        """Decode the value starting at `i`, lazily for containers."""
+        data = self.data
+        c = data[i]
+        if c == _DICT:
+            return BencodeDict(self, i)
+        if c == _LIST:
+            return BencodeList(self, i)
+        if c == _INT:
+            try:
+                return int(data[i + 1:data.find(b'e', i)])
+            except ValueError:
+                raise BencodeError("Invalid integer at {0}".format(i))
+        start, end = self.string_span(i)
+        return self.buf[start:end]
+
+
+def _parse(data):
+    document = _Document(data)
+    end = document.skip(0)
+    if end != len(document.data):
+        raise BencodeError("Trailing data at {0}".format(end))
+    return document
+
+
+def decode(data):
+    """Decode bencoded data.
+
+    The whole data is scanned once to validate its structure; nested values
+    are only decoded when they are accessed.
+
+    :param data: the bencoded data
+    :raises BencodeError: if the data is not valid bencode
+    :returns: an `int`, a :class:`memoryview` of a string, a
+        :class:`BencodeList` or a :class:`BencodeDict`
+    """
+    return _parse(data).decode_at(0)
+
+
+class _Offset(int):
+    """The offset of a value that has not been decoded yet."""
+    __slots__ = ()
+
+
+class _BencodeContainer(object):
+    __slots__ = ('_document', '_start', '_items')
+
+    def __init__(self, document, start):
+        self._document = document
+        self._start = start
+        self._items = None
+
+    @property
+    def raw(self):
+        """A :class:`memoryview` of the bencoded bytes of the container."""
+        document = self._document
+        return document.buf[self._start:document.skip(self._start)]
+
+
+class BencodeList(_BencodeContainer, Sequence):
+    """A lazily decoded bencoded list."""
+    __slots__ = ()
+
+    def _get_items(self):
+        # the offsets of the items, replaced by the decoded values as they
+        # are accessed
+        if self._items is None:
+            document = self._document
+            data = document.data
+            items = []
+            i = self._start + 1
+            while data[i] != _END:
+                items.append(_Offset(i))
+                i = document.skip(i)
+            self._items = items
+        return self._items
+
+    def __len__(self):
+        return len(self._get_items())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        items = self._get_items()
+        item = items[index]
+        if type(item) is _Offset:
+            item = items[index] = self._document.decode_at(item)
+        return item
+
+    def __repr__(self):
+        return "<BencodeList of {0} items>".format(len(self))
+
+
+class BencodeDict(_BencodeContainer, Mapping):
+    """A lazily decoded bencoded dictionary with `bytes` keys."""
+    __slots__ = ()
+
+    def _get_items(self):
+        # maps the keys to the offsets of their values, replaced by the
+        # decoded values as they are accessed
+        if self._items is None:
+            document = self._document
+            data = document.data
+            items = {}
+            i = self._start + 1
+            while data[i] != _END:
+                key_start, key_end = document.string_span(i)
+                items[bytes(data[key_start:key_end])] = _Offset(key_end)
+                i = document.skip(key_end)
+            self._items = items
+        return self._items
+
+    def __len__(self):
+        return len(self._get_items())
+
+    def __iter__(self):
+        return iter(self._get_items())
+
+    def __contains__(self, key):
+        return key in self._get_items()
+
+    def __getitem__(self, key):
+        items = self._items
+        if items is None:
+            # look up a single key without indexing the whole dictionary,
+            # which is much cheaper for the many small dictionaries of
+            # `info.files`
+            return self._document.decode_at(self._find(key))
+        item = items[key]
+        if type(item) is _Offset:
+            item = items[key] = self._document.decode_at(item)
+        return item
+
+    def _find(self, key):
+        document = self._document
+        data = document.data
+        i = self._start + 1
+        while data[i] != _END:
+            key_start, key_end = document.string_span(i)
+            if data[key_start:key_end] == key:
+                return key_end
+            i = document.skip(key_end)
+        raise KeyError(key)
+
+    def __repr__(self):
+        return "<BencodeDict keys={0}>".format(sorted(self))
+
+
+def _info_dict(metainfo):
+    if not isinstance(metainfo, BencodeDict):
+        raise BencodeError("The metainfo is not a dictionary")
+    info = metainfo.get(b'info')
+    if not isinstance(info, BencodeDict):
+        raise BencodeError("The metainfo has no info dictionary")
+    return info
+
+
+def info_span(data):
+    """Find the bencoded `info` dictionary of a `.torrent` file.
+
+    :param data: the bencoded metainfo
+    :raises BencodeError: if there is no `info` dictionary
+    :returns: a `(start, end)` tuple of the byte range of the `info`
+        dictionary
+    """
+    info = _info_dict(decode(data))
+    return info._start, info._document.skip(info._start)
+
+
+def infohash(data):
+    """Return the hex SHA-1 infohash of a `.torrent` file.
+
+    The raw bytes of the `info` dictionary are hashed as they are, without
+    being decoded and re-encoded.
+
+    :param data: the bencoded metainfo
+    :returns: the `str` infohash
+    """
+    return metainfo_infohash(decode(data))
+
+
+def metainfo_infohash(metainfo):
+    """Return the hex SHA-1 infohash of metainfo already decoded by
+    :func:`decode`.
+
+    :param metainfo: the :class:`BencodeDict` of the metainfo
+    :raises BencodeError: if there is no `info` dictionary
+    :returns: the `str` infohash
+    """
+    return hashlib.sha1(_info_dict(metainfo).raw).hexdigest()
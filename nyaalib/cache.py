@@ -0,0 +1,345 @@
+"""Caches of the pages retrieved by :class:`nyaalib.NyaaClient`.
+
+A :class:`ResponseCache` keeps the parts of a torrent page that never change
+(its name, submitter, description, etc.) for much longer than the swarm
+statistics (seeders, leechers and downloads), which go stale quickly. It is
+backed by an in-memory :class:`LRUCache` and, optionally, a persistent
+:class:`DiskCache`.
+"""
+import collections
+import pickle
+import sqlite3
+import threading
+import time
+
+from .models import TorrentPage
+
+# the cache needs a sentinel because `None` is a valid cached value
+_MISSING = object()
+
+
+class CacheStats(object):
+    """Hit, miss and eviction counters of a cache."""
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def as_dict(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def __repr__(self):
+        return "<CacheStats hits={0} misses={1} evictions={2}>".format(
+            self.hits, self.misses, self.evictions)
+
+
+class LRUCache(object):
+    """A thread-safe in-memory cache that evicts the least recently used
+    entry once it holds `maxsize` entries. Each entry may expire.
+    """
+    def __init__(self, maxsize=1024):
+        """
+        :param maxsize: the maximum `int` number of entries
+        """
+        self.maxsize = maxsize
+        self.stats = CacheStats()
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the unexpired value cached for `key`, or `default`."""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires, value = entry
+                if expires is None or expires > time.time():
+                    self._move_to_end(key)
+                    self.stats.hits += 1
+                    return value
+                del self._entries[key]
+            self.stats.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Cache `value` for `key`.
+
+        :param ttl: the number of seconds the value is valid, or `None` to
+            keep it until it is evicted
+        """
+        expires = None if ttl is None else time.time() + ttl
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _move_to_end(self, key):
+        # OrderedDict.move_to_end is not available on Python 2
+        self._entries[key] = self._entries.pop(key)
+
+
+class DiskCache(object):
+    """A thread-safe persistent cache of pickled values in a SQLite database.
+
+    Entries past their expiry are ignored, and removed by :meth:`purge`.
+    """
+    def __init__(self, path):
+        """
+        :param path: the path of the SQLite database file
+        """
+        self.path = path
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, expires REAL, value BLOB)')
+
+    def get(self, key, default=None):
+        """Return the unexpired value cached for `key`, or `default`."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT expires, value FROM cache WHERE key = ?',
+                (key,)).fetchone()
+            if row is not None and (row[0] is None or row[0] > time.time()):
+                self.stats.hits += 1
+                return pickle.loads(bytes(row[1]))
+            self.stats.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Cache `value` for `key`.
+
+        :param ttl: the number of seconds the value is valid, or `None` to
+            keep it forever
+        """
+        expires = None if ttl is None else time.time() + ttl
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO cache (key, expires, value) '
+                'VALUES (?, ?, ?)', (key, expires, sqlite3.Binary(data)))
+
+    def set_many(self, items, ttl=None):
+        """Cache the values of many `(key, value)` pairs in one transaction.
+
+        :param ttl: the number of seconds the values are valid, or `None` to
+            keep them forever
+        """
+        expires = None if ttl is None else time.time() + ttl
+        rows = [(key, expires, sqlite3.Binary(
+                    pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+                for key, value in items]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, expires, value) '
+                'VALUES (?, ?, ?)', rows)
+
+    def delete(self, key):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def purge(self):
+        """Delete the expired entries.
+
+        :returns: the `int` number of deleted entries
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                'DELETE FROM cache WHERE expires <= ?', (time.time(),))
+            self.stats.evictions += cursor.rowcount
+            return cursor.rowcount
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM cache')
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                'SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+class ResponseCache(object):
+    """The cache used by :class:`nyaalib.NyaaClient` for torrent pages and
+    search results.
+
+    Torrent metadata is cached for `metadata_ttl` seconds, but a torrent page
+    is only served from the cache while its swarm statistics are younger than
+    `stats_ttl` seconds. The statistics are also refreshed by every search
+    result that lists the torrent. Once they are stale, the client only
+    extracts the statistics from the page it retrieves again, and takes the
+    rest from the cached metadata.
+
+    Values are looked up in memory first, then on disk; disk hits are copied
+    back into memory, and keep their expiry.
+    """
+    def __init__(self, maxsize=1024, path=None, metadata_ttl=7 * 24 * 3600,
+                 stats_ttl=300, search_ttl=300):
+        """
+        :param maxsize: the maximum number of entries kept in memory
+        :param path: the path of an optional SQLite file to persist the
+            cache to
+        :param metadata_ttl: the number of seconds torrent metadata is valid
+        :param stats_ttl: the number of seconds seeders, leechers and
+            downloads are valid
+        :param search_ttl: the number of seconds search results are valid
+        """
+        self.memory = LRUCache(maxsize)
+        self.disk = DiskCache(path) if path is not None else None
+        self.metadata_ttl = metadata_ttl
+        self.stats_ttl = stats_ttl
+        self.search_ttl = search_ttl
+
+    def _get(self, key):
+        value = self.memory.get(key, _MISSING)
+        if value is _MISSING and self.disk is not None:
+            value, expires = self.disk.get(key, (_MISSING, None))
+            if value is not _MISSING:
+                ttl = None if expires is None else expires - time.time()
+                self.memory.set(key, value, ttl)
+        if value is _MISSING:
+            return None
+        return value
+
+    def _set(self, key, value, ttl):
+        self._set_many([(key, value)], ttl)
+
+    def _set_many(self, items, ttl):
+        for key, value in items:
+            self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            # the expiry is stored along with the value so that the value
+            # expires at the same time once promoted back into memory
+            expires = None if ttl is None else time.time() + ttl
+            self.disk.set_many(
+                ((key, (value, expires)) for key, value in items), ttl)
+
+    def get_torrent_page(self, torrent_id):
+        """Return the cached :class:`TorrentPage` of a torrent, or `None` if
+        its metadata or swarm statistics are missing or stale.
+        """
+        swarm_stats = self.get_swarm_stats(torrent_id)
+        if swarm_stats is None:
+            return None
+        metadata = self.get_torrent_metadata(torrent_id)
+        if metadata is None:
+            return None
+        return with_swarm_stats(metadata, swarm_stats)
+
+    def get_torrent_metadata(self, torrent_id):
+        """Return the cached :class:`TorrentPage` of a torrent without its
+        swarm statistics, or `None` if it is missing or stale.
+        """
+        return self._get(_metadata_key(torrent_id))
+
+    def get_swarm_stats(self, torrent_id):
+        """Return the cached `(seeders, leechers, downloads)` of a torrent,
+        or `None` if they are missing or stale.
+        """
+        return self._get(_swarm_stats_key(torrent_id))
+
+    def set_torrent_page(self, torrent_page):
+        """Cache the metadata and the swarm statistics of a
+        :class:`TorrentPage`.
+        """
+        self._set(_metadata_key(torrent_page.tid),
+                  with_swarm_stats(torrent_page, (None, None, None)),
+                  self.metadata_ttl)
+        self.set_swarm_stats(torrent_page.tid, torrent_page.seeders,
+                             torrent_page.leechers, torrent_page.downloads)
+
+    def set_swarm_stats(self, torrent_id, seeders, leechers, downloads):
+        """Cache the current swarm statistics of a torrent."""
+        self._set(_swarm_stats_key(torrent_id),
+                  (seeders, leechers, downloads), self.stats_ttl)
+
+    def get_search_result_page(self, terms, category, page, sort_key,
+                               order_key):
+        """Return the cached :class:`SearchResultPage`, or `None`."""
+        return self._get(
+            _search_key(terms, category, page, sort_key, order_key))
+
+    def set_search_result_page(self, search_result_page):
+        """Cache a :class:`SearchResultPage`, and the swarm statistics of the
+        torrents it lists.
+        """
+        p = search_result_page
+        self._set(_search_key(p.terms, p.category, p.page, p.sort_key,
+                              p.order_key),
+                  search_result_page, self.search_ttl)
+        self._set_many(
+            [(_swarm_stats_key(stub.tid),
+              (stub.seeders, stub.leechers, stub.downloads))
+             for stub in search_result_page.torrent_stubs],
+            self.stats_ttl)
+
+    def stats(self):
+        """Return the counters of each tier, to help tune their sizes.
+
+        :returns: a `dict` mapping `'memory'` (and `'disk'`, if enabled) to a
+            `dict` of `hits`, `misses`, `evictions` and `size`
+        """
+        tiers = {'memory': self.memory}
+        if self.disk is not None:
+            tiers['disk'] = self.disk
+        stats = {}
+        for name, tier in tiers.items():
+            stats[name] = tier.stats.as_dict()
+            stats[name]['size'] = len(tier)
+        return stats
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+def with_swarm_stats(torrent_page, swarm_stats):
+    """Return a copy of a :class:`TorrentPage` with other swarm statistics.
+
+    The deferred attributes of `torrent_page` are extracted, so the copy
+    does not hold on to the parsed page.
+
+    :param swarm_stats: a `(seeders, leechers, downloads)` tuple
+    """
+    seeders, leechers, downloads = swarm_stats
+    return TorrentPage(
+        torrent_page.tid, torrent_page.name, torrent_page.submitter,
+        torrent_page.category, torrent_page.tracker,
+        torrent_page.date_created, seeders, leechers, downloads,
+        torrent_page.file_size, torrent_page.description, torrent_page.size)
+
+
+def _metadata_key(torrent_id):
+    return u'view:metadata:{0}'.format(torrent_id)
+
+
+def _swarm_stats_key(torrent_id):
+    return u'view:stats:{0}'.format(torrent_id)
+
+
+def _search_key(terms, category, page, sort_key, order_key):
+    return u'search:{0}:{1}:{2}:{3}:{4}'.format(
+        category.value, page, sort_key.value, order_key.value, terms)
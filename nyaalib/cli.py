@@ -0,0 +1,303 @@
+"""The `nyaalib` command line interface.
+
+Every command writes its results to the standard output as JSON Lines: one
+JSON object per :class:`TorrentStub`, :class:`TorrentPage` or downloaded
+torrent, written and flushed as soon as it is ready, so the output can be
+piped into other commands while a long search is still running::
+
+    nyaalib search 'love live' --pages 3 | jq -r .name
+    nyaalib view 486766 --fields seeders,leechers,downloads
+    nyaalib download 486766 --output-dir torrents
+    nyaalib crawl --category anime --processes 4 > anime.jsonl
+
+The torrents that cannot be viewed or downloaded are reported on the
+standard error, and make the exit status 1.
+"""
+import argparse
+import datetime
+import enum
+import errno
+import json
+import os
+import sys
+
+from . import TorrentPageFailure
+from .models import (
+    Category, SearchOrderKey, SearchSortKey, TORRENT_PAGE_FIELDS,
+    TorrentStub, User,
+)
+
+DEFAULT_URL = 'http://www.nyaa.se'
+
+
+def _json_default(value):
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    if isinstance(value, User):
+        return {'uid': value.uid, 'name': value.name}
+    raise TypeError("{0!r} is not JSON serializable".format(value))
+
+
+def torrent_stub_record(torrent_stub):
+    """Return the JSON-serializable `dict` of a :class:`TorrentStub`."""
+    return dict((name, getattr(torrent_stub, name))
+                for name in TorrentStub.__slots__)
+
+
+def torrent_page_record(torrent_page, fields=TORRENT_PAGE_FIELDS):
+    """Return the JSON-serializable `dict` of the `tid` and `fields` of a
+    :class:`TorrentPage`.
+    """
+    record = dict((name, getattr(torrent_page, name)) for name in fields)
+    record['tid'] = torrent_page.tid
+    return record
+
+
+def write_records(records, stream):
+    """Write `dict` objects to `stream` as JSON Lines, flushing after each
+    line.
+
+    :returns: the `int` number of records written
+    """
+    count = 0
+    for record in records:
+        stream.write(json.dumps(record, default=_json_default,
+                                sort_keys=True) + '\n')
+        stream.flush()
+        count += 1
+    return count
+
+
+def _report_failure(torrent_id, error):
+    sys.stderr.write('nyaalib: {0}: {1}\n'.format(torrent_id, error))
+
+
+def _category(text):
+    """Parse a :class:`Category` from its name (eg: `anime`) or its Nyaa
+    value (eg: `1_37`).
+    """
+    try:
+        return Category[text]
+    except KeyError:
+        category = Category.lookup_category(text)
+        if category is None:
+            raise argparse.ArgumentTypeError(
+                'unknown category: {0}'.format(text))
+        return category
+
+
+def _enum_type(enum_class):
+    """Return an argument type parsing the members of `enum_class` by
+    name.
+    """
+    def parse(name):
+        try:
+            return enum_class[name]
+        except KeyError:
+            raise argparse.ArgumentTypeError('invalid choice: {0}'.format(
+                name))
+    return parse
+
+
+def _fields(text):
+    fields = frozenset(field.strip() for field in text.split(',')
+                       if field.strip())
+    unknown = fields.difference(TORRENT_PAGE_FIELDS)
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            'unknown fields: {0}'.format(', '.join(sorted(unknown))))
+    return fields
+
+
+def _make_client(args):
+    from . import NyaaClient
+    return NyaaClient(args.url, parser=args.parser, timeout=args.timeout,
+                      pool_maxsize=max(args.workers, 1))
+
+
+def search_command(args, stream):
+    client = _make_client(args)
+    if args.rss:
+        torrent_stubs = client.search_rss(
+            args.terms, args.category, args.sort, args.order)
+    else:
+        torrent_stubs = client.iter_search(
+            args.terms, args.category, args.sort, args.order,
+            max_pages=args.pages or None, workers=args.workers)
+    write_records(
+        (torrent_stub_record(stub) for stub in torrent_stubs), stream)
+    return 0
+
+
+def view_command(args, stream):
+    client = _make_client(args)
+    fields = args.fields or TORRENT_PAGE_FIELDS
+    failures = [0]
+
+    def records():
+        for result in client.view_torrents(
+                args.torrent_ids, workers=args.workers, ordered=True,
+                fields=fields):
+            if isinstance(result, TorrentPageFailure):
+                _report_failure(result.tid, result.error)
+                failures[0] += 1
+            else:
+                yield torrent_page_record(result, fields)
+
+    write_records(records(), stream)
+    return 1 if failures[0] else 0
+
+
+def download_command(args, stream):
+    from . import TorrentNotFoundError
+    import requests
+
+    client = _make_client(args)
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    failures = [0]
+
+    def records():
+        for torrent_id in args.torrent_ids:
+            path = os.path.join(args.output_dir,
+                                '{0}.torrent'.format(torrent_id))
+            try:
+                # the file is only renamed into place once fully written
+                torrent = client.get_torrent(torrent_id, dest=path)
+                size = os.path.getsize(torrent.path)
+            except (TorrentNotFoundError, requests.RequestException,
+                    EnvironmentError) as e:
+                _report_failure(torrent_id, e)
+                failures[0] += 1
+                continue
+            yield {'tid': torrent_id, 'path': torrent.path, 'size': size}
+
+    write_records(records(), stream)
+    return 1 if failures[0] else 0
+
+
+def crawl_command(args, stream):
+    client = _make_client(args)
+    if not args.processes:
+        torrent_stubs = client.iter_search(
+            args.terms, args.category, args.sort, args.order,
+            max_pages=args.max_pages, workers=args.workers)
+        write_records(
+            (torrent_stub_record(stub) for stub in torrent_stubs), stream)
+        return 0
+
+    from .pipeline import ParsePipeline
+    with ParsePipeline(client, fetch_workers=args.workers,
+                       parse_workers=args.processes) as pipeline:
+        torrent_stubs = pipeline.iter_search(
+            args.terms, args.category, args.sort, args.order,
+            max_pages=args.max_pages)
+        write_records(
+            (torrent_stub_record(stub) for stub in torrent_stubs), stream)
+    return 0
+
+
+def _add_search_arguments(parser):
+    parser.add_argument('terms', nargs='?', default='',
+                        help='the search terms (default: every torrent)')
+    parser.add_argument('--category', type=_category,
+                        default=Category.all_categories,
+                        help='a category name (eg: anime) or value '
+                             '(eg: 1_37)')
+    for name, enum_class, default in (
+            ('--sort', SearchSortKey, SearchSortKey.date),
+            ('--order', SearchOrderKey, SearchOrderKey.descending)):
+        parser.add_argument(
+            name, type=_enum_type(enum_class), default=default,
+            metavar='{' + ','.join(key.name for key in enum_class) + '}',
+            help='(default: {0})'.format(default.name))
+
+
+def make_parser():
+    """Return the :class:`argparse.ArgumentParser` of the command line."""
+    parser = argparse.ArgumentParser(
+        prog='nyaalib', description='Search, view and download torrents '
+                                    'from Nyaa, writing JSON Lines.')
+    parser.add_argument('--url', default=DEFAULT_URL,
+                        help='the base URL of the site (default: %(default)s)')
+    parser.add_argument('--parser', default='html5lib',
+                        choices=('html5lib', 'lxml', 'streaming'),
+                        help='the HTML parser backend (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='the timeout of each request in seconds '
+                             '(default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='the number of concurrent requests '
+                             '(default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    search = commands.add_parser(
+        'search', help='write the torrents found by a search')
+    _add_search_arguments(search)
+    search.add_argument('--pages', type=int, default=1,
+                        help='the number of pages to read, or 0 for every '
+                             'page (default: %(default)s)')
+    search.add_argument('--rss', action='store_true',
+                        help='read the RSS feed of the search instead, '
+                             'which is smaller and not paginated')
+    search.set_defaults(function=search_command)
+
+    view = commands.add_parser('view', help='write the pages of torrents')
+    view.add_argument('torrent_ids', nargs='+', metavar='tid')
+    view.add_argument('--fields', type=_fields,
+                      help='the comma-separated fields to extract (default: '
+                           'all of them), eg: seeders,leechers,downloads')
+    view.set_defaults(function=view_command)
+
+    download = commands.add_parser(
+        'download', help='download the .torrent files of torrents')
+    download.add_argument('torrent_ids', nargs='+', metavar='tid')
+    download.add_argument('--output-dir', default='.',
+                          help='the directory the files are written to, as '
+                               '<tid>.torrent (default: the current one)')
+    download.set_defaults(function=download_command)
+
+    crawl = commands.add_parser(
+        'crawl', help='write the torrents on every page of a search')
+    _add_search_arguments(crawl)
+    crawl.add_argument('--max-pages', type=int,
+                       help='the maximum number of pages to read')
+    crawl.add_argument('--processes', type=int, default=0,
+                       help='parse the pages on this many processes '
+                            '(default: parse on the request threads)')
+    crawl.set_defaults(function=crawl_command)
+    return parser
+
+
+def main(argv=None, stream=None):
+    """Run the command line interface.
+
+    :param argv: the `list` of arguments, by default `sys.argv[1:]`
+    :param stream: the text file object the records are written to, by
+        default the standard output
+    :returns: the `int` exit status
+    """
+    args = make_parser().parse_args(argv)
+    if stream is None:
+        stream = sys.stdout
+    try:
+        return args.function(args, stream)
+    except KeyboardInterrupt:
+        return 130
+    except IOError as e:
+        # the reader of a pipe went away (eg: `nyaalib search | head`)
+        if e.errno != errno.EPIPE:
+            raise
+        # stop Python from failing to flush the standard output on exit
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
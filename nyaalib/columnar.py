@@ -0,0 +1,199 @@
+"""A compact, column-oriented collection of :class:`TorrentStub` data.
+
+Holding millions of :class:`TorrentStub` objects costs an object (plus its
+attribute values) per torrent. A :class:`TorrentStubTable` instead stores each
+numeric attribute in an :class:`array.array`, and sorts, filters and ranks
+rows by their indexes, so no per-row objects are created until a row is
+asked for.
+"""
+import array
+import heapq
+
+from .models import Category, TorrentStub
+
+# the value stored in the numeric columns for unknown values (eg: seeders and
+# leechers are sometimes unavailable)
+MISSING = -1
+
+_CATEGORIES = list(Category)
+_CATEGORY_INDEXES = dict(
+    (category, index) for index, category in enumerate(_CATEGORIES))
+
+_COLUMNS = {
+    'tid': 'tids',
+    'seeders': 'seeders',
+    'leechers': 'leechers',
+    'downloads': 'downloads',
+    'size': 'sizes',
+}
+
+
+def _int64_typecode():
+    # 'q' is only available since Python 3.3; before it, 'l' is used where it
+    # is 64-bit, and 'd' (exact up to 2 ** 53) where it is not
+    try:
+        array.array('q')
+        return 'q'
+    except ValueError:
+        return 'l' if array.array('l').itemsize >= 8 else 'd'
+
+
+# the typecode of the 64-bit numeric columns
+_INT64 = _int64_typecode()
+
+
+def _encode(value):
+    return MISSING if value is None else value
+
+
+def _decode(value):
+    # the values of a 'd' array are floats
+    return None if value == MISSING else int(value)
+
+
+class TorrentStubTable(object):
+    """A column-oriented collection of torrent stubs.
+
+    The numeric columns (`'tid'`, `'seeders'`, `'leechers'`, `'downloads'`
+    and `'size'`, in bytes) are 64-bit :class:`array.array` objects (of
+    floats on the rare Python 2 builds without a 64-bit integer array), with
+    unknown values stored as :data:`MISSING`. Indexing or iterating over the
+    table creates :class:`TorrentStub` objects on demand.
+    """
+    __slots__ = (
+        'tids', 'seeders', 'leechers', 'downloads', 'sizes', 'categories',
+        'names', 'file_sizes',
+    )
+
+    def __init__(self, torrent_stubs=()):
+        """
+        :param torrent_stubs: an iterable of :class:`TorrentStub` objects to
+            add to the table
+        """
+        self.tids = array.array(_INT64)
+        self.seeders = array.array(_INT64)
+        self.leechers = array.array(_INT64)
+        self.downloads = array.array(_INT64)
+        self.sizes = array.array(_INT64)
+        self.categories = array.array('b')
+        self.names = []
+        self.file_sizes = []
+        self.extend(torrent_stubs)
+
+    @classmethod
+    def from_search_result_pages(cls, search_result_pages):
+        """Build a table of the torrents of many :class:`SearchResultPage`
+        objects.
+        """
+        table = cls()
+        for search_result_page in search_result_pages:
+            table.extend(search_result_page.torrent_stubs)
+        return table
+
+    def append(self, torrent_stub):
+        """Add a :class:`TorrentStub` to the table."""
+        self.tids.append(int(torrent_stub.tid))
+        self.seeders.append(_encode(torrent_stub.seeders))
+        self.leechers.append(_encode(torrent_stub.leechers))
+        self.downloads.append(_encode(torrent_stub.downloads))
+        self.sizes.append(_encode(torrent_stub.size))
+        self.categories.append(
+            _CATEGORY_INDEXES.get(torrent_stub.category, MISSING))
+        self.names.append(torrent_stub.name)
+        self.file_sizes.append(torrent_stub.file_size)
+
+    def extend(self, torrent_stubs):
+        """Add many :class:`TorrentStub` objects to the table."""
+        for torrent_stub in torrent_stubs:
+            self.append(torrent_stub)
+
+    def __len__(self):
+        return len(self.tids)
+
+    def __getitem__(self, index):
+        """Return the row at `index` as a :class:`TorrentStub`."""
+        category_index = self.categories[index]
+        return TorrentStub(
+            str(int(self.tids[index])),
+            self.names[index],
+            _CATEGORIES[category_index] if category_index != MISSING
+            else None,
+            _decode(self.seeders[index]),
+            _decode(self.leechers[index]),
+            self.file_sizes[index],
+            _decode(self.downloads[index]),
+            _decode(self.sizes[index]))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def column(self, name):
+        """Return the :class:`array.array` of a numeric column.
+
+        :param name: one of `'tid'`, `'seeders'`, `'leechers'`, `'downloads'`
+            or `'size'`
+        :raises ValueError: if there is no such column
+        """
+        try:
+            return getattr(self, _COLUMNS[name])
+        except KeyError:
+            raise ValueError("Unknown column: {0}".format(name))
+
+    def argsort(self, column, reverse=False):
+        """Return the row indexes ordered by the values of a column.
+
+        Unknown values sort as :data:`MISSING`, ie: below every known value.
+
+        :param column: the name of a numeric column
+        :param reverse: if `True`, sort in descending order
+        :returns: a `list` of `int` row indexes
+        """
+        values = self.column(column)
+        return sorted(range(len(values)), key=values.__getitem__,
+                      reverse=reverse)
+
+    def where(self, column, minimum=None, maximum=None):
+        """Return the indexes of the rows whose value in a column is within
+        the given inclusive bounds. Rows with unknown values never match.
+
+        :param column: the name of a numeric column
+        :param minimum: the smallest accepted value, or `None`
+        :param maximum: the largest accepted value, or `None`
+        :returns: a `list` of `int` row indexes
+        """
+        values = self.column(column)
+        low = 0 if minimum is None else max(minimum, 0)
+        high = maximum
+        if high is None:
+            return [i for i, value in enumerate(values) if value >= low]
+        return [i for i, value in enumerate(values) if low <= value <= high]
+
+    def top_k(self, column, k):
+        """Return the indexes of the `k` rows with the largest values in a
+        column, largest first.
+
+        :param column: the name of a numeric column
+        :param k: the `int` number of rows
+        :returns: a `list` of `int` row indexes
+        """
+        values = self.column(column)
+        return heapq.nlargest(k, range(len(values)), key=values.__getitem__)
+
+    def take(self, indexes):
+        """Return a new table of the rows at the given indexes, in order."""
+        table = TorrentStubTable()
+        for name in self.__slots__:
+            source = getattr(self, name)
+            values = [source[i] for i in indexes]
+            if isinstance(source, array.array):
+                values = array.array(source.typecode, values)
+            setattr(table, name, values)
+        return table
+
+    def sorted_by(self, column, reverse=False):
+        """Return a new table sorted by a column. See :meth:`argsort`."""
+        return self.take(self.argsort(column, reverse=reverse))
+
+    def __repr__(self):
+        return "<TorrentStubTable of {0} torrents>".format(len(self))
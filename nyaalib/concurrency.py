@@ -0,0 +1,232 @@
+"""Helpers for running many requests on pools of worker threads and
+processes.
+"""
+import collections
+import itertools
+import threading
+import time
+from concurrent.futures import (
+    CancelledError, FIRST_COMPLETED, Future, ThreadPoolExecutor,
+    TimeoutError, wait,
+)
+
+
+def _timed_out_future():
+    future = Future()
+    future.set_exception(TimeoutError('The batch deadline was exceeded'))
+    return future
+
+
+def iter_completed(function, items, workers, ordered=True, timeout=None):
+    """Call `function` on every element of `items` on a pool of `workers`
+    threads, yielding `(item, future)` pairs as the calls finish.
+
+    At most `workers` calls are submitted ahead of the consumer, so `items`
+    may be a long (or lazy) iterable without every result being held in
+    memory. When the generator is closed early, the calls that have not
+    started yet are cancelled and no further ones are submitted.
+
+    Once `timeout` seconds have passed, the unfinished calls are cancelled
+    and the remaining items are yielded with futures that raise
+    :class:`concurrent.futures.TimeoutError`.
+
+    :param function: a callable taking one element of `items`
+    :param items: an iterable of arguments
+    :param workers: the number of worker threads
+    :param ordered: if `True`, yield in the order of `items`; otherwise yield
+        each call as soon as it finishes
+    :param timeout: the total number of seconds allowed, or `None`
+    :returns: a generator of `(item, future)` pairs whose futures are done
+    """
+    items = iter(items)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = collections.OrderedDict()
+    deadline = None if timeout is None else time.time() + timeout
+
+    def remaining_time():
+        if deadline is None:
+            return None
+        return max(0, deadline - time.time())
+
+    def submit(count):
+        for item in itertools.islice(items, count):
+            pending[executor.submit(function, item)] = item
+
+    try:
+        submit(workers)
+        while pending:
+            if ordered:
+                future = next(iter(pending))
+                done, _ = wait([future], timeout=remaining_time())
+            else:
+                done, _ = wait(pending, timeout=remaining_time(),
+                               return_when=FIRST_COMPLETED)
+                future = next((f for f in pending if f in done), None)
+            if not done:
+                break
+            item = pending.pop(future)
+            # keep the pool busy while the consumer handles this result
+            submit(1)
+            yield item, future
+
+        # the deadline passed: report everything that did not finish
+        while pending:
+            future, item = pending.popitem(last=False)
+            future.cancel()
+            yield item, _timed_out_future()
+        for item in items:
+            yield item, _timed_out_future()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+class SingleFlightStats(object):
+    """Counters of a :class:`SingleFlight`."""
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+        }
+
+    def __repr__(self):
+        return "<SingleFlightStats calls={0} coalesced={1}>".format(
+            self.calls, self.coalesced)
+
+
+class SingleFlight(object):
+    """Coalesces concurrent calls with the same key: while a call is in
+    flight, the callers asking for the same key wait for it and share its
+    result (or exception) instead of making their own call.
+
+    Nothing is kept once a call returns, so a later call for the same key
+    runs again.
+    """
+    def __init__(self):
+        self.stats = SingleFlightStats()
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def do(self, key, function, *args, **kwargs):
+        """Call `function(*args, **kwargs)`, unless a call for `key` is
+        already in flight, in which case wait for that call instead.
+
+        :param key: a hashable key identifying the result of the call
+        :returns: the result of the call
+        """
+        with self._lock:
+            self.stats.calls += 1
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.stats.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+
+def iter_pipelined(fetch, parse, items, fetch_workers, parse_executor,
+                   parse_slots, ordered=True):
+    """Run every element of `items` through two stages, yielding
+    `(item, future)` pairs as the items go through both of them: `fetch`,
+    called on a pool of `fetch_workers` threads, then `parse`, called on
+    `parse_executor` (such as a process pool) with the arguments returned
+    by `fetch`.
+
+    The stages are bounded: a fetch thread waits before handing its result
+    over while `parse_slots` calls of `parse` are queued or running, and at
+    most `fetch_workers + parse_slots` items are in flight ahead of the
+    consumer. Slow parsing, or a slow consumer, stalls the fetching instead
+    of piling up fetched pages in memory. When the generator is closed
+    early, the items not fetched yet are cancelled.
+
+    :param fetch: a callable taking one element of `items` and returning a
+        `tuple` of arguments of `parse`
+    :param parse: a callable that `parse_executor` can run, eg: a module
+        level function for a process pool
+    :param items: an iterable of arguments of `fetch`
+    :param fetch_workers: the number of fetching threads
+    :param parse_executor: the :class:`concurrent.futures.Executor` running
+        `parse`
+    :param parse_slots: the number of calls of `parse` that may be queued or
+        running at once
+    :param ordered: if `True`, yield in the order of `items`; otherwise yield
+        each item as soon as it is parsed
+    :returns: a generator of `(item, future)` pairs whose futures are done,
+        holding the result of `parse` or the exception of either stage
+    """
+    items = iter(items)
+    fetch_executor = ThreadPoolExecutor(max_workers=fetch_workers)
+    slots = threading.BoundedSemaphore(parse_slots)
+    pending = collections.OrderedDict()
+
+    def finish(parse_future, future):
+        slots.release()
+        # `future` is already running, so it cannot be cancelled itself
+        if parse_future.cancelled():
+            future.set_exception(CancelledError())
+            return
+        error = parse_future.exception()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(parse_future.result())
+
+    def run(item, future):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            args = fetch(item)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        slots.acquire()
+        try:
+            parse_future = parse_executor.submit(parse, *args)
+        except Exception as e:
+            slots.release()
+            future.set_exception(e)
+            return
+        parse_future.add_done_callback(
+            lambda parse_future: finish(parse_future, future))
+
+    def submit(count):
+        for item in itertools.islice(items, count):
+            future = Future()
+            pending[future] = item
+            fetch_executor.submit(run, item, future)
+
+    try:
+        submit(fetch_workers + parse_slots)
+        while pending:
+            if ordered:
+                future = next(iter(pending))
+                wait([future])
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                future = next(f for f in pending if f in done)
+            item = pending.pop(future)
+            submit(1)
+            yield item, future
+    finally:
+        for future in pending:
+            future.cancel()
+        fetch_executor.shutdown(wait=False)
@@ -0,0 +1,317 @@
+"""A local SQLite index of Nyaa torrents, searchable without the network.
+
+The index is filled from the :class:`TorrentStub` objects of search pages
+and the :class:`TorrentPage` objects of torrent pages, and answers searches
+with the same models and the same :class:`Category`, :class:`SearchSortKey`
+and :class:`SearchOrderKey` semantics as :meth:`nyaalib.NyaaClient.search`::
+
+    index = TorrentIndex('catalog.db')
+    index.add_torrent_stubs(client.iter_search('love live'))
+    index.search('love live', sort_key=SearchSortKey.seeders)
+
+Names are indexed with SQLite's FTS5 full-text search, and each term of a
+search matches the words of a name that start with it. The index needs
+SQLite 3.24 or later, built with FTS5.
+"""
+import datetime
+import itertools
+import re
+import sqlite3
+import threading
+
+from .models import (
+    Category, SearchOrderKey, SearchResultPage, SearchSortKey, TorrentPage,
+    TorrentStub, User,
+)
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_PER_PAGE = 100
+
+# the first version with `INSERT ... ON CONFLICT DO UPDATE`
+MIN_SQLITE_VERSION = (3, 24, 0)
+
+_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Nyaa assigns torrent IDs in upload order, so sorting by date is sorting by
+# ID
+_SORT_COLUMNS = {
+    SearchSortKey.date: 'tid',
+    SearchSortKey.seeders: 'seeders',
+    SearchSortKey.leechers: 'leechers',
+    SearchSortKey.downloads: 'downloads',
+    SearchSortKey.size: 'size',
+    SearchSortKey.name: 'name',
+}
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS torrents (
+    tid INTEGER PRIMARY KEY,
+    name TEXT,
+    category TEXT,
+    seeders INTEGER,
+    leechers INTEGER,
+    downloads INTEGER,
+    file_size TEXT,
+    size INTEGER,
+    date_created TEXT,
+    submitter_id TEXT,
+    submitter_name TEXT,
+    tracker TEXT,
+    description TEXT
+);
+CREATE INDEX IF NOT EXISTS torrents_category ON torrents (category);
+CREATE INDEX IF NOT EXISTS torrents_date_created ON torrents (date_created);
+CREATE INDEX IF NOT EXISTS torrents_seeders ON torrents (seeders);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS torrents_fts USING fts5 (
+    name, content='torrents', content_rowid='tid'
+);
+CREATE TRIGGER IF NOT EXISTS torrents_fts_insert AFTER INSERT ON torrents
+BEGIN
+    INSERT INTO torrents_fts (rowid, name) VALUES (new.tid, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS torrents_fts_delete AFTER DELETE ON torrents
+BEGIN
+    INSERT INTO torrents_fts (torrents_fts, rowid, name)
+    VALUES ('delete', old.tid, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS torrents_fts_update AFTER UPDATE OF name
+ON torrents WHEN old.name IS NOT new.name
+BEGIN
+    INSERT INTO torrents_fts (torrents_fts, rowid, name)
+    VALUES ('delete', old.tid, old.name);
+    INSERT INTO torrents_fts (rowid, name) VALUES (new.tid, new.name);
+END;
+'''
+
+_STUB_COLUMNS = (
+    'tid', 'name', 'category', 'seeders', 'leechers', 'downloads',
+    'file_size', 'size',
+)
+_PAGE_COLUMNS = _STUB_COLUMNS + (
+    'date_created', 'submitter_id', 'submitter_name', 'tracker',
+    'description',
+)
+
+
+def _upsert_sql(columns):
+    # a `NULL` value keeps the indexed one, so that a partial torrent page
+    # (eg: with only its swarm statistics) does not erase the other fields
+    return (
+        'INSERT INTO torrents ({0}) VALUES ({1}) '
+        'ON CONFLICT (tid) DO UPDATE SET {2}').format(
+            ', '.join(columns), ', '.join('?' * len(columns)),
+            ', '.join('{0} = COALESCE(excluded.{0}, {0})'.format(column)
+                      for column in columns[1:]))
+
+
+_UPSERT_STUB = _upsert_sql(_STUB_COLUMNS)
+_UPSERT_PAGE = _upsert_sql(_PAGE_COLUMNS)
+
+
+def _stub_row(stub):
+    return (
+        int(stub.tid), stub.name,
+        stub.category.value if stub.category is not None else None,
+        stub.seeders, stub.leechers, stub.downloads, stub.file_size,
+        stub.size)
+
+
+def _page_row(page):
+    submitter = page.submitter
+    return _stub_row(page) + (
+        page.date_created.strftime(_DATE_FORMAT)
+        if page.date_created is not None else None,
+        submitter.uid if submitter is not None else None,
+        submitter.name if submitter is not None else None,
+        page.tracker, page.description)
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _fts_query(terms):
+    # every word is quoted, so that FTS5 operators and punctuation in the
+    # terms are matched literally
+    words = re.findall(r'\w+', terms, re.UNICODE)
+    return ' '.join(u'"{0}"*'.format(word) for word in words)
+
+
+def _category_condition(category):
+    """Return the SQL condition and parameters selecting a category, as Nyaa
+    does: a top level category includes all of its sub categories.
+    """
+    if category == Category.all_categories:
+        return None, ()
+    top_level, sub_category = category.value.split('_')
+    if sub_category != '0':
+        return 'category = ?', (category.value,)
+    # a range rather than `LIKE`, so the category index can be used; '`'
+    # is the character after '_'
+    return 'category >= ? AND category < ?', (
+        top_level + '_', top_level + '`')
+
+
+class TorrentIndex(object):
+    """A thread-safe SQLite index of torrents."""
+
+    def __init__(self, path=':memory:', batch_size=DEFAULT_BATCH_SIZE):
+        """
+        :param path: the path of the SQLite database file, created if needed
+        :param batch_size: the number of rows written per transaction by the
+            bulk methods
+        :raises RuntimeError: if the version of SQLite is older than
+            :data:`MIN_SQLITE_VERSION`
+        """
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            raise RuntimeError(
+                "TorrentIndex needs SQLite {0} or later, not {1}".format(
+                    '.'.join(str(part) for part in MIN_SQLITE_VERSION),
+                    sqlite3.sqlite_version))
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def _write(self, sql, rows):
+        count = 0
+        for batch in _batches(rows, self.batch_size):
+            with self._lock, self._connection:
+                self._connection.executemany(sql, batch)
+            count += len(batch)
+        return count
+
+    def add_torrent_stubs(self, torrent_stubs):
+        """Insert or update torrents from :class:`TorrentStub` objects, in
+        batched transactions. The fields only found on torrent pages (eg:
+        `description`) of torrents already indexed are kept.
+
+        :param torrent_stubs: an iterable of :class:`TorrentStub` objects,
+            such as :meth:`nyaalib.NyaaClient.iter_search`
+        :returns: the `int` number of indexed torrents
+        """
+        return self._write(
+            _UPSERT_STUB, (_stub_row(stub) for stub in torrent_stubs))
+
+    def add_search_result_pages(self, search_result_pages):
+        """Insert or update the torrents of :class:`SearchResultPage`
+        objects.
+
+        :returns: the `int` number of indexed torrents
+        """
+        return self.add_torrent_stubs(
+            stub for search_result_page in search_result_pages
+            for stub in search_result_page.torrent_stubs)
+
+    def add_torrent_pages(self, torrent_pages):
+        """Insert or update torrents from :class:`TorrentPage` objects, in
+        batched transactions. The fields a page does not have (eg: because it
+        was viewed with only some `fields`) keep their indexed values.
+
+        :param torrent_pages: an iterable of :class:`TorrentPage` objects,
+            such as the successes of :meth:`nyaalib.NyaaClient.view_torrents`
+        :returns: the `int` number of indexed torrents
+        """
+        return self._write(
+            _UPSERT_PAGE, (_page_row(page) for page in torrent_pages))
+
+    def search(self, terms='', category=Category.all_categories, page=1,
+               sort_key=SearchSortKey.date,
+               order_key=SearchOrderKey.descending,
+               per_page=DEFAULT_PER_PAGE):
+        """Search the index like :meth:`nyaalib.NyaaClient.search`.
+
+        :param terms: the `str` needle; every word must start a word of the
+            name of a result
+        :param category: the desired :class:`Category` of the results
+        :param page: the 1-based page to return
+        :param sort_key: the :class:`SearchSortKey` of the results list
+        :param order_key: the :class:`SearchOrderkey` of the results list
+        :param per_page: the number of results per page
+        :return: a :class:`SearchResultPage` of results
+        """
+        conditions = []
+        params = []
+        query = _fts_query(terms)
+        if query:
+            conditions.append(
+                'tid IN (SELECT rowid FROM torrents_fts '
+                'WHERE torrents_fts MATCH ?)')
+            params.append(query)
+        condition, condition_params = _category_condition(category)
+        if condition is not None:
+            conditions.append(condition)
+            params.extend(condition_params)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+        direction = 'ASC' if order_key == SearchOrderKey.ascending else 'DESC'
+        order_by = ' ORDER BY {0} {1}, tid {1}'.format(
+            _SORT_COLUMNS[sort_key], direction)
+
+        with self._lock:
+            count = self._connection.execute(
+                'SELECT COUNT(*) FROM torrents' + where, params).fetchone()[0]
+            rows = self._connection.execute(
+                'SELECT {0} FROM torrents{1}{2} LIMIT ? OFFSET ?'.format(
+                    ', '.join(_STUB_COLUMNS), where, order_by),
+                params + [per_page, (page - 1) * per_page]).fetchall()
+
+        total_pages = max(1, (count + per_page - 1) // per_page)
+        torrent_stubs = [
+            TorrentStub(str(tid), name,
+                        Category.lookup_category(category_value), seeders,
+                        leechers, file_size, downloads, size)
+            for (tid, name, category_value, seeders, leechers, downloads,
+                 file_size, size) in rows]
+        return SearchResultPage(terms, category, sort_key, order_key, page,
+                                total_pages, torrent_stubs)
+
+    def get_torrent_page(self, torrent_id):
+        """Return the indexed :class:`TorrentPage` of a torrent, or `None` if
+        only its :class:`TorrentStub` (or nothing) was indexed.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT {0} FROM torrents WHERE tid = ? AND '
+                'date_created IS NOT NULL'.format(', '.join(_PAGE_COLUMNS)),
+                (int(torrent_id),)).fetchone()
+        if row is None:
+            return None
+        (tid, name, category, seeders, leechers, downloads, file_size, size,
+         date_created, submitter_id, submitter_name, tracker,
+         description) = row
+        submitter = None
+        if submitter_id is not None or submitter_name is not None:
+            submitter = User(submitter_id, submitter_name)
+        return TorrentPage(
+            str(tid), name, submitter, Category.lookup_category(category),
+            tracker, datetime.datetime.strptime(date_created, _DATE_FORMAT),
+            seeders, leechers, downloads, file_size, description, size)
+
+    def delete(self, torrent_id):
+        with self._lock, self._connection:
+            self._connection.execute(
+                'DELETE FROM torrents WHERE tid = ?', (int(torrent_id),))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __contains__(self, torrent_id):
+        with self._lock:
+            return self._connection.execute(
+                'SELECT 1 FROM torrents WHERE tid = ?',
+                (int(torrent_id),)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                'SELECT COUNT(*) FROM torrents').fetchone()[0]
@@ -0,0 +1,330 @@
+"""Instrumentation of the requests sent by :class:`nyaalib.NyaaClient`.
+
+A client calls each of its `hooks` with a :class:`RequestEvent` once a
+`view`, `search`, `rss` or `download` request has been handled, whether it
+succeeded or failed. A
+:class:`MetricsRecorder` is a hook that aggregates the events into counters
+and latency histograms::
+
+    recorder = MetricsRecorder()
+    client = NyaaClient(hooks=[recorder])
+    client.search('love live')
+    recorder.histogram('search', 'parse').percentile(0.95)
+
+When a client has no hooks, no clock is read and no event is built.
+"""
+import bisect
+import collections
+import threading
+
+from .throttle import monotonic
+
+PHASES = ('time_to_headers', 'network', 'parse', 'extract', 'total')
+
+# the upper bounds in seconds of the buckets of a :class:`Histogram`
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, 30.0, 60.0,
+)
+
+
+class RequestEvent(object):
+    """The outcome and timings of one request.
+
+    The timings are in seconds. `time_to_headers` is the time from sending
+    the request until its response headers were parsed, which includes the
+    DNS lookup and connection when no pooled connection was available;
+    `network` also includes reading the body (and, for downloads, writing
+    it out). `parse` is the time spent parsing the HTML, and `extract` the
+    time spent extracting the fields of the models from it. Both are `None`
+    for downloads, for RSS searches, whose feeds are parsed as they are
+    read (their `network` time includes the parsing), and for the pages of a
+    :class:`nyaalib.pipeline.ParsePipeline`, which are parsed by other
+    processes. With an incremental parser backend, pages are also parsed as
+    they are read, so their `parse` time is about zero.
+
+    `error` is the exception the request failed with, such as a
+    :class:`nyaalib.TorrentNotFoundError` or a
+    :class:`requests.ConnectionError`, or `None` if it succeeded. The
+    `status` and `time_to_headers` of a request that failed before its
+    response arrived are `None`.
+    """
+    __slots__ = (
+        'endpoint', 'params', 'status', 'bytes_received', 'time_to_headers',
+        'network', 'parse', 'extract', 'error',
+    )
+
+    def __init__(self, endpoint, params, status, bytes_received,
+                 time_to_headers, network, parse=None, extract=None,
+                 error=None):
+        self.endpoint = endpoint
+        self.params = params
+        self.status = status
+        self.bytes_received = bytes_received
+        self.time_to_headers = time_to_headers
+        self.network = network
+        self.parse = parse
+        self.extract = extract
+        self.error = error
+
+    @property
+    def total(self):
+        return self.network + (self.parse or 0) + (self.extract or 0)
+
+    def __repr__(self):
+        return ("<RequestEvent endpoint={0} status={1} bytes={2} "
+                "total={3:.3f}s error={4!r}>").format(
+                    self.endpoint, self.status, self.bytes_received,
+                    self.total, self.error)
+
+
+class _NullTimer(object):
+    """The timer of a client without hooks, which does nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def responded(self, response):
+        pass
+
+    def fetched(self, response, bytes_received=None):
+        pass
+
+    def count(self, chunks):
+        return chunks
+
+    def parsed(self):
+        pass
+
+    def done(self, error=None):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class RequestTimer(object):
+    """Times the phases of one request and sends its :class:`RequestEvent`
+    to the hooks of the client.
+
+    Used as a context manager, the timer sends the event when the block
+    exits, with the exception raised by the block, if any.
+    """
+    __slots__ = (
+        'hooks', 'endpoint', 'params', 'response', 'bytes_received',
+        '_start', '_fetched', '_parsed',
+    )
+
+    def __init__(self, hooks, endpoint, params):
+        self.hooks = hooks
+        self.endpoint = endpoint
+        self.params = params
+        self.response = None
+        self.bytes_received = None
+        self._start = monotonic()
+        self._fetched = None
+        self._parsed = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # a generator closed by its consumer before the end did not fail
+        if isinstance(exc_value, GeneratorExit):
+            exc_value = None
+        self.done(exc_value)
+
+    def responded(self, response):
+        """Record the response as soon as its headers arrive, so that the
+        event of a request failing afterwards still has its status.
+        """
+        self.response = response
+
+    def fetched(self, response, bytes_received=None):
+        """Mark the end of the network phase.
+
+        :param bytes_received: the size of the body, if it was streamed
+            without :meth:`count`
+        """
+        self._fetched = monotonic()
+        self.response = response
+        if bytes_received is not None:
+            self.bytes_received = bytes_received
+        elif self.bytes_received is None:
+            self.bytes_received = len(response.content)
+
+    def count(self, chunks):
+        """Count the bytes of a streamed body as the chunks are consumed."""
+        self.bytes_received = 0
+        for chunk in chunks:
+            self.bytes_received += len(chunk)
+            yield chunk
+
+    def parsed(self):
+        """Mark the end of the parse phase."""
+        self._parsed = monotonic()
+
+    def done(self, error=None):
+        """Mark the end of the request and call the hooks.
+
+        :param error: the exception the request failed with, if any
+        """
+        now = monotonic()
+        fetched = self._fetched if self._fetched is not None else now
+        network = fetched - self._start
+        parse = extract = None
+        if self._parsed is not None:
+            parse = self._parsed - fetched
+            extract = now - self._parsed
+        response = self.response
+        if response is None:
+            # the exceptions of requests carry the response, if there was one
+            response = getattr(error, 'response', None)
+        status = time_to_headers = None
+        if response is not None:
+            status = response.status_code
+            time_to_headers = response.elapsed.total_seconds()
+        event = RequestEvent(
+            self.endpoint, self.params, status, self.bytes_received or 0,
+            time_to_headers, network, parse, extract, error)
+        for hook in self.hooks:
+            hook(event)
+
+
+def start_timer(hooks, endpoint, params):
+    """Return a :class:`RequestTimer`, or :data:`NULL_TIMER` if there are no
+    `hooks`.
+    """
+    if not hooks:
+        return NULL_TIMER
+    return RequestTimer(hooks, endpoint, params)
+
+
+class Histogram(object):
+    """A histogram of values, such as latencies in seconds, in fixed
+    buckets.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        :param buckets: the sorted upper bounds of the buckets; larger values
+            are counted in an extra, unbounded bucket
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def percentile(self, q):
+        """Return an upper bound of the `q` quantile (`0 < q <= 1`): the
+        upper bound of the bucket it falls in, or the largest value seen.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+        }
+
+    def __repr__(self):
+        return "<Histogram count={0} mean={1}>".format(self.count, self.mean)
+
+
+class MetricsRecorder(object):
+    """A thread-safe hook that aggregates :class:`RequestEvent` objects into
+    counters and per-endpoint, per-phase histograms.
+
+    The counters are `requests`, `bytes_received`, `status.<code>` (for the
+    requests that got a response) and `errors` and `error.<exception name>`
+    (for the failed requests), each also kept per endpoint (eg:
+    `requests.view`).
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters = collections.Counter()
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        endpoint = event.endpoint
+        with self._lock:
+            counters = self.counters
+            for suffix in ('', '.' + endpoint):
+                counters['requests' + suffix] += 1
+                counters['bytes_received' + suffix] += event.bytes_received
+                if event.status is not None:
+                    counters['status.{0}{1}'.format(
+                        event.status, suffix)] += 1
+                if event.error is not None:
+                    counters['errors' + suffix] += 1
+                    counters['error.{0}{1}'.format(
+                        type(event.error).__name__, suffix)] += 1
+            for phase in PHASES:
+                value = getattr(event, phase)
+                if value is not None:
+                    self._histogram(endpoint, phase).observe(value)
+
+    def _histogram(self, endpoint, phase):
+        key = (endpoint, phase)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        return histogram
+
+    def histogram(self, endpoint, phase):
+        """Return the :class:`Histogram` of a phase of an endpoint.
+
+        :param endpoint: `'view'`, `'search'`, `'rss'` or `'download'`
+        :param phase: one of :data:`PHASES`
+        """
+        with self._lock:
+            return self._histogram(endpoint, phase)
+
+    def snapshot(self):
+        """Return the counters and histograms as a `dict`."""
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': dict(
+                    ('{0}.{1}'.format(endpoint, phase), histogram.as_dict())
+                    for (endpoint, phase), histogram
+                    in self.histograms.items()),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
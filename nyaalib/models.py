@@ -1,4 +1,34 @@
 import enum
+import operator
+
+from . import bencode
+
+FILE_SIZE_UNITS = {
+    'B': 1,
+    'KiB': 1024,
+    'MiB': 1024 ** 2,
+    'GiB': 1024 ** 3,
+    'TiB': 1024 ** 4,
+}
+
+# the same few thousand size strings are shown over and over, so parsed sizes
+# are memoized, up to this many distinct strings
+_FILE_SIZE_CACHE_LIMIT = 8192
+_file_size_cache = {}
+
+# the attributes of :class:`TorrentStub` and :class:`TorrentPage` that
+# :meth:`SearchResultPage.sorted_by` and :meth:`SearchResultPage.filter` accept
+SORTABLE_ATTRIBUTES = ('size', 'seeders', 'leechers', 'downloads')
+
+# the attributes of :class:`TorrentPage` that can be selected with the
+# `fields` of :meth:`nyaalib.NyaaClient.view_torrent`
+TORRENT_PAGE_FIELDS = (
+    'name', 'submitter', 'category', 'tracker', 'date_created', 'seeders',
+    'leechers', 'downloads', 'file_size', 'description', 'size',
+)
+
+# the fields of a torrent that change over time
+SWARM_STATS_FIELDS = ('seeders', 'leechers', 'downloads')
 
 
 @enum.unique
@@ -87,16 +117,54 @@ class SearchOrderKey(enum.Enum):
     ascending = '2'
 
 
+def _deferred_attribute(name):
+    """Return a property whose value may be computed by a loader registered
+    with :meth:`TorrentPage._defer` the first time it is read.
+    """
+    private_name = '_' + name
+
+    def get(self):
+        deferred = self._deferred
+        loader = deferred.get(name) if deferred is not None else None
+        if loader is not None:
+            # the value is set before the loader is removed, so that a
+            # thread reading it at the same time computes it as well rather
+            # than reading it too early
+            setattr(self, private_name, loader())
+            deferred.pop(name, None)
+        return getattr(self, private_name)
+
+    def set(self, value):
+        if self._deferred is not None:
+            self._deferred.pop(name, None)
+        setattr(self, private_name, value)
+
+    return property(get, set)
+
+
 class TorrentPage(object):
     """Represents a snapshot view of a torrent detail page
 
     Some of the instance variables do not change over time (eg: `name`,
     `submitter`, `category`, etc.), but some variables do change
     (eg: the number of `seeders`, the number of `leechers`).
+
+    The `date_created` and `description` of a page retrieved by
+    :meth:`nyaalib.NyaaClient.view_torrent` are only extracted when they are
+    first read.
     """
+    __slots__ = (
+        'tid', 'name', 'submitter', 'category', 'tracker', '_date_created',
+        'seeders', 'leechers', 'downloads', 'file_size', '_description',
+        'size', '_deferred',
+    )
+
+    date_created = _deferred_attribute('date_created')
+    description = _deferred_attribute('description')
+
     def __init__(self, torrent_id, name, submitter, category, tracker,
                  date_created, seeders, leechers, downloads, file_size,
-                 description):
+                 description, size=None):
         """
         :param torrent_id: a `str` ID
         :param name: the name of the torrent
@@ -109,7 +177,10 @@ class TorrentPage(object):
         :param downloads: the cumulative `int` number of downloads
         :param file_size: a `str` describing the file size
         :param description: the `str` description provided by the uploader
+        :param size: the `int` number of bytes described by `file_size`,
+            parsed from it when not given
         """
+        self._deferred = None
         self.tid = torrent_id
         self.name = name
         self.submitter = submitter
@@ -121,15 +192,59 @@ class TorrentPage(object):
         self.downloads = downloads
         self.file_size = file_size
         self.description = description
+        if size is None:
+            size = parse_file_size(file_size)
+        self.size = size
+
+    def _defer(self, name, loader):
+        """Compute the attribute `name` by calling `loader` when it is first
+        read.
+        """
+        if self._deferred is None:
+            self._deferred = {}
+        self._deferred[name] = loader
+
+    def __getstate__(self):
+        # the loaders hold parsed documents, which cannot be pickled, so the
+        # deferred attributes are computed first
+        state = dict((name, getattr(self, name))
+                     for name in TORRENT_PAGE_FIELDS)
+        state['tid'] = self.tid
+        return state
+
+    def __setstate__(self, state):
+        self._deferred = None
+        for name, value in state.items():
+            setattr(self, name, value)
 
     def __repr__(self):
         return "<TorrentPage tid='{0}' name={1}>".format(
             self.tid, repr(self.name))
 
 
+class TorrentPageFailure(object):
+    """Stands in for the :class:`TorrentPage` of a torrent that could not be
+    retrieved as part of a batch.
+    """
+    def __init__(self, torrent_id, error):
+        """
+        :param torrent_id: a `str` ID
+        :param error: the exception raised while retrieving the torrent page,
+            eg: a :class:`nyaalib.TorrentNotFoundError`
+        """
+        self.tid = torrent_id
+        self.error = error
+
+    def __repr__(self):
+        return "<TorrentPageFailure tid='{0}' error={1}>".format(
+            self.tid, repr(self.error))
+
+
 class User(object):
     """Represents a Nyaa user.
     """
+    __slots__ = ('uid', 'name')
+
     def __init__(self, user_id, name):
         self.uid = user_id
         self.name = name
@@ -142,23 +257,79 @@ class User(object):
 class Torrent(object):
     """Holds the Nyaa ID of the torrent, as well as the contents of the
     `.torrent` file.
+
+    The metainfo is decoded lazily (see :mod:`nyaalib.bencode`) and without
+    copying `data`, so reading the infohash or the total size of a torrent
+    with thousands of files stays cheap.
     """
-    def __init__(self, torrent_id, torrent_data):
+    def __init__(self, torrent_id, torrent_data, path=None):
         """
         :param torrent_id: a `str` ID
         :param torrent_data: a `str` containing the contents of the `.torrent`
-            file
+            file, a read-only :class:`mmap.mmap` of it, or `None` if it was
+            only written to a file
+        :param path: the path of the `.torrent` file on disk, if any
         """
         self.tid = torrent_id
         self.data = torrent_data
+        self.path = path
+        self._metainfo = None
+        self._infohash = None
+
+    @property
+    def metainfo(self):
+        """The decoded metainfo as a :class:`nyaalib.bencode.BencodeDict`."""
+        if self._metainfo is None:
+            self._metainfo = bencode.decode(self.data)
+        return self._metainfo
+
+    @property
+    def infohash(self):
+        """The hex SHA-1 infohash `str` of the torrent."""
+        if self._infohash is None:
+            self._infohash = bencode.metainfo_infohash(self.metainfo)
+        return self._infohash
+
+    @property
+    def files(self):
+        """A `list` of `(path, length)` tuples of the files in the torrent,
+        where `path` is a `/`-separated `str`.
+        """
+        info = self.metainfo[b'info']
+        if b'files' not in info:
+            return [(_decode_text(info[b'name']), info[b'length'])]
+        return [
+            (u'/'.join(_decode_text(part) for part in file_info[b'path']),
+             file_info[b'length'])
+            for file_info in info[b'files']]
+
+    @property
+    def total_size(self):
+        """The total `int` number of bytes of the files in the torrent."""
+        info = self.metainfo[b'info']
+        if b'files' not in info:
+            return info[b'length']
+        return sum(file_info[b'length'] for file_info in info[b'files'])
 
     def __repr__(self):
+        if self.data is None:
+            return "<Torrent tid='{0}' saved to {1}>".format(
+                self.tid, repr(self.path))
         return "<Torrent tid='{0}' with {1} character body>".format(
             self.tid, len(self.data))
 
 
+def _decode_text(value):
+    return value.tobytes().decode('utf-8', 'replace')
+
+
 class SearchResultPage(object):
     """A single page of search results"""
+    __slots__ = (
+        'terms', 'category', 'sort_key', 'order_key', 'page', 'total_pages',
+        'torrent_stubs',
+    )
+
     def __init__(self, terms, category, sort_key, order_key, page, total_pages,
                  torrent_stubs):
         """
@@ -181,6 +352,47 @@ class SearchResultPage(object):
         else:
             self.torrent_stubs = []
 
+    def sorted_by(self, attribute, reverse=False):
+        """Sort the torrents of this page locally, without another search.
+
+        Torrents whose value is unknown (`None`) are always placed last.
+
+        :param attribute: one of `'size'`, `'seeders'`, `'leechers'` or
+            `'downloads'`
+        :param reverse: if `True`, sort in descending order
+        :returns: a new `list` of :class:`TorrentStub` objects
+        """
+        _check_sortable_attribute(attribute)
+        known = [stub for stub in self.torrent_stubs
+                 if getattr(stub, attribute) is not None]
+        unknown = [stub for stub in self.torrent_stubs
+                   if getattr(stub, attribute) is None]
+        known.sort(key=operator.attrgetter(attribute), reverse=reverse)
+        return known + unknown
+
+    def filter(self, min_size=None, max_size=None, min_seeders=None,
+               max_seeders=None, min_leechers=None, max_leechers=None,
+               min_downloads=None, max_downloads=None):
+        """Select the torrents of this page within inclusive bounds, without
+        another search. Torrents with an unknown value never match a bound
+        on that value.
+
+        :param min_size: the minimum `int` number of bytes, and so on for
+            the other bounds
+        :returns: a new `list` of :class:`TorrentStub` objects
+        """
+        bounds = [
+            (attribute, minimum, maximum)
+            for attribute, minimum, maximum in (
+                ('size', min_size, max_size),
+                ('seeders', min_seeders, max_seeders),
+                ('leechers', min_leechers, max_leechers),
+                ('downloads', min_downloads, max_downloads))
+            if minimum is not None or maximum is not None]
+        return [stub for stub in self.torrent_stubs
+                if all(_within(getattr(stub, attribute), minimum, maximum)
+                       for attribute, minimum, maximum in bounds)]
+
     def __repr__(self):
         return "<SearchResultPage terms={0} page={1}/{2}>".format(
             repr(self.terms), self.page, self.total_pages)
@@ -190,8 +402,13 @@ class TorrentStub(object):
     """The information available about a torrent from what's returned from the
     search result page.
     """
+    __slots__ = (
+        'tid', 'name', 'category', 'seeders', 'leechers', 'file_size',
+        'downloads', 'size',
+    )
+
     def __init__(self, torrent_id, name, category, seeders, leechers,
-                 file_size, downloads):
+                 file_size, downloads, size=None):
         """
         :param torrent_id: a `str` ID
         :param name: the name of the torrent
@@ -200,6 +417,8 @@ class TorrentStub(object):
         :param leechers: the `current int` number of leechers or None
         :param file_size: a `str` describing the file size
         :param downloads: the cumulative `int` number of downloads
+        :param size: the `int` number of bytes described by `file_size`,
+            parsed from it when not given
         """
         self.tid = torrent_id
         self.name = name
@@ -208,7 +427,48 @@ class TorrentStub(object):
         self.leechers = leechers
         self.file_size = file_size
         self.downloads = downloads
+        if size is None:
+            size = parse_file_size(file_size)
+        self.size = size
 
     def __repr__(self):
         return "<TorrentStub tid='{0}' name={1}>".format(
             self.tid, repr(self.name))
+
+
+def _check_sortable_attribute(attribute):
+    if attribute not in SORTABLE_ATTRIBUTES:
+        raise ValueError("Cannot sort by {0}".format(attribute))
+
+
+def _within(value, minimum, maximum):
+    if value is None:
+        return False
+    if minimum is not None and value < minimum:
+        return False
+    if maximum is not None and value > maximum:
+        return False
+    return True
+
+
+def parse_file_size(file_size):
+    """Convert a file size as displayed by Nyaa (eg: `'6.72 GiB'`) to an
+    approximate number of bytes.
+
+    :param file_size: the `str` file size
+    :returns: the `int` number of bytes, or `None` if `file_size` could not
+        be parsed
+    """
+    try:
+        return _file_size_cache[file_size]
+    except (KeyError, TypeError):
+        pass
+    try:
+        number, unit = file_size.split()
+        size = int(round(float(number) * FILE_SIZE_UNITS[unit]))
+    except (AttributeError, KeyError, ValueError):
+        return None
+    if len(_file_size_cache) >= _FILE_SIZE_CACHE_LIMIT:
+        _file_size_cache.clear()
+    _file_size_cache[file_size] = size
+    return size
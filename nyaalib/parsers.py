@@ -0,0 +1,282 @@
+"""HTML parser backends used to locate the content `div` of a Nyaa page.
+
+Every backend returns an :class:`xml.etree.ElementTree.Element`-compatible
+element (supporting `find`, `findall`, `attrib`, `text` and `len`), so the
+extraction code in :class:`nyaalib.NyaaClient` works unchanged on any of them.
+"""
+import codecs
+import threading
+from xml.etree import ElementTree
+try:
+    from html.parser import HTMLParser
+except ImportError:
+    # Python 2
+    from HTMLParser import HTMLParser
+
+
+def _is_content_div(div):
+    return "content" in div.attrib['class'].split(' ')
+
+
+class ParserBackend(object):
+    """Base class of the HTML parser backends.
+
+    Subclasses implement :meth:`parse_document` and may override
+    :meth:`tostring`.
+    """
+    name = None
+    # whether :meth:`parse_chunks` parses a document as it is downloaded,
+    # in which case :class:`nyaalib.NyaaClient` streams the responses
+    incremental = False
+
+    def parse_document(self, content, encoding=None):
+        """Parse a whole HTML document.
+
+        :param content: the `bytes` of the document
+        :param encoding: the transport encoding of `content`, or `None` to
+            let the parser detect it
+        :returns: the root element of the document
+        """
+        raise NotImplementedError
+
+    def parse(self, content, encoding=None):
+        """Parse an HTML document and return its content `div`.
+
+        :param content: the `bytes` of the document
+        :param encoding: the transport encoding of `content`, or `None`
+        :returns: the first element of the content `div` or `None`
+        """
+        document = self.parse_document(content, encoding)
+        # etree doesn't fully support XPath, so we can't just search
+        # the attribute values for "content"
+        for div in document.findall(".//body//div[@class]"):
+            if _is_content_div(div):
+                return div
+        return None
+
+    def parse_chunks(self, chunks, encoding=None):
+        """Parse an HTML document read in chunks and return its content
+        `div`, like :meth:`parse`.
+
+        :param chunks: an iterable of the `bytes` of the document, such as
+            :meth:`requests.Response.iter_content`
+        :param encoding: the transport encoding of the chunks, or `None`
+        :returns: the first element of the content `div` or `None`
+        """
+        return self.parse(b''.join(chunks), encoding)
+
+    def tostring(self, element):
+        """Serialize an element returned by this backend as HTML.
+
+        :param element: an element of a document parsed by this backend
+        :returns: the UTF-8 encoded `bytes` of the element
+        """
+        return ElementTree.tostring(element, encoding='utf8', method='html')
+
+
+def _html5lib_encoding_argument(html5lib):
+    # html5lib 1.0 renamed the `encoding` argument of `parse`
+    major_version = html5lib.__version__.split('.')[0]
+    if major_version.isdigit() and int(major_version) >= 1:
+        return 'transport_encoding'
+    return 'encoding'
+
+
+class Html5libParser(ParserBackend):
+    """Parses with `html5lib`, which follows the HTML5 parsing algorithm
+    exactly but is implemented in pure Python.
+    """
+    name = 'html5lib'
+
+    def parse_document(self, content, encoding=None):
+        # imported here so that `import nyaalib` does not import html5lib
+        import html5lib
+        kwargs = {
+            'treebuilder': 'etree',
+            'namespaceHTMLElements': False,
+        }
+        if encoding:
+            kwargs[_html5lib_encoding_argument(html5lib)] = encoding
+        return html5lib.parse(content, **kwargs)
+
+
+class LxmlParser(ParserBackend):
+    """Parses with `lxml.html`, which is implemented in C on top of libxml2
+    and is many times faster than `html5lib`.
+
+    Requires the optional `lxml` dependency.
+    """
+    name = 'lxml'
+
+    def __init__(self):
+        # imported here so that `lxml` stays an optional dependency
+        import lxml.html
+        self._lxml_html = lxml.html
+        # lxml parser objects must not be shared between threads
+        self._local = threading.local()
+
+    def __reduce__(self):
+        # the parsers of each thread are created again when unpickled
+        return (LxmlParser, ())
+
+    def _get_parser(self, encoding):
+        parsers = getattr(self._local, 'parsers', None)
+        if parsers is None:
+            parsers = self._local.parsers = {}
+        parser = parsers.get(encoding)
+        if parser is None:
+            parser = self._lxml_html.HTMLParser(encoding=encoding)
+            parsers[encoding] = parser
+        return parser
+
+    def parse_document(self, content, encoding=None):
+        return self._lxml_html.document_fromstring(
+            content, parser=self._get_parser(encoding))
+
+    def tostring(self, element):
+        return self._lxml_html.tostring(
+            element, encoding='utf8', method='html', with_tail=False)
+
+
+# the elements that have no end tag
+_VOID_ELEMENTS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+    'meta', 'param', 'source', 'track', 'wbr',
+])
+
+# the open elements implicitly closed by a start tag, eg: a `td` ends the
+# previous `td` of the row
+_IMPLIED_END_TAGS = {
+    'td': frozenset(['td', 'th']),
+    'th': frozenset(['td', 'th']),
+    'tr': frozenset(['td', 'th', 'tr']),
+    'tbody': frozenset(['td', 'th', 'tr', 'tbody', 'thead', 'tfoot']),
+    'thead': frozenset(['td', 'th', 'tr', 'tbody', 'thead', 'tfoot']),
+    'tfoot': frozenset(['td', 'th', 'tr', 'tbody', 'thead', 'tfoot']),
+    'li': frozenset(['li']),
+    'option': frozenset(['option']),
+    'p': frozenset(['p']),
+}
+
+
+class _ContentClosed(Exception):
+    pass
+
+
+class _ContentDivParser(HTMLParser):
+    """Builds the tree of the first content `div` of a document, ignoring
+    everything around it, and raises :class:`_ContentClosed` once the `div`
+    is closed.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.builder = None
+        self.open_tags = []
+        self.content = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.builder is None:
+            if tag != 'div':
+                return
+            attrib = dict((name, value or '') for name, value in attrs)
+            if 'content' not in attrib.get('class', '').split(' '):
+                return
+            self.builder = ElementTree.TreeBuilder()
+        else:
+            attrib = dict((name, value or '') for name, value in attrs)
+            implied = _IMPLIED_END_TAGS.get(tag)
+            while implied and self.open_tags[-1] in implied:
+                self.builder.end(self.open_tags.pop())
+        self.builder.start(tag, attrib)
+        if tag in _VOID_ELEMENTS:
+            self.builder.end(tag)
+        else:
+            self.open_tags.append(tag)
+
+    def handle_endtag(self, tag):
+        # stray end tags are ignored, and the elements left open inside the
+        # closed one are closed with it
+        if self.builder is None or tag not in self.open_tags:
+            return
+        while True:
+            open_tag = self.open_tags.pop()
+            self.builder.end(open_tag)
+            if open_tag == tag:
+                break
+        if not self.open_tags:
+            self.content = self.builder.close()
+            raise _ContentClosed()
+
+    def handle_data(self, data):
+        if self.builder is not None:
+            self.builder.data(data)
+
+    def finish(self):
+        """Return the content `div`, closing the elements left open by a
+        truncated document.
+        """
+        if self.content is None and self.builder is not None:
+            while self.open_tags:
+                self.builder.end(self.open_tags.pop())
+            self.content = self.builder.close()
+        return self.content
+
+
+class StreamingParser(ParserBackend):
+    """Parses with the standard library's incremental
+    :class:`html.parser.HTMLParser`, building elements only within the
+    content `div` and stopping as soon as it is closed.
+
+    Responses are parsed while they are downloaded, and the rest of the page
+    after the content `div` (the footer) is neither read nor parsed; the
+    connection is then closed rather than reused. The tree does not contain
+    the elements implied by HTML, such as `tbody`, but the extraction code
+    never depends on them.
+    """
+    name = 'streaming'
+    incremental = True
+
+    def parse(self, content, encoding=None):
+        return self.parse_chunks([content], encoding)
+
+    def parse_chunks(self, chunks, encoding=None):
+        decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(
+            'replace')
+        parser = _ContentDivParser()
+        try:
+            for chunk in chunks:
+                parser.feed(decoder.decode(chunk))
+            parser.feed(decoder.decode(b'', True))
+            parser.close()
+        except _ContentClosed:
+            pass
+        return parser.finish()
+
+    def parse_document(self, content, encoding=None):
+        raise NotImplementedError(
+            'The streaming parser only builds the content div')
+
+
+PARSER_BACKENDS = {
+    Html5libParser.name: Html5libParser,
+    LxmlParser.name: LxmlParser,
+    StreamingParser.name: StreamingParser,
+}
+
+
+def get_parser(parser):
+    """Return a :class:`ParserBackend` for the given name or backend.
+
+    :param parser: the name of a backend (eg: `'html5lib'` or `'lxml'`) or a
+        :class:`ParserBackend` instance
+    :raises ValueError: if there is no backend with the given name
+    :returns: a :class:`ParserBackend` instance
+    """
+    if isinstance(parser, ParserBackend):
+        return parser
+    try:
+        backend_class = PARSER_BACKENDS[parser]
+    except KeyError:
+        raise ValueError("Unknown parser backend: {0}".format(parser))
+    return backend_class()
@@ -0,0 +1,217 @@
+"""Bulk retrieval of Nyaa pages, parsed on a pool of processes.
+
+Parsing with `html5lib` is pure Python and bound by the CPU, so the threads
+of :meth:`nyaalib.NyaaClient.view_torrents` and
+:meth:`nyaalib.NyaaClient.iter_search` cannot parse more than about one core
+worth of pages at a time. A :class:`ParsePipeline` splits the work in two
+stages: threads of the client send the requests and read the bodies, and a
+pool of processes parses the pages and extracts their models, which are sent
+back pickled::
+
+    with ParsePipeline(client, parse_workers=8) as pipeline:
+        for torrent_stub in pipeline.iter_search(''):
+            ...
+
+The stages are joined by bounded queues (see
+:func:`nyaalib.concurrency.iter_pipelined`), so a full-catalog crawl holds a
+bounded number of pages in memory however fast the pages arrive.
+"""
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from . import (
+    BaseNyaaClient, _check_fields, _search_params, _view_params,
+)
+from .concurrency import iter_pipelined
+from .metrics import start_timer
+from .models import (
+    Category, SearchOrderKey, SearchSortKey, TorrentPageFailure,
+)
+
+# `ProcessPoolExecutor` only takes an `initializer` since Python 3.7
+_HAS_INITIALIZER = sys.version_info >= (3, 7)
+
+# the client of each parse process, see _init_worker
+_worker_client = None
+
+
+def _init_worker(url, parser, schema):
+    global _worker_client
+    _worker_client = BaseNyaaClient(url, parser, schema)
+
+
+def _get_worker_client(init_args):
+    # without an initializer, every call carries the arguments of
+    # _init_worker, which the first call of each process uses
+    if _worker_client is None:
+        _init_worker(*init_args)
+    return _worker_client
+
+
+def _parse_torrent_page(init_args, torrent_id, body, encoding, fields):
+    client = _get_worker_client(init_args)
+    content = client.parser.parse(body, encoding)
+    # the deferred fields are extracted here, when the page is pickled
+    return client._extract_torrent_page(torrent_id, content, fields)
+
+
+def _parse_search_result_page(init_args, body, encoding, terms, category,
+                              page, sort_key, order_key):
+    client = _get_worker_client(init_args)
+    content = client.parser.parse(body, encoding)
+    return client._extract_search_result_page(
+        content, terms, category, page, sort_key, order_key)
+
+
+class ParsePipeline(object):
+    """Fetches pages with the threads of a :class:`nyaalib.NyaaClient` and
+    parses them on a pool of processes.
+
+    The requests go through the session, rate limit, concurrency limit and
+    retry policy of the client, and are reported to its hooks without parse
+    and extract timings, since those happen in other processes. The cache of
+    the client is neither read nor written.
+    """
+
+    def __init__(self, client, fetch_workers=None, parse_workers=None,
+                 queue_size=None):
+        """
+        :param client: the :class:`nyaalib.NyaaClient` sending the requests;
+            its parser backend and schema are used by the parse processes,
+            so they must be picklable
+        :param fetch_workers: the number of threads sending requests,
+            defaulting to the size of the connection pool of the client
+        :param parse_workers: the number of parse processes, defaulting to
+            the number of CPUs
+        :param queue_size: the number of fetched pages that may wait for a
+            parse process, defaulting to `parse_workers`
+        """
+        self.client = client
+        self.fetch_workers = fetch_workers or client.pool_maxsize
+        self.parse_workers = parse_workers or multiprocessing.cpu_count()
+        if queue_size is None:
+            queue_size = self.parse_workers
+        self.queue_size = queue_size
+        init_args = (client.base_url, client.parser, client.schema)
+        if _HAS_INITIALIZER:
+            self._init_args = None
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.parse_workers, initializer=_init_worker,
+                initargs=init_args)
+        else:
+            self._init_args = init_args
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.parse_workers)
+
+    def close(self):
+        """Stop the parse processes."""
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _fetch(self, endpoint, params):
+        """Return the body and encoding of the page at `params`."""
+        with start_timer(self.client.hooks, endpoint, params) as timer:
+            r = self.client._get(params)
+            timer.fetched(r)
+        return r.content, r.encoding
+
+    def _iter_pipelined(self, fetch, parse, items, ordered):
+        return iter_pipelined(
+            fetch, parse, items, self.fetch_workers, self._executor,
+            self.parse_workers + self.queue_size, ordered=ordered)
+
+    def view_torrents(self, torrent_ids, ordered=False, fields=None):
+        """Retrieve and parse the torrent pages of many torrents, like
+        :meth:`nyaalib.NyaaClient.view_torrents`.
+
+        :param torrent_ids: an iterable of torrent IDs, consumed lazily
+        :param ordered: if `True`, yield in the order of `torrent_ids`;
+            otherwise yield each torrent page as soon as it is ready
+        :param fields: the attributes to extract, see
+            :meth:`nyaalib.NyaaClient.view_torrent`
+        :raises ValueError: if a field is unknown
+        :returns: a generator of :class:`TorrentPage` and
+            :class:`TorrentPageFailure` objects
+        """
+        fields = _check_fields(fields)
+
+        def fetch(torrent_id):
+            body, encoding = self._fetch('view', _view_params(torrent_id))
+            return self._init_args, torrent_id, body, encoding, fields
+
+        results = self._iter_pipelined(
+            fetch, _parse_torrent_page, torrent_ids, ordered)
+        try:
+            for torrent_id, future in results:
+                error = future.exception()
+                if error is not None:
+                    yield TorrentPageFailure(torrent_id, error)
+                else:
+                    yield future.result()
+        finally:
+            results.close()
+
+    def search_pages(self, terms, pages, category=Category.all_categories,
+                     sort_key=SearchSortKey.date,
+                     order_key=SearchOrderKey.descending, ordered=True):
+        """Retrieve and parse some pages of a search.
+
+        :param terms: the `str` needle
+        :param pages: an iterable of 1-based page numbers
+        :param category: the desired :class:`Category` of the results
+        :param sort_key: the :class:`SearchSortKey` of the results list
+        :param order_key: the :class:`SearchOrderkey` of the results list
+        :param ordered: if `True`, yield in the order of `pages`; otherwise
+            yield each page as soon as it is ready
+        :raises requests.RequestException: if a page cannot be retrieved
+        :returns: a generator of :class:`SearchResultPage` objects
+        """
+        def fetch(page):
+            body, encoding = self._fetch('search', _search_params(
+                terms, category, page, sort_key, order_key))
+            return (self._init_args, body, encoding, terms, category, page,
+                    sort_key, order_key)
+
+        results = self._iter_pipelined(
+            fetch, _parse_search_result_page, pages, ordered)
+        try:
+            for _, future in results:
+                yield future.result()
+        finally:
+            results.close()
+
+    def iter_search(self, terms, category=Category.all_categories,
+                    sort_key=SearchSortKey.date,
+                    order_key=SearchOrderKey.descending, max_pages=None,
+                    ordered=True):
+        """Iterate over the torrents on every page of a search, like
+        :meth:`nyaalib.NyaaClient.iter_search`.
+
+        :param max_pages: the maximum number of pages to fetch, or `None` for
+            all of them
+        :returns: a generator of :class:`TorrentStub` objects
+        """
+        [first_page] = self.search_pages(
+            terms, [1], category, sort_key, order_key)
+        for stub in first_page.torrent_stubs:
+            yield stub
+
+        last_page = first_page.total_pages
+        if max_pages is not None:
+            last_page = min(last_page, max_pages)
+
+        pages = self.search_pages(
+            terms, range(2, last_page + 1), category, sort_key, order_key,
+            ordered)
+        try:
+            for search_result_page in pages:
+                for stub in search_result_page.torrent_stubs:
+                    yield stub
+        finally:
+            pages.close()
@@ -0,0 +1,97 @@
+"""Reading the RSS feeds of Nyaa searches.
+
+A feed lists the same torrents as a search page in a fraction of the bytes,
+and as plain XML it can be parsed incrementally with
+:func:`xml.etree.ElementTree.iterparse` while it is downloaded, one `item` at
+a time, without building the whole tree.
+"""
+import collections
+import re
+from xml.etree import ElementTree
+
+from . import extract_url_query_parameter
+from .models import Category, TorrentStub
+
+# eg: "13 seeder(s), 1 leecher(s), 2398 download(s) - 322.8 MiB - Trusted"
+_DESCRIPTION = re.compile(
+    r'(\S+) seeder\(s\), (\S+) leecher\(s\), (\d+) download\(s\) - '
+    r'([^-]+?)(?: - |$)')
+
+
+def _category_slug(name):
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+
+
+def _build_category_names():
+    # the feeds only name the sub category of a torrent (eg: "Games"), and a
+    # few of those names are shared by several top level categories
+    categories = collections.defaultdict(list)
+    for category in Category:
+        if '__' in category.name:
+            categories[category.name.split('__', 1)[1]].append(category)
+    return dict(categories)
+
+
+_CATEGORY_NAMES = _build_category_names()
+
+
+def lookup_category(name, searched_category=Category.all_categories):
+    """Return the :class:`Category` of the display name of a sub category
+    in a feed (eg: "English-translated Anime"), or `None`.
+
+    :param name: the `str` name of the sub category
+    :param searched_category: the :class:`Category` of the search, which
+        resolves the names shared by several top level categories
+    """
+    categories = _CATEGORY_NAMES.get(_category_slug(name or ''), ())
+    if len(categories) > 1:
+        top_level = searched_category.value.split('_')[0]
+        categories = [c for c in categories
+                      if c.value.split('_')[0] == top_level]
+    if len(categories) != 1:
+        return None
+    return categories[0]
+
+
+def _int_or_none(text):
+    return int(text) if text.isdigit() else None
+
+
+def _extract_torrent_stub(item, searched_category):
+    torrent_id = extract_url_query_parameter(
+        item.findtext('guid', ''), 'tid')[0]
+    match = _DESCRIPTION.match(item.findtext('description', ''))
+    if match is not None:
+        seeders, leechers, downloads, file_size = match.groups()
+        seeders = _int_or_none(seeders)
+        leechers = _int_or_none(leechers)
+        downloads = int(downloads)
+    else:
+        seeders = leechers = downloads = file_size = None
+    return TorrentStub(
+        torrent_id, item.findtext('title'),
+        lookup_category(item.findtext('category'), searched_category),
+        seeders, leechers, file_size, downloads)
+
+
+def iter_torrent_stubs(source, searched_category=Category.all_categories):
+    """Parse a feed incrementally, yielding the :class:`TorrentStub` of each
+    `item` as soon as it has been read. Every `item` is discarded once it is
+    extracted, so the memory used does not grow with the size of the feed.
+
+    :param source: a binary file object of the feed, such as the raw stream
+        of a response
+    :param searched_category: the :class:`Category` of the search, see
+        :func:`lookup_category`
+    :returns: a generator of :class:`TorrentStub` objects
+    """
+    channel = None
+    for event, element in ElementTree.iterparse(
+            source, events=('start', 'end')):
+        if event == 'start':
+            if element.tag == 'channel':
+                channel = element
+        elif element.tag == 'item':
+            yield _extract_torrent_stub(element, searched_category)
+            if channel is not None:
+                channel.remove(element)
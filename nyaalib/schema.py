@@ -0,0 +1,278 @@
+"""Declarative descriptions of where the fields of Nyaa pages are.
+
+A :class:`SiteSchema` lists, for a Nyaa-like site, how to find each field
+of its search and torrent pages as a :class:`Field`: an optional cell index,
+an ElementPath, the attribute or text to read, a URL query parameter to take
+from it and a converter. Schemas are compiled once into extractors, so that
+extracting a row only costs one `findall` of its cells plus the lookups of
+its fields.
+
+:data:`NYAA_SCHEMA` describes nyaa.se, and is the default of the clients::
+
+    mirror_schema = NYAA_SCHEMA.replace(
+        view_fields=dict(NYAA_SCHEMA.view_fields,
+                         tracker=Field(cell=13)))
+    client = NyaaClient('http://nyaa.example', schema=mirror_schema)
+"""
+import datetime
+import functools
+import re
+try:
+    from urllib.parse import unquote_plus
+except ImportError:
+    # Python 2
+    from urllib import unquote_plus
+
+from .models import Category
+
+
+class Field(object):
+    """Where to find a field in an element, and how to convert it."""
+    __slots__ = (
+        'cell', 'path', 'attribute', 'query', 'converter', 'default',
+        'element', 'deferred',
+    )
+
+    def __init__(self, path=None, cell=None, attribute=None, query=None,
+                 converter=None, default=None, element=False,
+                 deferred=False):
+        """
+        :param path: an ElementPath, relative to the cell if `cell` is
+            given, otherwise relative to the row or page
+        :param cell: the `int` index of the cell the field is in, among the
+            cells of the row or page (see :class:`SiteSchema`)
+        :param attribute: the attribute to read, instead of the text
+        :param query: the URL query parameter to read from the value, eg:
+            `'tid'` for an `href` of `'/?page=view&tid=486766'`
+        :param converter: a callable converting the `str` value
+        :param default: the value when the element, attribute or query
+            parameter is missing
+        :param element: if `True`, the value is the element itself
+        :param deferred: if `True`, the extractor returns a callable that
+            extracts the field when called
+        """
+        self.path = path
+        self.cell = cell
+        self.attribute = attribute
+        self.query = query
+        self.converter = converter
+        self.default = default
+        self.element = element
+        self.deferred = deferred
+
+
+def _compile_query(parameter):
+    pattern = re.compile(
+        r'[?&;]{0}=([^&;#]*)'.format(re.escape(parameter)))
+
+    def read_query(url):
+        match = pattern.search(url)
+        if match is None:
+            return None
+        return unquote_plus(match.group(1))
+    return read_query
+
+
+def _compile_field(field):
+    """Return a function extracting `field` from an element and its cells."""
+    cell = field.cell
+    path = field.path
+    attribute = field.attribute
+    read_query = _compile_query(field.query) if field.query else None
+    converter = field.converter
+    default = field.default
+    as_element = field.element
+
+    def extract(context, cells):
+        element = context if cell is None else cells[cell]
+        if path is not None:
+            element = element.find(path)
+            if element is None:
+                return default
+        if as_element:
+            return element
+        if attribute is None:
+            value = element.text
+        else:
+            value = element.get(attribute)
+        if value is not None and read_query is not None:
+            value = read_query(value)
+        if value is None:
+            return default
+        if converter is not None:
+            value = converter(value)
+        return value
+    return extract
+
+
+class CompiledFields(object):
+    """An extractor of a set of :class:`Field` objects."""
+    __slots__ = ('cells', 'extractors', 'deferred')
+
+    def __init__(self, fields, cells=None):
+        """
+        :param fields: a `dict` of names to :class:`Field` objects
+        :param cells: the ElementPath of the cells indexed by the fields
+        """
+        self.cells = cells if any(
+            field.cell is not None for field in fields.values()) else None
+        self.extractors = [
+            (name, _compile_field(field))
+            for name, field in sorted(fields.items())
+            if not field.deferred]
+        self.deferred = [
+            (name, _compile_field(field))
+            for name, field in sorted(fields.items()) if field.deferred]
+
+    def extract(self, context):
+        """Extract the fields from an element.
+
+        :returns: a `dict` of the names of the fields to their values, or to
+            callables for the deferred fields
+        """
+        cells = None if self.cells is None else context.findall(self.cells)
+        values = dict((name, extract(context, cells))
+                      for name, extract in self.extractors)
+        for name, extract in self.deferred:
+            values[name] = functools.partial(extract, context, cells)
+        return values
+
+
+class SiteSchema(object):
+    """The layout of the search and torrent pages of a Nyaa-like site.
+
+    The fields of a search row are named after the attributes of
+    :class:`TorrentStub`, and those of a torrent page after the attributes
+    of :class:`TorrentPage`, except for `submitter`, which is made of
+    `submitter_id` and `submitter_name`. `description` must be an `element`
+    field; it is serialized by the parser of the client.
+    """
+
+    def __init__(self, rows, row_fields, total_pages, view_fields,
+                 row_class=None, row_cells='td', view_cells='.//td'):
+        """
+        :param rows: the ElementPath of the result rows of a search page,
+            relative to its content `div`
+        :param row_fields: a `dict` of the :class:`Field` objects of a row
+        :param total_pages: the :class:`Field` of the number of pages of a
+            search, relative to the content `div`
+        :param view_fields: a `dict` of the :class:`Field` objects of a
+            torrent page, relative to its content `div`
+        :param row_class: if set, only the rows whose `class` contains it are
+            results
+        :param row_cells: the ElementPath of the cells of a row
+        :param view_cells: the ElementPath of the cells of a torrent page
+        """
+        self.rows = rows
+        self.row_fields = row_fields
+        self.total_pages = total_pages
+        self.view_fields = view_fields
+        self.row_class = row_class
+        self.row_cells = row_cells
+        self.view_cells = view_cells
+        self._row_extractor = CompiledFields(row_fields, row_cells)
+        self._total_pages_extractor = CompiledFields(
+            {'total_pages': total_pages})
+        self._view_extractors = {}
+
+    def replace(self, **kwargs):
+        """Return a copy of the schema with some of its arguments replaced."""
+        arguments = dict(
+            rows=self.rows, row_fields=self.row_fields,
+            total_pages=self.total_pages, view_fields=self.view_fields,
+            row_class=self.row_class, row_cells=self.row_cells,
+            view_cells=self.view_cells)
+        arguments.update(kwargs)
+        return SiteSchema(**arguments)
+
+    def __reduce__(self):
+        # the compiled extractors are closures, which cannot be pickled, so
+        # an unpickled schema compiles them again
+        return (SiteSchema, (
+            self.rows, self.row_fields, self.total_pages, self.view_fields,
+            self.row_class, self.row_cells, self.view_cells))
+
+    def iter_rows(self, content):
+        """Yield the values of the fields of each result row of a search
+        page, as `dict` objects.
+        """
+        row_class = self.row_class
+        extract = self._row_extractor.extract
+        for row in content.iterfind(self.rows):
+            if row_class is None or row_class in row.get('class', ''):
+                yield extract(row)
+
+    def extract_total_pages(self, content):
+        return self._total_pages_extractor.extract(content)['total_pages']
+
+    def extract_view(self, content, fields):
+        """Extract some fields of a torrent page.
+
+        :param content: the content `div` of the page
+        :param fields: a `frozenset` or `tuple` of attributes of
+            :class:`TorrentPage`
+        :returns: a `dict` of field values
+        """
+        extractor = self._view_extractors.get(fields)
+        if extractor is None:
+            names = set(fields)
+            if 'submitter' in names:
+                names.update(['submitter_id', 'submitter_name'])
+            if 'size' in names:
+                names.add('file_size')
+            extractor = self._view_extractors[fields] = CompiledFields(
+                dict((name, field) for name, field in self.view_fields.items()
+                     if name in names),
+                self.view_cells)
+        return extractor.extract(content)
+
+
+def int_or_none(text):
+    """Convert a number that may be unknown (eg: `'?'`) to an `int` or
+    `None`.
+    """
+    return int(text) if text.isdigit() else None
+
+
+def parse_nyaa_date(text):
+    """Parse a date as displayed by Nyaa, eg: `'2013-10-26, 07:09 UTC'`."""
+    return datetime.datetime.strptime(text, '%Y-%m-%d, %H:%M %Z')
+
+
+NYAA_SCHEMA = SiteSchema(
+    rows='.//table//tr',
+    row_class='tlistrow',
+    row_fields={
+        'category': Field(cell=0, path='a', attribute='href', query='cats',
+                          converter=Category.lookup_category),
+        'tid': Field(cell=1, path='a', attribute='href', query='tid'),
+        'name': Field(cell=1, path='a'),
+        'file_size': Field(cell=3),
+        'seeders': Field(cell=4, converter=int_or_none),
+        'leechers': Field(cell=5, converter=int_or_none),
+        'downloads': Field(cell=6, converter=int),
+    },
+    # the pager is shown twice, above and below the results
+    total_pages=Field('.//div[@class="rightpages"]/a[2]', attribute='href',
+                      query='offset', converter=int, default=1),
+    view_fields={
+        'name': Field(cell=3),
+        'submitter_id': Field(cell=7, path='a', attribute='href',
+                              query='user'),
+        'submitter_name': Field(cell=7, path='a/span'),
+        'date_created': Field(cell=5, converter=parse_nyaa_date,
+                              deferred=True),
+        'tracker': Field(cell=11),
+        'file_size': Field(cell=21),
+        'category': Field(".//td[@class='viewcategory']/a[2]",
+                          attribute='href', query='cats',
+                          converter=Category.lookup_category),
+        'seeders': Field(".//span[@class='viewsn']", converter=int),
+        'leechers': Field(".//span[@class='viewln']", converter=int),
+        'downloads': Field(".//span[@class='viewdn']", converter=int),
+        # note that the tree returned by html5lib might not exactly match the
+        # original contents of the description div
+        'description': Field(".//div[@class='viewdescription']",
+                             element=True, deferred=True),
+    },
+)
@@ -0,0 +1,403 @@
+"""Tracking the swarm statistics of many torrents over time.
+
+A :class:`SwarmStatsTracker` refreshes the seeders, leechers and downloads
+of its tracked torrents from search pages, which list 100 torrents per
+request, and only views the torrent pages of the torrents it did not find
+in them::
+
+    tracker = SwarmStatsTracker(client)
+    tracker.track(torrent_ids)
+    tracker.refresh()
+    tracker.store.samples('486766', start=last_week)
+
+The samples are kept by a :class:`SwarmStatsStore`, which delta-encodes them
+into byte arrays: a sample whose statistics barely changed since the
+previous one, taken an hour later, costs 5 bytes.
+"""
+import array
+import bisect
+import time
+
+from .columnar import _INT64, _decode, _encode
+from .concurrency import iter_completed
+from .models import (
+    Category, SearchOrderKey, SearchSortKey, SWARM_STATS_FIELDS,
+    TorrentPageFailure,
+)
+
+# the number of samples encoded relative to each other; the first sample of
+# each block is encoded in full, so a range query decodes at most one block
+# of samples before its start
+BLOCK_SIZE = 64
+
+
+def _write_varint(data, value):
+    """Append an unsigned LEB128 varint to a `bytearray`."""
+    while value >= 0x80:
+        data.append((value & 0x7f) | 0x80)
+        value >>= 7
+    data.append(value)
+
+
+def _read_varint(data, offset):
+    """Return the varint at `offset` of a `bytearray`, and the offset after
+    it.
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _zigzag(value):
+    # map signed deltas to unsigned ones: 0, -1, 1, -2... to 0, 1, 2, 3...
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    return value // 2 if not value & 1 else -(value + 1) // 2
+
+
+class SwarmStatsSample(object):
+    """The swarm statistics of a torrent at some time."""
+    __slots__ = ('timestamp', 'seeders', 'leechers', 'downloads')
+
+    def __init__(self, timestamp, seeders, leechers, downloads):
+        """
+        :param timestamp: the `int` number of seconds since the epoch
+        :param seeders: the `int` number of seeders or None
+        :param leechers: the `int` number of leechers or None
+        :param downloads: the cumulative `int` number of downloads or None
+        """
+        self.timestamp = timestamp
+        self.seeders = seeders
+        self.leechers = leechers
+        self.downloads = downloads
+
+    def __eq__(self, other):
+        return (isinstance(other, SwarmStatsSample) and
+                all(getattr(self, name) == getattr(other, name)
+                    for name in self.__slots__))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return ("<SwarmStatsSample timestamp={0} seeders={1} leechers={2} "
+                "downloads={3}>").format(
+                    self.timestamp, self.seeders, self.leechers,
+                    self.downloads)
+
+
+class SwarmStatsSeries(object):
+    """The samples of one torrent, in time order, delta-encoded.
+
+    Each sample is stored as the varint differences of its timestamp and
+    statistics from those of the previous sample, in a `bytearray`. The
+    offset and timestamp of every :data:`BLOCK_SIZE` samples are indexed in
+    arrays, so that a range query starts decoding near its start.
+    """
+    __slots__ = ('data', 'block_offsets', 'block_timestamps', 'count',
+                 '_last')
+
+    def __init__(self):
+        self.data = bytearray()
+        self.block_offsets = array.array(_INT64)
+        self.block_timestamps = array.array(_INT64)
+        self.count = 0
+        self._last = None
+
+    def append(self, timestamp, seeders, leechers, downloads):
+        """Add a sample, which must not be older than the last one.
+
+        :raises ValueError: if `timestamp` is before the last sample
+        """
+        values = (int(timestamp), _encode(seeders), _encode(leechers),
+                  _encode(downloads))
+        if self._last is not None and values[0] < self._last[0]:
+            raise ValueError(
+                "Samples must be appended in time order: {0} < {1}".format(
+                    values[0], self._last[0]))
+        if self.count % BLOCK_SIZE == 0:
+            self.block_offsets.append(len(self.data))
+            self.block_timestamps.append(values[0])
+            previous = (0, 0, 0, 0)
+        else:
+            previous = self._last
+        for value, previous_value in zip(values, previous):
+            _write_varint(self.data, _zigzag(value - previous_value))
+        self._last = values
+        self.count += 1
+
+    def _iter_values(self, block):
+        data = self.data
+        offset = int(self.block_offsets[block])
+        remaining = self.count - block * BLOCK_SIZE
+        values = None
+        for index in range(remaining):
+            if index % BLOCK_SIZE == 0:
+                values = [0, 0, 0, 0]
+            for i in range(4):
+                delta, offset = _read_varint(data, offset)
+                values[i] += _unzigzag(delta)
+            yield values
+
+    def samples(self, start=None, end=None):
+        """Yield the samples taken between `start` and `end`, inclusive.
+
+        :param start: the `int` timestamp of the first sample, or `None`
+        :param end: the `int` timestamp of the last sample, or `None`
+        :returns: a generator of :class:`SwarmStatsSample` objects
+        """
+        if not self.count:
+            return
+        block = 0
+        if start is not None:
+            # the last block starting before `start` may hold samples taken at
+            # `start`, if several samples share the timestamp
+            block = max(
+                0, bisect.bisect_left(self.block_timestamps, start) - 1)
+        for timestamp, seeders, leechers, downloads in self._iter_values(
+                block):
+            if start is not None and timestamp < start:
+                continue
+            if end is not None and timestamp > end:
+                return
+            yield SwarmStatsSample(timestamp, _decode(seeders),
+                                   _decode(leechers), _decode(downloads))
+
+    @property
+    def latest(self):
+        """The last :class:`SwarmStatsSample`, or `None`."""
+        if self._last is None:
+            return None
+        timestamp, seeders, leechers, downloads = self._last
+        return SwarmStatsSample(timestamp, _decode(seeders),
+                                _decode(leechers), _decode(downloads))
+
+    @property
+    def nbytes(self):
+        """The number of bytes used by the encoded samples and their index.
+        """
+        return len(self.data) + (
+            len(self.block_offsets) + len(self.block_timestamps)) * \
+            self.block_offsets.itemsize
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return "<SwarmStatsSeries of {0} samples>".format(self.count)
+
+
+class SwarmStatsStore(object):
+    """The :class:`SwarmStatsSeries` of many torrents, by torrent ID."""
+
+    def __init__(self):
+        self.series = {}
+
+    def record(self, torrent_id, timestamp, seeders, leechers, downloads):
+        """Add a sample to the series of a torrent.
+
+        :param torrent_id: the ID of the torrent
+        :param timestamp: the `int` number of seconds since the epoch
+        :raises ValueError: if `timestamp` is before the last sample of the
+            torrent
+        """
+        tid = int(torrent_id)
+        series = self.series.get(tid)
+        if series is None:
+            series = self.series[tid] = SwarmStatsSeries()
+        series.append(timestamp, seeders, leechers, downloads)
+
+    def samples(self, torrent_id, start=None, end=None):
+        """Return the samples of a torrent between `start` and `end`,
+        inclusive. See :meth:`SwarmStatsSeries.samples`.
+
+        :returns: a `list` of :class:`SwarmStatsSample` objects
+        """
+        series = self.series.get(int(torrent_id))
+        if series is None:
+            return []
+        return list(series.samples(start, end))
+
+    def latest(self, torrent_id):
+        """Return the last :class:`SwarmStatsSample` of a torrent, or
+        `None`.
+        """
+        series = self.series.get(int(torrent_id))
+        return series.latest if series is not None else None
+
+    @property
+    def nbytes(self):
+        """The number of bytes used by the encoded samples of every torrent.
+        """
+        return sum(series.nbytes for series in self.series.values())
+
+    def __contains__(self, torrent_id):
+        return int(torrent_id) in self.series
+
+    def __len__(self):
+        return len(self.series)
+
+    def __repr__(self):
+        return "<SwarmStatsStore of {0} torrents>".format(len(self))
+
+
+class SwarmStatsRefresh(object):
+    """The outcome of a :meth:`SwarmStatsTracker.refresh`."""
+    __slots__ = ('timestamp', 'pages', 'from_search', 'from_view',
+                 'failures')
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.pages = 0
+        self.from_search = 0
+        self.from_view = 0
+        self.failures = []
+
+    def __repr__(self):
+        return ("<SwarmStatsRefresh pages={0} from_search={1} from_view={2} "
+                "failures={3}>").format(
+                    self.pages, self.from_search, self.from_view,
+                    len(self.failures))
+
+
+class SwarmStatsTracker(object):
+    """Samples the swarm statistics of tracked torrents into a
+    :class:`SwarmStatsStore`.
+
+    A refresh walks the search results newest first, collecting the
+    statistics of the tracked torrents listed on each page, until it passes
+    the oldest tracked torrent. The tracked torrents that were not listed
+    (eg: because they are outside of the `terms` or `category` of the
+    search) are then viewed one by one, extracting only
+    :data:`SWARM_STATS_FIELDS`. The samples are only recorded once every
+    search page was read, so a refresh that raises can be retried with the
+    same timestamp.
+
+    Refreshes bypass the client's cache, since they must see the latest
+    statistics.
+    """
+
+    def __init__(self, client, store=None, terms='',
+                 category=Category.all_categories, max_pages=None,
+                 workers=4):
+        """
+        :param client: the :class:`nyaalib.NyaaClient` used to search and
+            view torrents
+        :param store: the :class:`SwarmStatsStore` the samples are recorded
+            in, by default a new one
+        :param terms: the `str` needle of the searches, which should match
+            most of the tracked torrents
+        :param category: the :class:`Category` of the searches
+        :param max_pages: the maximum number of search pages read by a
+            refresh, or `None`
+        :param workers: the number of concurrent requests
+        """
+        self.client = client
+        self.store = store if store is not None else SwarmStatsStore()
+        self.terms = terms
+        self.category = category
+        self.max_pages = max_pages
+        self.workers = workers
+        self.tracked = set()
+
+    def track(self, torrent_ids):
+        """Add torrent IDs to the tracked torrents."""
+        self.tracked.update(int(torrent_id) for torrent_id in torrent_ids)
+
+    def untrack(self, torrent_ids):
+        """Remove torrent IDs from the tracked torrents. Their samples are
+        kept.
+        """
+        self.tracked.difference_update(
+            int(torrent_id) for torrent_id in torrent_ids)
+
+    def _fetch_page(self, page):
+        total_pages, stubs = self.client.fetch_search_page(
+            self.terms, self.category, page, SearchSortKey.date,
+            SearchOrderKey.descending)
+        return total_pages, list(stubs)
+
+    def _iter_pages(self):
+        """Yield the torrent stubs of each search page, newest first."""
+        total_pages, stubs = self._fetch_page(1)
+        yield stubs
+        if self.max_pages is not None:
+            total_pages = min(total_pages, self.max_pages)
+
+        pages = iter_completed(self._fetch_page, range(2, total_pages + 1),
+                               self.workers)
+        try:
+            for _, future in pages:
+                yield future.result()[1]
+        finally:
+            pages.close()
+
+    def _view_stats(self, torrent_id):
+        return self.client.view_torrent(
+            str(torrent_id), SWARM_STATS_FIELDS, use_cache=False)
+
+    def refresh(self, timestamp=None):
+        """Record a sample of every tracked torrent.
+
+        :param timestamp: the `int` timestamp of the samples, by default the
+            current time
+        :raises requests.RequestException: if a search page cannot be
+            retrieved
+        :returns: a :class:`SwarmStatsRefresh` counting the torrents found on
+            search pages and on their torrent pages, and holding a
+            :class:`TorrentPageFailure` per torrent that could not be viewed
+        """
+        if timestamp is None:
+            timestamp = int(time.time())
+        refresh = SwarmStatsRefresh(timestamp)
+        missing = set(self.tracked)
+        if not missing:
+            return refresh
+        # maps the torrent IDs to their `(seeders, leechers, downloads)`
+        samples = {}
+
+        oldest_tid = min(missing)
+        pages = self._iter_pages()
+        try:
+            for stubs in pages:
+                refresh.pages += 1
+                for stub in stubs:
+                    tid = int(stub.tid)
+                    if tid in missing:
+                        missing.remove(tid)
+                        samples[tid] = (
+                            stub.seeders, stub.leechers, stub.downloads)
+                        refresh.from_search += 1
+                if not missing or not stubs or \
+                        min(int(stub.tid) for stub in stubs) <= oldest_tid:
+                    break
+        finally:
+            pages.close()
+
+        results = iter_completed(self._view_stats, sorted(missing),
+                                 self.workers)
+        try:
+            for tid, future in results:
+                error = future.exception()
+                if error is not None:
+                    refresh.failures.append(
+                        TorrentPageFailure(str(tid), error))
+                    continue
+                torrent_page = future.result()
+                samples[tid] = (torrent_page.seeders, torrent_page.leechers,
+                                torrent_page.downloads)
+                refresh.from_view += 1
+        finally:
+            results.close()
+
+        for tid in sorted(samples):
+            self.store.record(tid, timestamp, *samples[tid])
+        return refresh
@@ -0,0 +1,214 @@
+"""A local, content-addressed store of `.torrent` files.
+
+Each `.torrent` file is stored once under its infohash, and a small index
+maps Nyaa torrent IDs to infohashes::
+
+    <root>/infohash/ab/ab0123...ef.torrent
+    <root>/tid/486766           (contains the infohash)
+"""
+import contextlib
+import errno
+import io
+import mmap
+import os
+import re
+import tempfile
+
+from .bencode import BencodeError, infohash
+from .models import Torrent
+
+_TORRENT_ID = re.compile(r'[0-9]+\Z')
+
+
+class TorrentStore(object):
+    """A directory of `.torrent` files keyed by torrent ID and infohash."""
+
+    def __init__(self, root, use_mmap=True):
+        """
+        :param root: the path of the directory of the store, which is created
+            if needed
+        :param use_mmap: if `True`, the :class:`Torrent` objects read from the
+            store hold a read-only :class:`mmap.mmap` of the file instead of
+            its `bytes`
+        """
+        self.root = root
+        self.use_mmap = use_mmap
+        for directory in ('infohash', 'tid', 'tmp'):
+            _makedirs(os.path.join(root, directory))
+
+    def _infohash_path(self, torrent_infohash):
+        return os.path.join(self.root, 'infohash', torrent_infohash[:2],
+                            torrent_infohash + '.torrent')
+
+    def _tid_path(self, torrent_id):
+        torrent_id = str(torrent_id)
+        # the ID is part of a path, so it must not be able to escape the index
+        if not _TORRENT_ID.match(torrent_id):
+            raise ValueError("Invalid torrent ID: {0!r}".format(torrent_id))
+        return os.path.join(self.root, 'tid', torrent_id)
+
+    def get_infohash(self, torrent_id):
+        """Return the infohash of a stored torrent, or `None`.
+
+        :raises ValueError: if `torrent_id` is not a number
+        """
+        try:
+            with io.open(self._tid_path(torrent_id), 'r') as f:
+                return f.read().strip()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+
+    def path(self, torrent_id=None, torrent_infohash=None):
+        """Return the path of a stored `.torrent` file, looked up by torrent
+        ID or by infohash, or `None` if it is not stored.
+        """
+        if torrent_infohash is None:
+            torrent_infohash = self.get_infohash(torrent_id)
+            if torrent_infohash is None:
+                return None
+        path = self._infohash_path(torrent_infohash)
+        if not os.path.exists(path):
+            return None
+        return path
+
+    def __contains__(self, torrent_id):
+        return self.path(torrent_id) is not None
+
+    def get(self, torrent_id=None, torrent_infohash=None):
+        """Read a stored torrent, looked up by torrent ID or by infohash.
+
+        :returns: a :class:`Torrent` whose `data` is an :class:`mmap.mmap` or
+            `bytes` depending on `use_mmap`, or `None` if it is not stored
+        """
+        path = self.path(torrent_id, torrent_infohash)
+        if path is None:
+            return None
+        with io.open(path, 'rb') as f:
+            if self.use_mmap:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = f.read()
+        return Torrent(torrent_id, data, path=path)
+
+    def add(self, torrent_id, data):
+        """Store the `.torrent` data of a torrent.
+
+        :param torrent_id: the ID of the torrent
+        :param data: the `bytes` of the `.torrent` file
+        :returns: the `str` infohash of the torrent
+        """
+        return self.add_chunks(torrent_id, [data])
+
+    def add_chunks(self, torrent_id, chunks):
+        """Store the `.torrent` data of a torrent from an iterable of `bytes`
+        chunks, without holding the whole file in memory.
+
+        :param torrent_id: the ID of the torrent
+        :param chunks: an iterable of `bytes`
+        :raises ValueError: if `torrent_id` is not a number
+        :raises nyaalib.bencode.BencodeError: if the data is empty or is not
+            a valid `.torrent` file
+        :returns: the `str` infohash of the torrent
+        """
+        # fail before reading any chunk
+        self._tid_path(torrent_id)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.join(self.root, 'tmp'), suffix='.torrent')
+        try:
+            with io.open(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                # an empty file cannot be mapped
+                if not f.tell():
+                    raise BencodeError("Empty torrent data")
+            with io.open(tmp_path, 'rb') as f:
+                torrent_infohash = _mapped_infohash(f)
+
+            path = self._infohash_path(torrent_infohash)
+            _makedirs(os.path.dirname(path))
+            _replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._write_tid_index(torrent_id, torrent_infohash)
+        return torrent_infohash
+
+    def _write_tid_index(self, torrent_id, torrent_infohash):
+        write_file_atomically(self._tid_path(torrent_id), torrent_infohash,
+                              tmp_dir=os.path.join(self.root, 'tmp'))
+
+
+def _mapped_infohash(f):
+    """Return the infohash of an open `.torrent` file, read through a memory
+    map.
+    """
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        try:
+            return infohash(data)
+        except BencodeError as e:
+            # the traceback keeps views of the map alive, and the map cannot
+            # be closed while they exist, so the error is raised without it
+            message = str(e)
+    finally:
+        data.close()
+    raise BencodeError(message)
+
+
+def write_file_atomically(path, text, tmp_dir=None):
+    """Write `text` to a file through a temporary file renamed over it, so
+    that the file is never seen partially written.
+
+    :param path: the path of the file
+    :param text: the `str` contents of the file, written as UTF-8
+    :param tmp_dir: the directory of the temporary file, which must be on
+        the same file system as `path`; by default the directory of `path`
+    """
+    # native strings (eg: of `hexdigest` or `json.dumps`) are already bytes
+    # on Python 2
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    with open_atomically(path, tmp_dir) as f:
+        f.write(text)
+
+
+@contextlib.contextmanager
+def open_atomically(path, tmp_dir=None):
+    """Open a temporary file that is renamed over `path` once the block
+    exits, or removed if the block raises, so that `path` is never seen
+    partially written.
+
+    :param path: the path of the file
+    :param tmp_dir: the directory of the temporary file, which must be on
+        the same file system as `path`; by default the directory of `path`
+    :returns: a context manager of the temporary binary file object
+    """
+    if tmp_dir is None:
+        tmp_dir = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with io.open(fd, 'wb') as f:
+            yield f
+        _replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _replace(source, destination):
+    # os.replace is not available on Python 2, where os.rename already
+    # overwrites the destination on POSIX systems
+    getattr(os, 'replace', os.rename)(source, destination)
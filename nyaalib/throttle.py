@@ -0,0 +1,183 @@
+"""Throttling the requests of :class:`nyaalib.NyaaClient`.
+
+* :class:`TokenBucket` caps the sustained request rate of every thread
+  sharing a client (or several clients sharing the bucket).
+* :class:`RetryPolicy` retries transient failures with jittered exponential
+  backoff.
+* :class:`AdaptiveConcurrencyLimiter` lowers the number of requests in flight
+  when errors or latency rise, and raises it again when they recover.
+"""
+import random
+import threading
+import time
+
+try:
+    # the clock used to measure durations, which never goes backwards
+    monotonic = time.monotonic
+except AttributeError:
+    # Python 2
+    monotonic = time.time
+
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class TokenBucket(object):
+    """A thread-safe token bucket rate limiter.
+
+    Tokens are added at `rate` per second, up to `capacity`; every request
+    takes one, waiting for it if the bucket is empty.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        :param rate: the sustained number of requests per second
+        :param capacity: the largest burst of requests, defaulting to `rate`
+            (but at least 1)
+        :raises ValueError: if `rate` or `capacity` is not positive
+        """
+        if rate <= 0:
+            raise ValueError("The rate must be positive: {0}".format(rate))
+        if capacity is not None and capacity <= 0:
+            raise ValueError(
+                "The capacity must be positive: {0}".format(capacity))
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None
+                              else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Take `tokens` tokens, sleeping until they are available.
+
+        :raises ValueError: if `tokens` is more than the bucket can hold,
+            since they would never be available
+        :returns: the number of seconds spent waiting
+        """
+        if tokens > self.capacity:
+            raise ValueError(
+                "Cannot take {0} tokens from a bucket of {1}".format(
+                    tokens, self.capacity))
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class RetryPolicy(object):
+    """Decides which failed requests are retried, and how long to wait
+    before each retry.
+    """
+
+    def __init__(self, max_retries=3, backoff_factor=0.5, max_backoff=30.0,
+                 statuses=RETRY_STATUSES):
+        """
+        :param max_retries: the maximum `int` number of retries of a request
+        :param backoff_factor: the base delay in seconds; the delay before
+            retry `n` (from 0) is drawn uniformly from
+            `[0, backoff_factor * 2 ** n]` ("full jitter")
+        :param max_backoff: the maximum delay in seconds
+        :param statuses: the HTTP status codes that are retried. Connection
+            errors and timeouts are always retried.
+        """
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.statuses = frozenset(statuses)
+
+    def is_retryable(self, response):
+        """Return whether a response has a transient error status."""
+        return response.status_code in self.statuses
+
+    def backoff(self, retry, response=None):
+        """Return the number of seconds to wait before retry number `retry`
+        (0-based), honoring a `Retry-After` header in seconds.
+        """
+        if response is not None:
+            retry_after = response.headers.get('retry-after', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        ceiling = min(self.max_backoff, self.backoff_factor * 2 ** retry)
+        return random.uniform(0, ceiling)
+
+
+class AdaptiveConcurrencyLimiter(object):
+    """Limits the number of requests in flight with an additive-increase,
+    multiplicative-decrease (AIMD) limit.
+
+    Every successful, fast enough request raises the limit by `1 / limit`
+    (about one per round of requests); a failure, or a request slower than
+    `latency_target`, multiplies it by `decrease_factor`, at most once per
+    `cooldown` seconds.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=32,
+                 latency_target=None, decrease_factor=0.5, cooldown=1.0):
+        """
+        :param initial: the initial limit
+        :param minimum: the lowest limit
+        :param maximum: the highest limit
+        :param latency_target: the number of seconds above which a request
+            counts as a sign of overload, or `None` to only react to errors
+        :param decrease_factor: the factor the limit is multiplied by when
+            overload is detected
+        :param cooldown: the minimum number of seconds between two decreases
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._last_decrease = None
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        """The current `int` limit of requests in flight."""
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def acquire(self):
+        """Wait until a request may be sent."""
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, success, latency=None):
+        """Record the outcome of a request sent after :meth:`acquire`.
+
+        :param success: `False` if the request failed with a transient error
+        :param latency: the number of seconds the request took
+        """
+        overloaded = not success or (
+            self.latency_target is not None and latency is not None and
+            latency > self.latency_target)
+        with self._condition:
+            self._in_flight -= 1
+            now = monotonic()
+            if overloaded:
+                if (self._last_decrease is None or
+                        now - self._last_decrease >= self.cooldown):
+                    self._limit = max(
+                        self.minimum, self._limit * self.decrease_factor)
+                    self._last_decrease = now
+            else:
+                self._limit = min(
+                    self.maximum, self._limit + 1.0 / self._limit)
+            self._condition.notify_all()
@@ -0,0 +1,103 @@
+"""Polling Nyaa for torrents uploaded since the last poll."""
+import io
+import json
+import os
+
+from .models import Category, SearchOrderKey, SearchSortKey
+from .store import write_file_atomically
+
+
+class NewTorrentWatcher(object):
+    """Finds the torrents uploaded since the previous poll.
+
+    The watcher keeps a high-water mark: the largest torrent ID it has seen.
+    Each poll walks the search results newest first and stops at the first
+    torrent at or below the mark, even in the middle of a page, so in the
+    steady state a poll costs one request and the extraction of only the new
+    rows.
+
+    Polls bypass the client's cache, since they must see the latest uploads.
+    """
+
+    def __init__(self, client, terms='', category=Category.all_categories,
+                 state_path=None, max_pages=10):
+        """
+        :param client: the :class:`nyaalib.NyaaClient` used to search
+        :param terms: the `str` needle of the watched search
+        :param category: the :class:`Category` of the watched search
+        :param state_path: the path of an optional JSON file the high-water
+            mark and the gaps are loaded from and saved to after every poll
+        :param max_pages: the maximum number of pages walked by one poll. The
+            first poll, before anything has been seen, only reads one page.
+        """
+        self.client = client
+        self.terms = terms
+        self.category = category
+        self.state_path = state_path
+        self.max_pages = max_pages
+        self.last_seen_tid = None
+        # the `(last_seen_tid, oldest_read_tid)` ranges of torrent IDs, both
+        # excluded, that polls could not read, oldest first
+        self.gaps = []
+        if state_path is not None and os.path.exists(state_path):
+            with io.open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.last_seen_tid = state['last_seen_tid']
+            self.gaps = [tuple(gap) for gap in state.get('gaps', ())]
+
+    def poll(self):
+        """Yield the :class:`TorrentStub` of each new torrent, newest first.
+
+        The high-water mark is only advanced (and saved) once the generator
+        is exhausted, so torrents are not skipped if the caller stops early;
+        they are yielded again by the next poll instead.
+
+        If `max_pages` pages are read without reaching the torrents seen
+        before, the torrents uploaded between them and the oldest torrent
+        read are not yielded. The range of torrent IDs that was not read is
+        then appended to `gaps`, for the caller to backfill (and remove), and
+        the mark still advances so that the next poll catches up.
+
+        :returns: a generator of :class:`TorrentStub` objects
+        """
+        last_seen_tid = self.last_seen_tid
+        first_poll = last_seen_tid is None
+        max_pages = 1 if first_poll else self.max_pages
+        newest_tid = oldest_tid = None
+        reached_seen = False
+
+        page = 1
+        total_pages = 1
+        while not reached_seen and page <= min(total_pages, max_pages):
+            total_pages, torrent_stubs = self.client.fetch_search_page(
+                self.terms, self.category, page, SearchSortKey.date,
+                SearchOrderKey.descending)
+            for stub in torrent_stubs:
+                tid = int(stub.tid)
+                if not first_poll and tid <= last_seen_tid:
+                    reached_seen = True
+                    break
+                if newest_tid is None or tid > newest_tid:
+                    newest_tid = tid
+                if oldest_tid is None or tid < oldest_tid:
+                    oldest_tid = tid
+                yield stub
+            page += 1
+
+        if newest_tid is None or newest_tid == last_seen_tid:
+            return
+        if not (first_poll or reached_seen or page > total_pages):
+            self.gaps.append((last_seen_tid, oldest_tid))
+        self.last_seen_tid = newest_tid
+        self.save()
+
+    def save(self):
+        """Atomically write the high-water mark and the gaps to
+        `state_path`, if set.
+        """
+        if self.state_path is None:
+            return
+        write_file_atomically(self.state_path, json.dumps({
+            'last_seen_tid': self.last_seen_tid,
+            'gaps': [list(gap) for gap in self.gaps],
+        }))
@@ -29,7 +29,17 @@ setup(
     packages=find_packages(),
     install_requires=[
         'enum34',
+        'futures; python_version < "3.2"',
         'html5lib',
         'requests',
     ],
+    extras_require={
+        'async': ['httpx'],
+        'lxml': ['lxml'],
+    },
+    entry_points={
+        'console_scripts': [
+            'nyaalib = nyaalib.cli:main',
+        ],
+    },
 )
@@ -0,0 +1,85 @@
+"""Helpers shared by the tests (and the benchmarks), which import them with
+`from conftest import ...`.
+"""
+import codecs
+import os
+import re
+import sys
+
+
+collect_ignore = []
+if sys.version_info < (3, 7):
+    # async/await syntax and asyncio.run
+    collect_ignore.append('test_aio.py')
+
+here = os.path.dirname(os.path.abspath(__file__))
+pages_dir = os.path.join(here, 'fixtures', 'pages')
+nyaa_url = 'http://www.nyaa.se'
+page_filenames = sorted(
+    filename for filename in os.listdir(pages_dir)
+    if filename.endswith('.html'))
+search_page_filename = 'search_love_live_seeders_descending.html'
+
+_ROW = re.compile(r'<tr class="[^"]*tlistrow">.*?</tr>', re.S)
+_TID = re.compile(r'tid=(\d+)')
+_LAST_PAGE = re.compile(r'offset=\d+(">&#62;&#62;</a>)')
+
+
+def get_page_contents(filename):
+    """Return the text of a page fixture."""
+    file_path = os.path.join(pages_dir, filename)
+    with codecs.open(file_path, encoding='utf-8') as f:
+        return f.read()
+
+
+def get_page_bytes(filename):
+    """Return the bytes of a page fixture."""
+    with open(os.path.join(pages_dir, filename), 'rb') as f:
+        return f.read()
+
+
+def search_page_rows():
+    """Return the `list` of the HTML rows of the recorded search page."""
+    return _ROW.findall(get_page_contents(search_page_filename))
+
+
+def row_tid(row):
+    """Return the `int` torrent ID of an HTML row of a search page."""
+    return int(_TID.search(row).group(1))
+
+
+def with_row_tid(row, tid):
+    """Return an HTML row of a search page with another torrent ID."""
+    return _TID.sub('tid={0}'.format(tid), row)
+
+
+def make_search_page(rows, total_pages=None):
+    """Build a search page listing the HTML `rows` instead of those of the
+    recorded search page.
+
+    :param rows: an iterable of HTML rows, eg: from :func:`search_page_rows`
+    :param total_pages: the `int` number of pages the pager links to, or
+        `None` to keep the pager of the recorded page
+    :returns: the `str` page
+    """
+    html = get_page_contents(search_page_filename)
+    recorded_rows = _ROW.findall(html)
+    start = html.index(recorded_rows[0])
+    end = html.index(recorded_rows[-1]) + len(recorded_rows[-1])
+    html = html[:start] + ''.join(rows) + html[end:]
+    if total_pages is not None:
+        html = _LAST_PAGE.sub(r'offset={0}\1'.format(total_pages), html)
+    return html
+
+
+def flatten(element):
+    """Flatten an element tree into comparable tuples.
+
+    html5lib inserts the implied `tbody` elements while lxml does not, and
+    the extraction code never depends on them, so they are skipped.
+    """
+    return [
+        (elem.tag, sorted(elem.attrib.items()), (elem.text or '').strip(),
+         (elem.tail or '').strip())
+        for elem in element.iter()
+        if isinstance(elem.tag, str) and elem.tag != 'tbody']
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from nyaalib import Category, TorrentNotFoundError
+
+httpx = pytest.importorskip('httpx')
+from nyaalib.aio import AsyncNyaaClient  # noqa: E402
+from conftest import get_page_bytes, nyaa_url
+
+
+def make_client(handler, **kwargs):
+    transport = httpx.MockTransport(handler)
+    return AsyncNyaaClient(
+        nyaa_url, client=httpx.AsyncClient(transport=transport), **kwargs)
+
+
+def test_view_torrent():
+    def handler(request):
+        assert request.url.params['tid'] == '486766'
+        return httpx.Response(
+            200, content=get_page_bytes('view_tid_486766.html'))
+
+    async def view():
+        async with make_client(handler) as client:
+            return await client.view_torrent('486766')
+
+    torrent_page = asyncio.run(view())
+    assert torrent_page.name == '[FFF] Love Live! [BD][720p-AAC]'
+    assert torrent_page.category == Category.anime__english_translated_anime
+    assert torrent_page.seeders == 47
+
+
+def test_view_invalid_torrent():
+    def handler(request):
+        return httpx.Response(
+            200, content=get_page_bytes('view_tid_not_found.html'))
+
+    async def view():
+        async with make_client(handler, offload_parsing=False) as client:
+            return await client.view_torrent('486766invalid')
+
+    with pytest.raises(TorrentNotFoundError):
+        asyncio.run(view())
+
+
+def test_get_torrent():
+    def handler(request):
+        if request.url.params['tid'] == '1':
+            return httpx.Response(
+                200, content=b'd4:infod4:name1:aee',
+                headers={'content-type': 'application/x-bittorrent'})
+        return httpx.Response(200, content=b'<html></html>')
+
+    async def download():
+        async with make_client(handler) as client:
+            torrent = await client.get_torrent('1')
+            with pytest.raises(TorrentNotFoundError):
+                await client.get_torrent('2')
+            return torrent
+
+    assert asyncio.run(download()).data == b'd4:infod4:name1:aee'
+
+
+def test_concurrent_searches_are_bounded():
+    in_flight = [0]
+    max_in_flight = [0]
+
+    async def handler(request):
+        in_flight[0] += 1
+        max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+        await asyncio.sleep(0.01)
+        in_flight[0] -= 1
+        return httpx.Response(
+            200, content=get_page_bytes('search_no_torrents_found.html'))
+
+    async def search_many():
+        async with make_client(handler, max_concurrency=2) as client:
+            return await asyncio.gather(
+                *[client.search('terms', page=page) for page in range(6)])
+
+    search_result_pages = asyncio.run(search_many())
+    assert [p.page for p in search_result_pages] == list(range(6))
+    assert all(not p.torrent_stubs for p in search_result_pages)
+    assert max_in_flight[0] == 2
@@ -0,0 +1,74 @@
+import hashlib
+
+import pytest
+
+from nyaalib import Torrent
+from nyaalib.bencode import BencodeDict, BencodeError, BencodeList, decode
+
+
+multi_file_info = (
+    b'd5:filesld6:lengthi3e4:pathl3:dir5:a.mkveed6:lengthi4e4:pathl5:b.mkvee'
+    b'e4:name4:show12:piece lengthi16384e6:pieces20:' + b'x' * 20 + b'e')
+multi_file_torrent = b'd8:announce9:udp://a:14:info' + multi_file_info + b'e'
+
+
+def test_decode_values():
+    assert decode(b'i-42e') == -42
+    assert decode(b'4:spam').tobytes() == b'spam'
+
+    value = decode(b'l4:spami1eld1:ai2eeee')
+    assert isinstance(value, BencodeList)
+    assert len(value) == 3
+    assert value[0].tobytes() == b'spam'
+    assert value[-2] == 1
+    assert value[2][0][b'a'] == 2
+
+
+def test_decode_is_lazy_and_zero_copy():
+    data = bytearray(multi_file_torrent)
+    metainfo = decode(data)
+    assert isinstance(metainfo, BencodeDict)
+    assert sorted(metainfo) == [b'announce', b'info']
+
+    info = metainfo[b'info']
+    assert info._items is None
+    pieces = info[b'pieces']
+    assert info[b'files']._items is None
+    assert info.raw.tobytes() == multi_file_info
+
+    # the strings are views of the original data
+    data[-3] = ord('y')
+    assert pieces.tobytes() == b'x' * 19 + b'y'
+
+
+def test_decode_invalid_data():
+    for data, message in (
+            (b'', 'Unexpected end of data'),
+            (b'i1', 'Unterminated integer at 0'),
+            (b'li1', 'Unterminated integer at 1'),
+            (b'5:spam', 'String at 0 overruns the data'),
+            (b'l5:spa', 'String at 1 overruns the data'),
+            (b'd4:spami1e', 'Unexpected end of data'),
+            (b'i1ei2e', 'Trailing data at 3'),
+            (b'e', 'Unexpected end at 0'),
+            (b'x', 'Invalid string length at 0'),
+            (b'di1ei2ee', 'Dictionary key at 1 is not a string'),
+            (b'dl1:ae1:be', 'Dictionary key at 1 is not a string'),
+            (b'd1:ae', 'Missing dictionary value at 4')):
+        with pytest.raises(BencodeError) as excinfo:
+            decode(data)
+        assert str(excinfo.value) == message
+
+
+def test_torrent_metainfo():
+    torrent = Torrent('1', multi_file_torrent)
+    assert torrent.infohash == hashlib.sha1(multi_file_info).hexdigest()
+    # the infohash reuses the decoded metainfo
+    assert torrent._metainfo is not None
+    assert torrent.files == [(u'dir/a.mkv', 3), (u'b.mkv', 4)]
+    assert torrent.total_size == 7
+
+    single_file_torrent = Torrent(
+        '2', b'd4:infod6:lengthi5e4:name5:c.mkvee')
+    assert single_file_torrent.files == [(u'c.mkv', 5)]
+    assert single_file_torrent.total_size == 5
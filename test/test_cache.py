@@ -0,0 +1,141 @@
+import requests_mock
+
+from nyaalib import NyaaClient
+from nyaalib.cache import DiskCache, LRUCache, ResponseCache
+from conftest import get_page_contents, nyaa_url
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats.as_dict() == {'hits': 3, 'misses': 1, 'evictions': 1}
+
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache()
+    cache.set('stale', 1, ttl=-1)
+    cache.set('fresh', 2, ttl=60)
+    assert cache.get('stale') is None
+    assert cache.get('fresh') == 2
+
+
+def test_disk_cache_persists(tmpdir):
+    path = str(tmpdir.join('cache.sqlite'))
+    cache = DiskCache(path)
+    cache.set('key', {'value': 1})
+    cache.set('expired', 2, ttl=-1)
+    cache.close()
+
+    cache = DiskCache(path)
+    assert cache.get('key') == {'value': 1}
+    assert cache.get('expired') is None
+    assert cache.purge() == 1
+    assert len(cache) == 1
+
+
+def test_view_torrent_is_cached_until_swarm_stats_expire():
+    cache = ResponseCache(stats_ttl=60)
+    client = NyaaClient(nyaa_url, cache=cache)
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents('view_tid_486766.html'))
+        first_page = client.view_torrent('486766')
+        second_page = client.view_torrent('486766')
+        assert m.call_count == 1
+
+        cache.memory.delete(u'view:stats:486766')
+        third_page = client.view_torrent('486766')
+        assert m.call_count == 2
+
+    assert second_page.name == first_page.name
+    assert second_page.seeders == first_page.seeders == 47
+    # only the swarm statistics are extracted again, the rest is cached
+    assert third_page.seeders == 47
+    assert third_page.description == first_page.description
+    assert cache.stats()['memory']['hits'] == 3
+
+
+def test_cached_torrent_pages_do_not_hold_parsed_pages():
+    cache = ResponseCache()
+    client = NyaaClient(nyaa_url, cache=cache)
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents('view_tid_486766.html'))
+        client.view_torrent('486766')
+
+    metadata = cache.get_torrent_metadata('486766')
+    assert metadata._deferred is None
+    assert metadata.seeders is None
+    assert metadata.description.startswith(b'<div class="viewdescription">')
+
+
+def test_live_views_and_search_pages_bypass_the_cache():
+    cache = ResponseCache()
+    client = NyaaClient(nyaa_url, cache=cache)
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents('view_tid_486766.html'))
+        client.view_torrent('486766')
+        client.view_torrent('486766', use_cache=False)
+        assert m.call_count == 2
+
+        m.get(nyaa_url, text=get_page_contents(
+            'search_love_live_seeders_descending.html'))
+        client.search('love live')
+        total_pages, torrent_stubs = client.fetch_search_page('love live')
+        assert m.call_count == 4
+
+    assert total_pages == 3
+    assert next(torrent_stubs).tid == '486766'
+
+
+def test_search_results_refresh_swarm_stats():
+    cache = ResponseCache()
+    client = NyaaClient(nyaa_url, cache=cache)
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents(
+            'search_love_live_seeders_descending.html'))
+        search_result_page = client.search('love live')
+        assert client.search('love live') is search_result_page
+        client.search('love live', page=2)
+        assert m.call_count == 2
+
+    stub = search_result_page.torrent_stubs[0]
+    assert cache.memory.get(u'view:stats:' + stub.tid) == \
+        (stub.seeders, stub.leechers, stub.downloads)
+
+
+def test_torrent_metadata_is_read_back_from_disk(tmpdir):
+    path = str(tmpdir.join('cache.sqlite'))
+    client = NyaaClient(nyaa_url, cache=ResponseCache(path=path))
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents('view_tid_486766.html'))
+        client.view_torrent('486766')
+
+    cache = ResponseCache(path=path)
+    cache.set_swarm_stats('486766', 1, 2, 3)
+    torrent_page = cache.get_torrent_page('486766')
+    assert torrent_page.name == '[FFF] Love Live! [BD][720p-AAC]'
+    assert torrent_page.submitter.name == 'FFF'
+    assert (torrent_page.seeders, torrent_page.leechers,
+            torrent_page.downloads) == (1, 2, 3)
+    assert cache.stats()['disk']['hits'] == 1
+
+
+def test_view_torrent_is_served_from_disk_after_restart(tmpdir):
+    path = str(tmpdir.join('cache.sqlite'))
+    client = NyaaClient(nyaa_url, cache=ResponseCache(path=path))
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents('view_tid_486766.html'))
+        client.view_torrent('486766')
+
+        client = NyaaClient(nyaa_url, cache=ResponseCache(path=path))
+        torrent_page = client.view_torrent('486766')
+        assert m.call_count == 1
+
+    assert torrent_page.name == '[FFF] Love Live! [BD][720p-AAC]'
+    assert torrent_page.seeders == 47
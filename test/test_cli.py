@@ -0,0 +1,139 @@
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+import requests
+import requests_mock
+
+from nyaalib.cli import main
+from conftest import get_page_contents, nyaa_url
+
+
+def run(argv):
+    stream = io.StringIO()
+    status = main(argv, stream)
+    lines = stream.getvalue().splitlines()
+    return status, [json.loads(line) for line in lines]
+
+
+def test_search_writes_one_stub_per_line():
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents(
+            'search_love_live_seeders_descending.html'))
+        status, records = run([
+            'search', 'love live', '--category', 'anime', '--sort',
+            'seeders'])
+        assert m.last_request.qs['term'] == ['love live']
+        assert m.last_request.qs['cats'] == ['1_0']
+        assert m.last_request.qs['sort'] == ['2']
+
+    assert status == 0
+    assert len(records) == 100
+    assert records[0] == {
+        'tid': '486766',
+        'name': '[FFF] Love Live! [BD][720p-AAC]',
+        'category': 'anime__english_translated_anime',
+        'seeders': 47,
+        'leechers': 13,
+        'downloads': 18441,
+        'file_size': '6.72 GiB',
+        'size': 7215545057,
+    }
+
+
+def test_crawl_reads_every_page():
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents(
+            'search_love_live_seeders_descending.html'))
+        status, records = run(['--workers', '2', 'crawl', '--max-pages', '2'])
+        assert m.call_count == 2
+
+    assert status == 0
+    assert len(records) == 200
+
+
+def test_view_writes_pages_and_reports_failures(capsys):
+    found_page = get_page_contents('view_tid_486766.html')
+    not_found_page = get_page_contents('view_tid_not_found.html')
+
+    def view_page(request, context):
+        if request.qs['tid'] == ['486766']:
+            return found_page
+        return not_found_page
+
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=view_page)
+        status, records = run([
+            'view', '486766', '1', '--fields', 'seeders,date_created'])
+
+    assert status == 1
+    assert records == [{
+        'tid': '486766', 'seeders': 47, 'date_created': '2013-10-26T07:09:00',
+    }]
+    assert capsys.readouterr().err.startswith('nyaalib: 1: ')
+
+
+def test_download_writes_torrent_files(tmpdir):
+    output_dir = str(tmpdir.join('torrents'))
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, content=b'd4:infod4:name1:aee',
+              headers={'content-type': 'application/x-bittorrent'})
+        status, records = run(
+            ['download', '486766', '--output-dir', output_dir])
+
+    path = os.path.join(output_dir, '486766.torrent')
+    assert status == 0
+    assert records == [{'tid': '486766', 'path': path, 'size': 19}]
+    with open(path, 'rb') as f:
+        assert f.read() == b'd4:infod4:name1:aee'
+
+
+class BrokenBody(io.BytesIO):
+    """A response body whose connection is lost after its first chunk."""
+
+    def read(self, *args, **kwargs):
+        if self.tell():
+            raise requests.ConnectionError('connection reset')
+        return io.BytesIO.read(self, 4)
+
+
+def test_download_reports_each_failed_torrent(tmpdir, capsys):
+    output_dir = str(tmpdir)
+
+    def download(request, context):
+        context.headers['content-type'] = 'application/x-bittorrent'
+        if request.qs['tid'] == ['2']:
+            return BrokenBody(b'd4:infod4:name1:aee')
+        return io.BytesIO(b'd4:infod4:name1:aee')
+
+    # the file of 1 cannot be renamed over a directory
+    os.mkdir(os.path.join(output_dir, '1.torrent'))
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, body=download)
+        status, records = run(
+            ['download', '1', '2', '3', '--output-dir', output_dir])
+
+    assert status == 1
+    assert [record['tid'] for record in records] == ['3']
+    err = capsys.readouterr().err.splitlines()
+    assert [line.split(':')[1] for line in err] == [' 1', ' 2']
+    # no temporary or partial file is left behind
+    assert sorted(os.listdir(output_dir)) == ['1.torrent', '3.torrent']
+
+
+def test_invalid_arguments_exit_with_usage(capsys):
+    with pytest.raises(SystemExit):
+        main(['view', '486766', '--fields', 'not_a_field'])
+    assert 'unknown fields: not_a_field' in capsys.readouterr().err
+
+
+def test_import_does_not_import_heavy_dependencies():
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys, nyaalib.cli; '
+        'print(sorted(set(["requests", "html5lib", "lxml"]) & '
+        'set(sys.modules)))'])
+    assert output.strip() == b'[]'
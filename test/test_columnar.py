@@ -0,0 +1,60 @@
+from nyaalib import Category, TorrentStub, columnar
+from nyaalib.columnar import MISSING, TorrentStubTable
+from nyaalib.models import parse_file_size
+
+
+def make_stubs():
+    return [
+        TorrentStub('3', 'c', Category.anime, 5, 1, '1.5 GiB', 10),
+        TorrentStub('1', 'a', Category.audio, None, None, '700 MiB', 30),
+        TorrentStub('2', 'b', None, 9, 2, '12 KiB', 20),
+    ]
+
+
+def test_parse_file_size():
+    assert parse_file_size('6.72 GiB') == 7215545057
+    assert parse_file_size('512 B') == 512
+    assert parse_file_size('12 KiB') == 12288
+    assert parse_file_size('a lot') is None
+    assert parse_file_size(None) is None
+
+
+def test_table_round_trips_stubs():
+    stubs = make_stubs()
+    table = TorrentStubTable(stubs)
+
+    assert len(table) == 3
+    assert list(table.column('tid')) == [3, 1, 2]
+    assert list(table.column('seeders')) == [5, MISSING, 9]
+    assert list(table.column('size')) == [1610612736, 734003200, 12288]
+    for stub, row in zip(stubs, table):
+        for name in TorrentStub.__slots__:
+            assert getattr(stub, name) == getattr(row, name)
+
+
+def test_table_of_floats_round_trips_stubs(monkeypatch):
+    # the columns of Python 2 builds without a 64-bit integer array
+    monkeypatch.setattr(columnar, '_INT64', 'd')
+    stubs = make_stubs()
+    table = TorrentStubTable(stubs)
+
+    assert table.column('tid').typecode == 'd'
+    for stub, row in zip(stubs, table):
+        for name in TorrentStub.__slots__:
+            assert getattr(stub, name) == getattr(row, name)
+            assert type(getattr(stub, name)) is type(getattr(row, name))
+
+
+def test_table_sort_filter_and_top_k():
+    table = TorrentStubTable(make_stubs())
+
+    assert table.argsort('seeders') == [1, 0, 2]
+    assert [row.tid for row in table.sorted_by('size', reverse=True)] == \
+        ['3', '1', '2']
+    assert table.where('seeders', minimum=0) == [0, 2]
+    assert table.where('size', maximum=1024 ** 3) == [1, 2]
+    assert table.top_k('downloads', 2) == [1, 2]
+
+    subset = table.take([2, 0])
+    assert list(subset.column('tid')) == [2, 3]
+    assert subset.names == ['b', 'c']
@@ -0,0 +1,114 @@
+import requests_mock
+
+from nyaalib import Category, NyaaClient, SearchOrderKey, SearchSortKey
+from nyaalib.index import TorrentIndex
+from nyaalib.models import SWARM_STATS_FIELDS, TorrentStub
+from conftest import get_page_contents, nyaa_url
+
+
+def fetch_pages():
+    client = NyaaClient(nyaa_url)
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents(
+            'search_love_live_seeders_descending.html'))
+        search_result_page = client.search('love live')
+        m.get(nyaa_url, text=get_page_contents('view_tid_486766.html'))
+        torrent_page = client.view_torrent('486766')
+    return search_result_page, torrent_page
+
+
+def test_search_matches_the_search_page():
+    search_result_page, _ = fetch_pages()
+    index = TorrentIndex(batch_size=7)
+    assert index.add_search_result_pages([search_result_page]) == 100
+    assert len(index) == 100
+
+    result = index.search('love live', sort_key=SearchSortKey.seeders)
+    assert result.total_pages == 1
+    assert [stub.seeders for stub in result.torrent_stubs] == \
+        sorted((stub.seeders for stub in search_result_page.torrent_stubs),
+               reverse=True)
+    indexed = dict((stub.tid, stub) for stub in result.torrent_stubs)
+    for stub in search_result_page.torrent_stubs:
+        for name in TorrentStub.__slots__:
+            assert getattr(indexed[stub.tid], name) == getattr(stub, name)
+
+
+def test_search_filters_sorts_and_paginates():
+    index = TorrentIndex()
+    index.add_torrent_stubs([
+        TorrentStub('1', u'[A] Love Live! - 01', Category.anime__raw_anime,
+                    10, 1, u'100 MiB', 5),
+        TorrentStub('2', u'[B] Love Live! - 02',
+                    Category.anime__english_translated_anime, 30, 2,
+                    u'1 GiB', 7),
+        TorrentStub('3', u'[C] Lovely Complex', Category.audio__lossy_audio,
+                    None, None, u'50 MiB', 1),
+    ])
+
+    def tids(**kwargs):
+        return [stub.tid for stub in index.search(**kwargs).torrent_stubs]
+
+    assert tids() == ['3', '2', '1']
+    assert tids(order_key=SearchOrderKey.ascending) == ['1', '2', '3']
+    assert tids(terms='love live') == ['2', '1']
+    assert tids(terms='lov') == ['3', '2', '1']
+    assert tids(terms='"Live!" -') == ['2', '1']
+    assert tids(terms='live OR complex') == []
+    assert tids(category=Category.anime) == ['2', '1']
+    assert tids(category=Category.anime__raw_anime) == ['1']
+    assert tids(category=Category.audio) == ['3']
+    assert tids(sort_key=SearchSortKey.size) == ['2', '1', '3']
+
+    first_page = index.search(per_page=2)
+    second_page = index.search(per_page=2, page=2)
+    assert first_page.total_pages == second_page.total_pages == 2
+    assert [stub.tid for stub in second_page.torrent_stubs] == ['1']
+
+
+def test_torrent_pages_survive_stub_updates(tmpdir):
+    search_result_page, torrent_page = fetch_pages()
+    path = str(tmpdir.join('index.db'))
+    index = TorrentIndex(path)
+    index.add_torrent_pages([torrent_page])
+    index.add_search_result_pages([search_result_page])
+    index.close()
+
+    index = TorrentIndex(path)
+    indexed_page = index.get_torrent_page('486766')
+    for name in ('tid', 'name', 'category', 'tracker', 'date_created',
+                 'file_size', 'size', 'description'):
+        assert getattr(indexed_page, name) == getattr(torrent_page, name)
+    assert indexed_page.submitter.name == torrent_page.submitter.name
+    # the swarm statistics come from the newer search page
+    stub = [stub for stub in search_result_page.torrent_stubs
+            if stub.tid == '486766'][0]
+    assert indexed_page.seeders == stub.seeders
+
+    other_tid = search_result_page.torrent_stubs[1].tid
+    assert other_tid in index
+    assert index.get_torrent_page(other_tid) is None
+
+    index.delete('486766')
+    assert '486766' not in index
+    assert '486766' not in [
+        stub.tid for stub in index.search('FFF BD 720p').torrent_stubs]
+
+
+def test_partial_torrent_pages_keep_the_other_fields(tmpdir):
+    _, torrent_page = fetch_pages()
+    client = NyaaClient(nyaa_url)
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents('view_tid_486766.html'))
+        stats_page = client.view_torrent('486766', fields=SWARM_STATS_FIELDS)
+    assert stats_page.name is None
+
+    index = TorrentIndex(str(tmpdir.join('index.db')))
+    index.add_torrent_pages([torrent_page])
+    index.add_torrent_pages([stats_page])
+    indexed_page = index.get_torrent_page('486766')
+    for name in ('name', 'category', 'description', 'seeders'):
+        assert getattr(indexed_page, name) == getattr(torrent_page, name)
+    assert indexed_page.submitter.name == torrent_page.submitter.name
+    assert '486766' in [
+        stub.tid for stub in index.search('FFF BD 720p').torrent_stubs]
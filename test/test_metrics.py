@@ -0,0 +1,117 @@
+import io
+
+import pytest
+import requests
+import requests_mock
+
+from nyaalib import NyaaClient, TorrentNotFoundError
+from nyaalib.metrics import NULL_TIMER, Histogram, MetricsRecorder, start_timer
+from conftest import get_page_contents, nyaa_url
+
+
+torrent_data = b'd4:infodee'
+torrent_headers = {'content-type': 'application/x-bittorrent'}
+
+
+def test_no_hooks_uses_the_null_timer():
+    assert start_timer([], 'view', {}) is NULL_TIMER
+    chunks = iter([b'a'])
+    assert NULL_TIMER.count(chunks) is chunks
+
+
+def test_events_are_sent_to_hooks():
+    events = []
+    client = NyaaClient(nyaa_url, hooks=[events.append])
+    page = get_page_contents('view_tid_486766.html')
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=page)
+        client.view_torrent('486766')
+        m.get(nyaa_url, text=get_page_contents(
+            'search_love_live_seeders_descending.html'))
+        client.search('love live')
+        m.get(nyaa_url, content=torrent_data, headers=torrent_headers)
+        client.get_torrent('1')
+        client.get_torrent('1', dest=io.BytesIO(), chunk_size=3)
+
+    view, search, download, streamed_download = events
+    assert view.endpoint == 'view'
+    assert view.params == {'page': 'view', 'tid': '486766'}
+    assert view.status == 200
+    assert view.bytes_received == len(page.encode('utf-8'))
+    for event in (view, search):
+        assert event.network >= 0
+        assert event.parse >= 0
+        assert event.extract >= 0
+        assert event.total >= event.network
+    assert search.endpoint == 'search'
+    assert search.params['term'] == 'love live'
+
+    for event in (download, streamed_download):
+        assert event.endpoint == 'download'
+        assert event.bytes_received == len(torrent_data)
+        assert event.parse is None
+        assert event.extract is None
+
+
+def test_metrics_recorder_aggregates_events():
+    recorder = MetricsRecorder()
+    client = NyaaClient(nyaa_url)
+    client.hooks.append(recorder)
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents('view_tid_486766.html'))
+        client.view_torrent('486766')
+        client.view_torrent('486766')
+        m.get(nyaa_url, content=torrent_data, headers=torrent_headers)
+        client.get_torrent('1')
+
+    counters = recorder.snapshot()['counters']
+    assert counters['requests'] == 3
+    assert counters['requests.view'] == 2
+    assert counters['status.200.download'] == 1
+    assert counters['bytes_received.download'] == len(torrent_data)
+    assert recorder.histogram('view', 'parse').count == 2
+    assert recorder.histogram('download', 'parse').count == 0
+    assert 'view.extract' in recorder.snapshot()['histograms']
+
+    recorder.reset()
+    assert recorder.snapshot() == {'counters': {}, 'histograms': {}}
+
+
+def test_failed_requests_are_recorded():
+    recorder = MetricsRecorder()
+    client = NyaaClient(nyaa_url, hooks=[recorder])
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents('view_tid_not_found.html'))
+        with pytest.raises(TorrentNotFoundError):
+            client.view_torrent('1')
+        m.get(nyaa_url, text='<html></html>')
+        with pytest.raises(TorrentNotFoundError):
+            client.get_torrent('1')
+        m.get(nyaa_url, exc=requests.ConnectionError)
+        with pytest.raises(requests.ConnectionError):
+            client.search('love live')
+
+    counters = recorder.snapshot()['counters']
+    assert counters['requests'] == 3
+    assert counters['errors'] == 3
+    assert counters['error.TorrentNotFoundError.view'] == 1
+    assert counters['status.200.download'] == 1
+    assert counters['error.ConnectionError.search'] == 1
+    assert 'status.None' not in counters
+    assert recorder.histogram('search', 'total').count == 1
+
+
+def test_histogram_percentiles():
+    histogram = Histogram(buckets=(1, 2, 5))
+    for value in (0.5, 1.5, 1.5, 3, 100):
+        histogram.observe(value)
+
+    assert histogram.count == 5
+    assert histogram.min == 0.5
+    assert histogram.max == 100
+    assert histogram.mean == 106.5 / 5
+    assert histogram.percentile(0.2) == 1
+    assert histogram.percentile(0.5) == 2
+    assert histogram.percentile(0.8) == 5
+    assert histogram.percentile(1) == 100
+    assert Histogram().percentile(0.5) is None
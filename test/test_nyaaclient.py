@@ -1,22 +1,21 @@
-import codecs
 import datetime
-import os
+import itertools
+import pickle
+import threading
+import time
+from concurrent.futures import TimeoutError
 
 import pytest
+import requests
 import requests_mock
 
 from nyaalib import (
-    Category, NyaaClient, SearchOrderKey, SearchSortKey, TorrentNotFoundError,
+    Category, NyaaClient, SearchOrderKey, SearchSortKey, SWARM_STATS_FIELDS,
+    TorrentNotFoundError, TorrentPage, TorrentPageFailure,
 )
-
-
-here = os.path.dirname(os.path.abspath(__file__))
-nyaa_url = 'http://www.nyaa.se'
-
-def get_page_contents(filename):
-    file_path = os.path.join(here, 'fixtures', 'pages', filename)
-    with codecs.open(file_path, encoding='utf-8') as f:
-        return f.read()
+from nyaalib.concurrency import SingleFlight
+from nyaalib.models import parse_file_size
+from conftest import get_page_contents, nyaa_url
 
 
 def test_invalid_torrent_id():
@@ -52,6 +51,47 @@ def test_valid_torrent_id():
     assert torrent_page.leechers == 12
     assert torrent_page.downloads == 17786
     assert torrent_page.file_size == '6.72 GiB'
+    assert torrent_page.size == 7215545057
+
+
+def test_view_torrent_fields():
+    client = NyaaClient(nyaa_url)
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents('view_tid_486766.html'))
+        stats = client.view_torrent('486766', fields=SWARM_STATS_FIELDS)
+        sized = client.view_torrent('486766', fields=['name', 'size'])
+        with pytest.raises(ValueError):
+            client.view_torrent('486766', fields=['seeders', 'magnet'])
+
+    assert (stats.seeders, stats.leechers, stats.downloads) == \
+        (47, 12, 17786)
+    for name in ('name', 'submitter', 'category', 'tracker', 'date_created',
+                 'file_size', 'size', 'description'):
+        assert getattr(stats, name) is None
+    assert sized.name == '[FFF] Love Live! [BD][720p-AAC]'
+    assert sized.size == 7215545057
+    assert sized.file_size is None
+    assert sized.seeders is None
+
+
+def test_view_torrent_defers_expensive_fields():
+    client = NyaaClient(nyaa_url)
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents('view_tid_486766.html'))
+        torrent_page = client.view_torrent('486766')
+
+    assert set(torrent_page._deferred) == set(['date_created', 'description'])
+    assert torrent_page.description.startswith(b'<div')
+    assert set(torrent_page._deferred) == set(['date_created'])
+
+    # pickling computes the deferred fields
+    unpickled = pickle.loads(pickle.dumps(torrent_page))
+    assert unpickled.date_created == datetime.datetime(2013, 10, 26, 7, 9)
+    assert unpickled.description == torrent_page.description
+    assert not torrent_page._deferred
+
+    torrent_page.description = u'replaced'
+    assert torrent_page.description == u'replaced'
 
 
 def test_no_torrents_found():
@@ -91,6 +131,34 @@ def test_search_sort_by_seeders_descending():
         previous_stub = stub
 
 
+def test_search_result_page_local_sort_and_filter():
+    client = NyaaClient(nyaa_url)
+    with requests_mock.mock() as m:
+        mocked_page_output = get_page_contents(
+            'search_love_live_seeders_descending.html')
+        m.get(nyaa_url, text=mocked_page_output)
+        search_result_page = client.search('love live')
+
+    stubs = search_result_page.torrent_stubs
+    assert all(stub.size == parse_file_size(stub.file_size) for stub in stubs)
+
+    by_size = search_result_page.sorted_by('size', reverse=True)
+    assert len(by_size) == len(stubs)
+    assert [stub.size for stub in by_size] == \
+        sorted((stub.size for stub in stubs), reverse=True)
+
+    large = search_result_page.filter(min_size=1024 ** 3, min_seeders=10)
+    assert large
+    assert all(stub.size >= 1024 ** 3 and stub.seeders >= 10
+               for stub in large)
+    assert len(large) == len([
+        stub for stub in stubs
+        if stub.size >= 1024 ** 3 and stub.seeders >= 10])
+
+    with pytest.raises(ValueError):
+        search_result_page.sorted_by('name')
+
+
 def test_search_sort_by_seeders_ascending():
     client = NyaaClient(nyaa_url)
     with requests_mock.mock() as m:
@@ -114,3 +182,193 @@ def test_search_sort_by_seeders_ascending():
         if previous_stub.seeders is not None and stub.seeders is not None:
             assert previous_stub.seeders <= stub.seeders
         previous_stub = stub
+
+
+def test_get_torrent_uses_injected_session():
+    session = requests.Session()
+    client = NyaaClient(nyaa_url, session=session)
+    assert client.session is session
+
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, content=b'd4:infod4:name1:aee',
+              headers={'content-type': 'application/x-bittorrent'})
+        torrent = client.get_torrent('486766')
+
+    assert torrent.tid == '486766'
+    assert torrent.data == b'd4:infod4:name1:aee'
+    assert m.last_request.qs == {'page': ['download'], 'tid': ['486766']}
+
+
+def test_sessions_share_one_connection_pool_across_threads():
+    client = NyaaClient(nyaa_url, pool_maxsize=4)
+    sessions = []
+
+    def grab_session():
+        sessions.append(client.session)
+
+    threads = [threading.Thread(target=grab_session) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(id(session) for session in sessions)) == 3
+    adapters = set(id(session.get_adapter(nyaa_url)) for session in sessions)
+    assert adapters == set([id(client._adapter)])
+    client.close()
+
+
+def test_iter_search_fetches_every_page():
+    client = NyaaClient(nyaa_url)
+    with requests_mock.mock() as m:
+        mocked_page_output = get_page_contents(
+            'search_love_live_seeders_descending.html')
+        m.get(nyaa_url, text=mocked_page_output)
+        torrent_stubs = list(client.iter_search('love live', workers=2))
+        requested_pages = sorted(
+            int(request.qs['offset'][0]) for request in m.request_history)
+
+    assert requested_pages == [1, 2, 3]
+    assert len(torrent_stubs) == 300
+
+
+def test_iter_search_stops_early():
+    client = NyaaClient(nyaa_url)
+    with requests_mock.mock() as m:
+        mocked_page_output = get_page_contents(
+            'search_love_live_seeders_descending.html')
+        m.get(nyaa_url, text=mocked_page_output)
+        torrent_stubs = list(itertools.islice(
+            client.iter_search('love live', max_pages=2), 10))
+
+        assert len(torrent_stubs) == 10
+        assert m.call_count == 1
+
+
+def test_view_torrents_reports_failures_per_torrent():
+    found_page = get_page_contents('view_tid_486766.html')
+    not_found_page = get_page_contents('view_tid_not_found.html')
+
+    def view_page(request, context):
+        if request.qs['tid'] == ['486766']:
+            return found_page
+        return not_found_page
+
+    client = NyaaClient(nyaa_url)
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=view_page)
+        results = list(client.view_torrents(
+            ['486766', 'missing', '486766'], workers=2, ordered=True))
+
+    assert [result.tid for result in results] == \
+        ['486766', 'missing', '486766']
+    assert isinstance(results[0], TorrentPage)
+    assert isinstance(results[1], TorrentPageFailure)
+    assert isinstance(results[1].error, TorrentNotFoundError)
+    assert results[2].name == '[FFF] Love Live! [BD][720p-AAC]'
+
+
+def test_view_torrents_deadline():
+    found_page = get_page_contents('view_tid_486766.html')
+    release = threading.Event()
+    timeouts = []
+
+    def view_page(request, context):
+        timeouts.append(request.timeout)
+        if request.qs['tid'][0].startswith('slow'):
+            release.wait(5)
+        return found_page
+
+    # the mocker serializes the requests of every session behind one lock,
+    # so mount an adapter on a session instead to send them concurrently
+    adapter = requests_mock.Adapter()
+    adapter.register_uri('GET', nyaa_url, text=view_page)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    client = NyaaClient(nyaa_url, session=session)
+    start = time.time()
+    try:
+        results = list(client.view_torrents(
+            ['slow1', '486766', 'slow2', 'slow3'], workers=2, timeout=0.5))
+    finally:
+        release.set()
+
+    assert time.time() - start < 2
+    results = dict((result.tid, result) for result in results)
+    assert isinstance(results['486766'], TorrentPage)
+    for torrent_id in ('slow1', 'slow2', 'slow3'):
+        assert isinstance(results[torrent_id], TorrentPageFailure)
+        assert isinstance(results[torrent_id].error, TimeoutError)
+    # the requests in flight at the deadline time out by then
+    assert len(timeouts) == 3
+    for timeout in timeouts:
+        assert max(timeout) <= 0.5
+
+
+def test_concurrent_views_are_coalesced():
+    view_page = get_page_contents('view_tid_486766.html')
+    started = threading.Event()
+
+    def slow_view_page(request, context):
+        started.set()
+        time.sleep(0.2)
+        return view_page
+
+    client = NyaaClient(nyaa_url, coalesce=True)
+    results = []
+
+    def view():
+        results.append(client.view_torrent('486766'))
+
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=slow_view_page)
+        threads = [threading.Thread(target=view)]
+        threads[0].start()
+        started.wait()
+        threads.extend(threading.Thread(target=view) for _ in range(4))
+        for thread in threads[1:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert m.call_count == 1
+
+        # once the call returns, the next one is sent again
+        client.view_torrent(486766)
+        assert m.call_count == 2
+
+    assert len(results) == 5
+    assert all(result is results[0] for result in results)
+    assert client.single_flight.stats.as_dict() == \
+        {'calls': 6, 'coalesced': 4}
+
+
+def test_coalesced_calls_share_exceptions():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def fail():
+        started.set()
+        release.wait()
+        raise TorrentNotFoundError('missing')
+
+    def call():
+        try:
+            single_flight.do('key', fail)
+        except TorrentNotFoundError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    while single_flight.stats.calls < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 3
+    assert single_flight.stats.coalesced == 2
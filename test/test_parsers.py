@@ -0,0 +1,76 @@
+import pickle
+
+import pytest
+import requests_mock
+
+from nyaalib import NyaaClient
+from nyaalib.parsers import Html5libParser, get_parser
+from conftest import flatten, get_page_bytes, nyaa_url, page_filenames
+
+
+pytest.importorskip('lxml')
+
+
+def stub_fields(stub):
+    return dict((name, getattr(stub, name)) for name in stub.__slots__)
+
+
+@pytest.mark.parametrize('filename', page_filenames)
+def test_backends_find_the_same_content_div(filename):
+    content = get_page_bytes(filename)
+    html5lib_div = get_parser('html5lib').parse(content, 'utf-8')
+    lxml_div = get_parser('lxml').parse(content, 'utf-8')
+
+    assert html5lib_div is not None
+    assert lxml_div is not None
+    assert flatten(html5lib_div) == flatten(lxml_div)
+
+
+def test_backends_extract_the_same_torrent_page():
+    torrent_pages = []
+    for parser in ('html5lib', 'lxml'):
+        client = NyaaClient(nyaa_url, parser=parser)
+        with requests_mock.mock() as m:
+            m.get(nyaa_url, content=get_page_bytes('view_tid_486766.html'))
+            torrent_pages.append(client.view_torrent('486766'))
+
+    html5lib_page, lxml_page = torrent_pages
+    for attribute in ('tid', 'name', 'category', 'tracker', 'date_created',
+                      'seeders', 'leechers', 'downloads', 'file_size'):
+        assert getattr(html5lib_page, attribute) == \
+            getattr(lxml_page, attribute)
+    assert html5lib_page.submitter.uid == lxml_page.submitter.uid
+    assert lxml_page.description.startswith(b'<div class="viewdescription">')
+
+
+@pytest.mark.parametrize('filename', [
+    'search_love_live_seeders_ascending.html',
+    'search_love_live_seeders_descending.html',
+    'search_no_torrents_found.html',
+])
+def test_backends_extract_the_same_search_results(filename):
+    search_result_pages = []
+    for parser in ('html5lib', 'lxml'):
+        client = NyaaClient(nyaa_url, parser=parser)
+        with requests_mock.mock() as m:
+            m.get(nyaa_url, content=get_page_bytes(filename))
+            search_result_pages.append(client.search('love live'))
+
+    html5lib_results, lxml_results = search_result_pages
+    assert html5lib_results.total_pages == lxml_results.total_pages
+    assert [stub_fields(stub) for stub in html5lib_results.torrent_stubs] == \
+        [stub_fields(stub) for stub in lxml_results.torrent_stubs]
+
+
+def test_get_parser():
+    backend = Html5libParser()
+    assert get_parser(backend) is backend
+    assert isinstance(get_parser('html5lib'), Html5libParser)
+    with pytest.raises(ValueError):
+        get_parser('not_a_parser')
+
+
+def test_lxml_parser_is_picklable():
+    parser = pickle.loads(pickle.dumps(get_parser('lxml')))
+    assert parser.parse(get_page_bytes('view_tid_486766.html'), 'utf-8') \
+        is not None
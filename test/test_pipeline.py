@@ -0,0 +1,164 @@
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+
+import pytest
+import requests
+import requests_mock
+
+from nyaalib import (
+    NyaaClient, SWARM_STATS_FIELDS, TorrentNotFoundError, TorrentPage,
+    TorrentPageFailure,
+)
+from nyaalib.concurrency import iter_pipelined
+from nyaalib.metrics import MetricsRecorder
+from nyaalib import pipeline as pipeline_module
+from nyaalib.pipeline import ParsePipeline
+from conftest import get_page_contents, nyaa_url
+
+
+def test_pipeline_views_torrents():
+    found_page = get_page_contents('view_tid_486766.html')
+    not_found_page = get_page_contents('view_tid_not_found.html')
+
+    def view_page(request, context):
+        if request.qs['tid'] == ['486766']:
+            return found_page
+        return not_found_page
+
+    recorder = MetricsRecorder()
+    client = NyaaClient(nyaa_url, hooks=[recorder])
+    with requests_mock.mock() as m, \
+            ParsePipeline(client, fetch_workers=2, parse_workers=2) \
+            as pipeline:
+        m.get(nyaa_url, text=view_page)
+        results = list(pipeline.view_torrents(
+            ['486766', 'missing', '486766'], ordered=True))
+
+    assert [result.tid for result in results] == \
+        ['486766', 'missing', '486766']
+    assert isinstance(results[0], TorrentPage)
+    assert results[0].name == '[FFF] Love Live! [BD][720p-AAC]'
+    assert results[0].submitter.name == 'FFF'
+    assert results[0].description.startswith(b'<div')
+    assert isinstance(results[1], TorrentPageFailure)
+    assert isinstance(results[1].error, TorrentNotFoundError)
+    assert recorder.counters['requests.view'] == 3
+    assert recorder.histogram('view', 'parse').count == 0
+
+
+def test_pipeline_views_some_fields():
+    client = NyaaClient(nyaa_url)
+    with requests_mock.mock() as m, \
+            ParsePipeline(client, fetch_workers=1, parse_workers=1) \
+            as pipeline:
+        m.get(nyaa_url, text=get_page_contents('view_tid_486766.html'))
+        [torrent_page] = pipeline.view_torrents(
+            ['486766'], fields=SWARM_STATS_FIELDS)
+
+    assert torrent_page.seeders == 47
+    assert torrent_page.name is None
+    assert torrent_page.description is None
+
+
+def test_pipeline_without_initializer(monkeypatch):
+    # the parse processes of Python < 3.7 get the client with every call
+    monkeypatch.setattr(pipeline_module, '_HAS_INITIALIZER', False)
+    client = NyaaClient(nyaa_url)
+    with requests_mock.mock() as m, \
+            ParsePipeline(client, fetch_workers=1, parse_workers=1) \
+            as pipeline:
+        m.get(nyaa_url, text=get_page_contents('view_tid_486766.html'))
+        torrent_pages = list(pipeline.view_torrents(['486766', '486766']))
+
+    assert [page.seeders for page in torrent_pages] == [47, 47]
+
+
+def test_pipeline_iter_search_fetches_every_page():
+    client = NyaaClient(nyaa_url)
+    with requests_mock.mock() as m, \
+            ParsePipeline(client, fetch_workers=2, parse_workers=2) \
+            as pipeline:
+        m.get(nyaa_url, text=get_page_contents(
+            'search_love_live_seeders_descending.html'))
+        torrent_stubs = list(pipeline.iter_search('love live'))
+        requested_pages = sorted(
+            int(request.qs['offset'][0]) for request in m.request_history)
+
+        expected = client.search('love live').torrent_stubs
+
+    assert requested_pages == [1, 2, 3]
+    assert len(torrent_stubs) == 300
+    assert [stub.tid for stub in torrent_stubs[:100]] == \
+        [stub.tid for stub in expected]
+
+
+def test_pipeline_search_raises_request_errors():
+    client = NyaaClient(nyaa_url)
+    with requests_mock.mock() as m, \
+            ParsePipeline(client, fetch_workers=1, parse_workers=1) \
+            as pipeline:
+        m.get(nyaa_url, exc=requests.ConnectionError)
+        with pytest.raises(requests.ConnectionError):
+            list(pipeline.search_pages('love live', [1, 2]))
+
+
+def test_iter_pipelined_bounds_the_parse_queue():
+    lock = threading.Lock()
+    state = {'parsing': 0, 'max_parsing': 0}
+
+    def parse(item):
+        with lock:
+            state['parsing'] += 1
+            state['max_parsing'] = max(state['max_parsing'], state['parsing'])
+        time.sleep(0.01)
+        with lock:
+            state['parsing'] -= 1
+        return item * 2
+
+    executor = ThreadPoolExecutor(max_workers=8)
+    try:
+        results = list(iter_pipelined(
+            lambda item: (item,), parse, range(20), fetch_workers=4,
+            parse_executor=executor, parse_slots=2))
+    finally:
+        executor.shutdown()
+
+    assert [(item, future.result()) for item, future in results] == \
+        [(item, item * 2) for item in range(20)]
+    assert state['max_parsing'] <= 2
+
+
+def test_iter_pipelined_reports_fetch_errors():
+    def fetch(item):
+        if item == 1:
+            raise ValueError(item)
+        return (item,)
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        results = dict(iter_pipelined(
+            fetch, str, range(3), fetch_workers=2, parse_executor=executor,
+            parse_slots=1, ordered=False))
+    finally:
+        executor.shutdown()
+
+    assert results[0].result() == '0'
+    assert isinstance(results[1].exception(), ValueError)
+    assert results[2].result() == '2'
+
+
+def test_iter_pipelined_reports_cancelled_parses():
+    class CancellingExecutor(object):
+        def submit(self, function, *args):
+            future = Future()
+            future.cancel()
+            return future
+
+    results = list(iter_pipelined(
+        lambda item: (item,), str, range(3), fetch_workers=2,
+        parse_executor=CancellingExecutor(), parse_slots=1))
+
+    assert [item for item, _ in results] == [0, 1, 2]
+    for _, future in results:
+        assert isinstance(future.exception(), CancelledError)
@@ -0,0 +1,89 @@
+import io
+
+import requests_mock
+
+from nyaalib import Category, NyaaClient, SearchSortKey
+from nyaalib.metrics import MetricsRecorder
+from nyaalib.rss import iter_torrent_stubs, lookup_category
+from conftest import get_page_contents, nyaa_url
+
+
+def stub_fields(stub):
+    return dict((name, getattr(stub, name)) for name in stub.__slots__)
+
+
+def test_search_rss_matches_the_search_page():
+    client = NyaaClient(nyaa_url)
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents(
+            'search_love_live_seeders_descending.html'))
+        search_result_page = client.search('love live')
+        m.get(nyaa_url, text=get_page_contents('rss_love_live.xml'))
+        stubs = list(client.search_rss(
+            'love live', Category.anime__english_translated_anime,
+            SearchSortKey.seeders))
+        assert m.last_request.qs['page'] == ['rss']
+        assert m.last_request.qs['cats'] == ['1_37']
+        assert m.last_request.qs['sort'] == ['2']
+
+    assert len(stubs) == 100
+    assert [stub_fields(stub) for stub in stubs] == \
+        [stub_fields(stub) for stub in search_result_page.torrent_stubs]
+
+
+def test_search_rss_is_lazy():
+    client = NyaaClient(nyaa_url)
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents('rss_love_live.xml'))
+        stubs = client.search_rss('love live')
+        assert m.call_count == 0
+        assert next(stubs).tid == '486766'
+        stubs.close()
+        assert m.call_count == 1
+
+
+def test_search_rss_reports_to_hooks():
+    recorder = MetricsRecorder()
+    client = NyaaClient(nyaa_url, hooks=[recorder])
+    feed = get_page_contents('rss_love_live.xml').encode('utf-8')
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, content=feed)
+        list(client.search_rss('love live'))
+
+    counters = recorder.snapshot()['counters']
+    assert counters['requests.rss'] == 1
+    assert counters['bytes_received.rss'] == len(feed)
+
+
+def test_items_are_discarded_once_extracted():
+    feed = (u'<rss><channel><title>t</title>'
+            u'<item><title>a</title><guid>?page=view&amp;tid=1</guid>'
+            u'<description>? seeder(s), 2 leecher(s), 3 download(s) - '
+            u'1.5 GiB - A+</description><category>Games</category></item>'
+            u'<item><title>b</title><guid>?page=view&amp;tid=2</guid>'
+            u'<description>unexpected</description></item>'
+            u'</channel></rss>').encode('utf-8')
+    source = io.BytesIO(feed)
+    first, second = iter_torrent_stubs(source, Category.art)
+
+    assert first.tid == '1'
+    assert first.seeders is None
+    assert first.leechers == 2
+    assert first.downloads == 3
+    assert first.file_size == '1.5 GiB'
+    assert first.size == 1.5 * 1024 ** 3
+    assert first.category == Category.art__games
+    assert second.tid == '2'
+    assert second.seeders is None
+    assert second.file_size is None
+
+
+def test_lookup_category():
+    assert lookup_category('English-translated Anime') == \
+        Category.anime__english_translated_anime
+    assert lookup_category('Lossless Audio') == Category.audio__lossless_audio
+    assert lookup_category('Games') is None
+    assert lookup_category('Games', Category.software) == \
+        Category.software__games
+    assert lookup_category('Unknown') is None
+    assert lookup_category(None) is None
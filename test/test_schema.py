@@ -0,0 +1,87 @@
+import pickle
+import re
+
+import requests_mock
+
+from nyaalib import Category, NyaaClient
+from nyaalib.schema import NYAA_SCHEMA, CompiledFields, Field
+from nyaalib.parsers import get_parser
+from conftest import get_page_contents, nyaa_url
+
+
+mirror_url = 'http://nyaa.example'
+
+
+def parse_div(html):
+    return get_parser('html5lib').parse(
+        u'<html><body><div class="content">{0}</div></body></html>'.format(
+            html).encode('utf-8'), 'utf-8')
+
+
+def test_fields():
+    content = parse_div(
+        u'<table><tr><td><a href="/?page=view&amp;tid=12&amp;q=a+b%21">'
+        u'name</a></td><td>?</td></tr></table>')
+    fields = CompiledFields({
+        'tid': Field(cell=0, path='a', attribute='href', query='tid',
+                     converter=int),
+        'q': Field(cell=0, path='a', attribute='href', query='q'),
+        'name': Field(cell=0, path='a'),
+        'text': Field(cell=1),
+        'missing_query': Field(cell=0, path='a', attribute='href',
+                               query='page_id', default='none'),
+        'missing_element': Field('.//span', default=0),
+        'element': Field('.//a', element=True),
+        'deferred': Field('.//a', deferred=True),
+    }, cells='.//td')
+
+    values = fields.extract(content)
+    assert values['tid'] == 12
+    assert values['q'] == 'a b!'
+    assert values['name'] == 'name'
+    assert values['text'] == '?'
+    assert values['missing_query'] == 'none'
+    assert values['missing_element'] == 0
+    assert values['element'].tag == 'a'
+    assert values['deferred']() == 'name'
+
+
+def test_schema_for_a_mirror_with_another_layout():
+    # a mirror whose search rows have an extra "comments" cell after the
+    # name, which moves the size and swarm statistics one cell right
+    search_page = re.sub(
+        r'(<td class="tlistdownload">)', r'<td class="comments">3</td>\1',
+        get_page_contents('search_love_live_seeders_descending.html'))
+    row_fields = dict(NYAA_SCHEMA.row_fields)
+    for name in ('file_size', 'seeders', 'leechers', 'downloads'):
+        field = row_fields[name]
+        row_fields[name] = Field(cell=field.cell + 1,
+                                 converter=field.converter)
+    mirror_schema = NYAA_SCHEMA.replace(row_fields=row_fields)
+
+    nyaa_client = NyaaClient(nyaa_url)
+    mirror_client = NyaaClient(mirror_url, schema=mirror_schema)
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents(
+            'search_love_live_seeders_descending.html'))
+        m.get(mirror_url, text=search_page)
+        expected = nyaa_client.search('love live')
+        result = mirror_client.search('love live')
+
+    assert result.total_pages == expected.total_pages == 3
+    assert len(result.torrent_stubs) == 100
+    for stub, expected_stub in zip(result.torrent_stubs,
+                                   expected.torrent_stubs):
+        for name in stub.__slots__:
+            assert getattr(stub, name) == getattr(expected_stub, name)
+    assert result.torrent_stubs[0].category == \
+        Category.anime__english_translated_anime
+
+
+def test_schema_is_picklable():
+    schema = pickle.loads(pickle.dumps(NYAA_SCHEMA))
+    content = get_parser('html5lib').parse(
+        get_page_contents('search_love_live_seeders_descending.html'))
+    assert schema.extract_total_pages(content) == 3
+    assert [values['tid'] for values in schema.iter_rows(content)] == \
+        [values['tid'] for values in NYAA_SCHEMA.iter_rows(content)]
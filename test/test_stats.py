@@ -0,0 +1,168 @@
+import pytest
+import requests
+import requests_mock
+
+from nyaalib import NyaaClient, TorrentNotFoundError, stats
+from nyaalib.stats import (
+    BLOCK_SIZE, SwarmStatsSample, SwarmStatsSeries, SwarmStatsStore,
+    SwarmStatsTracker,
+)
+from conftest import get_page_contents, nyaa_url
+
+
+def test_series_round_trips_samples():
+    series = SwarmStatsSeries()
+    expected = []
+    for i in range(BLOCK_SIZE * 3 + 5):
+        sample = SwarmStatsSample(
+            1400000000 + i * 3600, 50 - i % 7, None if i % 5 else 3,
+            18000 + i * 2)
+        series.append(sample.timestamp, sample.seeders, sample.leechers,
+                      sample.downloads)
+        expected.append(sample)
+
+    assert len(series) == len(expected)
+    assert list(series.samples()) == expected
+    assert series.latest == expected[-1]
+    # the first sample of each block costs more, the others 5 or 6 bytes
+    assert series.nbytes < len(expected) * 8
+
+
+def test_series_range_queries():
+    series = SwarmStatsSeries()
+    for timestamp in range(0, 1000, 5):
+        series.append(timestamp, timestamp, 0, timestamp)
+    # samples sharing a timestamp across a block boundary
+    for _ in range(BLOCK_SIZE):
+        series.append(1000, 1, 1, 1)
+
+    assert [sample.timestamp for sample in series.samples(500, 520)] == \
+        [500, 505, 510, 515, 520]
+    assert [sample.timestamp for sample in series.samples(end=10)] == \
+        [0, 5, 10]
+    assert len(list(series.samples(start=1000))) == BLOCK_SIZE
+    assert list(series.samples(2000)) == []
+
+
+def test_series_of_float_arrays(monkeypatch):
+    # the arrays of Python 2 builds without a 64-bit integer array
+    monkeypatch.setattr(stats, '_INT64', 'd')
+    series = SwarmStatsSeries()
+    for timestamp in range(0, 1000, 5):
+        series.append(timestamp, timestamp, None, timestamp)
+
+    assert series.block_offsets.typecode == 'd'
+    assert list(series.samples(500, 505)) == [
+        SwarmStatsSample(500, 500, None, 500),
+        SwarmStatsSample(505, 505, None, 505)]
+
+
+def test_series_rejects_older_samples():
+    series = SwarmStatsSeries()
+    series.append(10, 1, 1, 1)
+    try:
+        series.append(9, 1, 1, 1)
+    except ValueError:
+        pass
+    else:
+        assert False, 'an older sample was appended'
+
+
+def test_store_records_by_torrent_id():
+    store = SwarmStatsStore()
+    store.record('486766', 10, 47, 13, 18441)
+    store.record(486766, 20, 45, 12, 18450)
+
+    assert '486766' in store
+    assert len(store) == 1
+    assert store.samples(486766, start=15) == [
+        SwarmStatsSample(20, 45, 12, 18450)]
+    assert store.latest('486766').seeders == 45
+    assert store.samples('1') == []
+    assert store.latest('1') is None
+
+
+def serve_pages(m):
+    search_page = get_page_contents('search_love_live_seeders_descending.html')
+    view_page = get_page_contents('view_tid_486766.html')
+    not_found_page = get_page_contents('view_tid_not_found.html')
+
+    def page(request, context):
+        if request.qs['page'] == ['search']:
+            return search_page
+        if request.qs['tid'] == ['1']:
+            return view_page
+        return not_found_page
+    m.get(nyaa_url, text=page)
+
+
+def count_searches(m):
+    return len([request for request in m.request_history
+                if request.qs['page'] == ['search']])
+
+
+def test_tracker_stops_searching_past_the_oldest_torrent():
+    tracker = SwarmStatsTracker(NyaaClient(nyaa_url))
+    # both are listed on the first page, which also lists older torrents
+    tracker.track(['486766', '631875'])
+    with requests_mock.mock() as m:
+        serve_pages(m)
+        refresh = tracker.refresh(timestamp=100)
+        assert count_searches(m) == 1
+        assert m.last_request.qs['sort'] == ['1']
+
+    assert (refresh.pages, refresh.from_search, refresh.from_view) == \
+        (1, 2, 0)
+    assert tracker.store.samples('486766') == [
+        SwarmStatsSample(100, 47, 13, 18441)]
+    assert tracker.store.samples('631875') == [
+        SwarmStatsSample(100, 37, 6, 4853)]
+
+
+def test_tracker_views_the_torrents_missing_from_search_pages():
+    tracker = SwarmStatsTracker(NyaaClient(nyaa_url), max_pages=2,
+                                workers=2)
+    # 1 and 2 are older than every listed torrent, so every page is read
+    tracker.track(['486766', '1', '2'])
+    with requests_mock.mock() as m:
+        serve_pages(m)
+        refresh = tracker.refresh(timestamp=100)
+        assert count_searches(m) == 2
+
+    assert (refresh.pages, refresh.from_search, refresh.from_view) == \
+        (2, 1, 1)
+    assert [failure.tid for failure in refresh.failures] == ['2']
+    assert isinstance(refresh.failures[0].error, TorrentNotFoundError)
+    # the torrent page of 486766 was served for 1
+    assert tracker.store.latest(1).downloads == 17786
+    assert '2' not in tracker.store
+
+    tracker.untrack(['1', '2'])
+    with requests_mock.mock() as m:
+        serve_pages(m)
+        refresh = tracker.refresh(timestamp=200)
+        assert m.call_count == 1
+    assert [sample.timestamp for sample in tracker.store.samples(486766)] \
+        == [100, 200]
+
+
+def test_tracker_records_nothing_when_a_search_page_fails():
+    tracker = SwarmStatsTracker(NyaaClient(nyaa_url), max_pages=2)
+    # 1 is older than every listed torrent, so the second page is read
+    tracker.track(['486766', '1'])
+    with requests_mock.mock() as m:
+        serve_pages(m)
+        m.get(nyaa_url + '/?page=search&offset=2',
+              exc=requests.ConnectionError)
+        with pytest.raises(requests.ConnectionError):
+            tracker.refresh(timestamp=100)
+    assert len(tracker.store) == 0
+
+    # the retry records each torrent once
+    with requests_mock.mock() as m:
+        serve_pages(m)
+        refresh = tracker.refresh(timestamp=100)
+    assert (refresh.from_search, refresh.from_view) == (1, 1)
+    assert tracker.store.samples('486766') == [
+        SwarmStatsSample(100, 47, 13, 18441)]
+    assert len(tracker.store.samples('1')) == 1
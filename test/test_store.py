@@ -0,0 +1,125 @@
+import hashlib
+import io
+import mmap
+
+import pytest
+import requests_mock
+
+from nyaalib import NyaaClient, TorrentNotFoundError
+from nyaalib.bencode import BencodeError, info_span, infohash
+from nyaalib.store import TorrentStore, write_file_atomically
+from conftest import nyaa_url
+
+
+info = b'd6:lengthi3e4:name5:a.mkv12:piece lengthi16384e6:pieces0:e'
+torrent_data = b'd8:announce9:udp://a:14:info' + info + b'e'
+torrent_headers = {'content-type': 'application/x-bittorrent'}
+
+
+def test_infohash_hashes_the_raw_info_dictionary():
+    start, end = info_span(torrent_data)
+    assert torrent_data[start:end] == info
+    assert infohash(torrent_data) == hashlib.sha1(info).hexdigest()
+
+    with pytest.raises(BencodeError):
+        infohash(b'd8:announce9:udp://a:1e')
+    with pytest.raises(BencodeError):
+        infohash(torrent_data[:-5])
+
+
+def test_store_round_trip(tmpdir):
+    store = TorrentStore(str(tmpdir))
+    torrent_infohash = store.add('1', torrent_data)
+
+    assert '1' in store
+    assert '2' not in store
+    assert store.get_infohash('1') == torrent_infohash
+
+    torrent = store.get('1')
+    assert isinstance(torrent.data, mmap.mmap)
+    assert torrent.data[:] == torrent_data
+    assert store.get(torrent_infohash=torrent_infohash).data[:] == \
+        torrent_data
+
+    store = TorrentStore(str(tmpdir), use_mmap=False)
+    assert store.get('1').data == torrent_data
+
+
+def test_store_rejects_empty_data_and_invalid_ids(tmpdir):
+    store = TorrentStore(str(tmpdir))
+    with pytest.raises(BencodeError):
+        store.add('1', b'')
+    assert tmpdir.join('tmp').listdir() == []
+    assert '1' not in store
+
+    for torrent_id in ('../1', '1/2', '', 'a1'):
+        with pytest.raises(ValueError):
+            store.add(torrent_id, torrent_data)
+        with pytest.raises(ValueError):
+            torrent_id in store
+
+
+def test_store_rejects_invalid_torrents(tmpdir):
+    store = TorrentStore(str(tmpdir))
+    for data, message in (
+            (b'garbage', 'Invalid string length at 0'),
+            (b'd4:infoi1ee', 'The metainfo has no info dictionary')):
+        with pytest.raises(BencodeError) as excinfo:
+            store.add('1', data)
+        assert str(excinfo.value) == message
+    assert tmpdir.join('tmp').listdir() == []
+    assert '1' not in store
+
+
+def test_get_torrent_is_served_from_the_store(tmpdir):
+    client = NyaaClient(nyaa_url, torrent_store=TorrentStore(str(tmpdir)))
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, content=torrent_data, headers=torrent_headers)
+        first_torrent = client.get_torrent('1')
+        second_torrent = client.get_torrent('1')
+        assert m.call_count == 1
+
+    assert first_torrent.data[:] == second_torrent.data[:] == torrent_data
+
+    sink = io.BytesIO()
+    torrent = client.get_torrent('1', dest=sink)
+    assert torrent.data is None
+    assert sink.getvalue() == torrent_data
+
+
+def test_get_torrent_streams_to_dest(tmpdir):
+    client = NyaaClient(nyaa_url)
+    path = str(tmpdir.join('1.torrent'))
+    sink = io.BytesIO()
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, content=torrent_data, headers=torrent_headers)
+        torrent = client.get_torrent('1', dest=path, chunk_size=7)
+        client.get_torrent('1', dest=sink)
+
+    assert torrent.data is None
+    assert torrent.path == path
+    with open(path, 'rb') as f:
+        assert f.read() == torrent_data
+    assert sink.getvalue() == torrent_data
+
+
+def test_get_torrent_checks_content_type_before_writing(tmpdir):
+    client = NyaaClient(nyaa_url, torrent_store=TorrentStore(str(tmpdir)))
+    sink = io.BytesIO()
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, content=b'<html></html>')
+        with pytest.raises(TorrentNotFoundError):
+            client.get_torrent('1', dest=sink)
+
+    assert sink.getvalue() == b''
+    assert '1' not in client.torrent_store
+
+
+def test_write_file_atomically_writes_utf8(tmpdir):
+    path = str(tmpdir.join('state.json'))
+    # native strings are bytes on Python 2
+    for text in (u'{"name": "\u00e9"}', u'{"name": "\u00e9"}'.encode('utf-8')):
+        write_file_atomically(path, text)
+        with open(path, 'rb') as f:
+            assert f.read() == u'{"name": "\u00e9"}'.encode('utf-8')
+    assert tmpdir.listdir() == [tmpdir.join('state.json')]
@@ -0,0 +1,90 @@
+import pytest
+import requests_mock
+
+from nyaalib import NyaaClient, TorrentNotFoundError
+from nyaalib.metrics import MetricsRecorder
+from nyaalib.parsers import get_parser
+from conftest import flatten, get_page_bytes, nyaa_url, page_filenames
+
+
+def iter_chunks(content, size, read):
+    for start in range(0, len(content), size):
+        chunk = content[start:start + size]
+        read.append(chunk)
+        yield chunk
+
+
+@pytest.mark.parametrize('filename', page_filenames)
+def test_streaming_parser_matches_html5lib(filename):
+    content = get_page_bytes(filename)
+    html5lib_div = get_parser('html5lib').parse(content, 'utf-8')
+    streaming_div = get_parser('streaming').parse_chunks(
+        iter_chunks(content, 100, []), 'utf-8')
+
+    assert streaming_div is not None
+    assert flatten(streaming_div) == flatten(html5lib_div)
+
+
+def test_streaming_parser_stops_after_the_content_div():
+    content = get_page_bytes('view_tid_486766.html')
+    read = []
+    get_parser('streaming').parse_chunks(iter_chunks(content, 100, read))
+
+    assert len(b''.join(read)) < len(content)
+
+
+def test_streaming_parser_closes_implied_and_missing_end_tags():
+    content = (b'<html><body><div class="content"><table><tr><td>a<td>b'
+               b'<tr><td>c</table><ul><li>d<li>e</ul><p>f<br>g</span>')
+    div = get_parser('streaming').parse(content)
+
+    assert [td.text for td in div.findall('.//tr/td')] == ['a', 'b', 'c']
+    assert [li.text for li in div.findall('ul/li')] == ['d', 'e']
+    assert div.find('p').text == 'f'
+    assert div.find('p/br').tail == 'g'
+
+
+def test_streaming_parser_decodes_split_characters():
+    content = u'<div class="content">ラブライブ</div>'
+    content = content.encode('utf-8')
+    div = get_parser('streaming').parse_chunks(
+        iter_chunks(content, 1, []), 'utf-8')
+
+    assert div.text == u'ラブライブ'
+
+
+def test_streaming_parser_without_content_div():
+    assert get_parser('streaming').parse(b'<html><body></body></html>') \
+        is None
+
+
+def test_client_streams_pages_into_the_parser():
+    recorder = MetricsRecorder()
+    clients = [NyaaClient(nyaa_url),
+               NyaaClient(nyaa_url, parser='streaming', hooks=[recorder])]
+    results = []
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, content=get_page_bytes('view_tid_486766.html'))
+        for client in clients:
+            results.append(client.view_torrent('486766'))
+        m.get(nyaa_url, content=get_page_bytes(
+            'search_love_live_seeders_descending.html'))
+        for client in clients:
+            results.append(client.search('love live'))
+        m.get(nyaa_url, content=get_page_bytes('view_tid_not_found.html'))
+        with pytest.raises(TorrentNotFoundError):
+            clients[1].view_torrent('1')
+
+    expected_page, torrent_page, expected_search, search = results
+    for name in ('name', 'category', 'tracker', 'date_created', 'seeders',
+                 'leechers', 'downloads', 'size'):
+        assert getattr(torrent_page, name) == getattr(expected_page, name)
+    assert torrent_page.submitter.uid == expected_page.submitter.uid
+    assert torrent_page.description.startswith(
+        b'<div class="viewdescription">')
+    assert search.total_pages == expected_search.total_pages
+    assert [stub.tid for stub in search.torrent_stubs] == \
+        [stub.tid for stub in expected_search.torrent_stubs]
+    assert recorder.counters['requests'] == 3
+    assert recorder.counters['error.TorrentNotFoundError.view'] == 1
+    assert recorder.counters['bytes_received'] > 0
@@ -0,0 +1,167 @@
+import threading
+import time
+
+import pytest
+import requests
+import requests_mock
+
+from nyaalib import NyaaClient
+from nyaalib.throttle import (
+    AdaptiveConcurrencyLimiter, RetryPolicy, TokenBucket)
+from conftest import nyaa_url
+
+
+torrent_headers = {'content-type': 'application/x-bittorrent'}
+
+
+def test_token_bucket_limits_the_sustained_rate():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.time()
+    for _ in range(6):
+        bucket.acquire()
+    # the first token is free, the other 5 take 1/50th of a second each
+    assert time.time() - start >= 0.09
+
+
+def test_token_bucket_rejects_impossible_requests():
+    for rate, capacity in ((0, None), (-1, None), (1, 0)):
+        with pytest.raises(ValueError):
+            TokenBucket(rate, capacity)
+    with pytest.raises(ValueError):
+        TokenBucket(rate=10, capacity=2).acquire(3)
+
+
+def test_retry_policy_backoff():
+    policy = RetryPolicy(backoff_factor=1, max_backoff=5)
+    for retry in range(10):
+        assert 0 <= policy.backoff(retry) <= min(5, 2 ** retry)
+
+    response = requests.Response()
+    response.headers['Retry-After'] = '3'
+    assert policy.backoff(0, response) == 3
+    response.headers['Retry-After'] = '60'
+    assert policy.backoff(0, response) == 5
+
+
+def test_transient_errors_are_retried():
+    client = NyaaClient(
+        nyaa_url, retry_policy=RetryPolicy(max_retries=2, backoff_factor=0))
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, [
+            {'status_code': 503},
+            {'exc': requests.exceptions.ConnectTimeout},
+            {'content': b'd4:infodee', 'headers': torrent_headers},
+        ])
+        torrent = client.get_torrent('1')
+        assert m.call_count == 3
+    assert torrent.data == b'd4:infodee'
+
+
+def test_retries_are_bounded():
+    client = NyaaClient(
+        nyaa_url, retry_policy=RetryPolicy(max_retries=2, backoff_factor=0))
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, status_code=502)
+        with pytest.raises(requests.HTTPError):
+            client.get_torrent('1')
+        assert m.call_count == 3
+
+        m.get(nyaa_url, exc=requests.exceptions.ConnectionError)
+        with pytest.raises(requests.ConnectionError):
+            client.get_torrent('1')
+        assert m.call_count == 6
+
+
+def test_errors_are_not_retried_without_a_policy():
+    client = NyaaClient(nyaa_url)
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, exc=requests.exceptions.ConnectionError)
+        with pytest.raises(requests.ConnectionError):
+            client.get_torrent('1')
+        assert m.call_count == 1
+
+
+def test_adaptive_limit_decreases_on_errors_and_recovers():
+    limiter = AdaptiveConcurrencyLimiter(
+        initial=8, minimum=2, maximum=10, latency_target=1.0, cooldown=0)
+
+    limiter.acquire()
+    limiter.release(False)
+    assert limiter.limit == 4
+    limiter.acquire()
+    limiter.release(True, latency=2.0)
+    assert limiter.limit == 2
+    limiter.acquire()
+    limiter.release(False)
+    assert limiter.limit == 2
+
+    for _ in range(100):
+        limiter.acquire()
+        limiter.release(True, latency=0.1)
+    assert limiter.limit == 10
+    assert limiter.in_flight == 0
+
+
+def test_adaptive_limit_bounds_requests_in_flight():
+    limiter = AdaptiveConcurrencyLimiter(initial=2, maximum=2)
+    in_flight = []
+    lock = threading.Lock()
+
+    def request():
+        limiter.acquire()
+        with lock:
+            in_flight.append(limiter.in_flight)
+        time.sleep(0.01)
+        limiter.release(True)
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(in_flight) <= 2
+
+
+def test_client_reports_outcomes_to_the_limiter():
+    limiter = AdaptiveConcurrencyLimiter(initial=8, cooldown=0)
+    client = NyaaClient(nyaa_url, concurrency_limiter=limiter,
+                        rate_limiter=TokenBucket(rate=1000))
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, status_code=503)
+        client._get({})
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
+
+
+def test_client_holds_the_slot_of_a_streamed_body():
+    limiter = AdaptiveConcurrencyLimiter(initial=8)
+    client = NyaaClient(nyaa_url, concurrency_limiter=limiter)
+    in_flight = []
+
+    class Sink(object):
+        def write(self, chunk):
+            in_flight.append(limiter.in_flight)
+
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, content=b'd4:infodee', headers=torrent_headers)
+        client.get_torrent('1', dest=Sink(), chunk_size=3)
+
+    assert in_flight == [1, 1, 1, 1]
+    assert limiter.in_flight == 0
+
+
+def test_client_judges_outcomes_by_the_retry_policy_statuses():
+    limiter = AdaptiveConcurrencyLimiter(initial=8, cooldown=0)
+    client = NyaaClient(nyaa_url, concurrency_limiter=limiter,
+                        retry_policy=RetryPolicy(max_retries=0,
+                                                 statuses=[429]))
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, status_code=503)
+        client._get({})
+        assert limiter.limit == 8
+
+        m.get(nyaa_url, status_code=429)
+        with pytest.raises(requests.HTTPError):
+            client._get({}, stream=True)
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
@@ -0,0 +1,109 @@
+import json
+
+import requests_mock
+
+from nyaalib import NyaaClient
+from nyaalib.watch import NewTorrentWatcher
+from conftest import (
+    get_page_contents, make_search_page, nyaa_url, row_tid,
+    search_page_rows,
+)
+
+
+def date_ordered_pages(rows_per_page=34):
+    """Rearrange the rows of the search fixture into the pages of a search
+    sorted by date, newest first.
+
+    :returns: the `list` of page contents and the `list` of torrent IDs in
+        search order
+    """
+    rows = sorted(search_page_rows(), key=row_tid, reverse=True)
+    pages = [make_search_page(rows[i:i + rows_per_page])
+             for i in range(0, len(rows), rows_per_page)]
+    return pages, [row_tid(row) for row in rows]
+
+
+def mock_pages(m, pages):
+    def search_page(request, context):
+        return pages[int(request.qs['offset'][0]) - 1]
+    m.get(nyaa_url, text=search_page)
+
+
+def test_first_poll_reads_one_page_and_saves_the_mark(tmpdir):
+    state_path = str(tmpdir.join('state.json'))
+    watcher = NewTorrentWatcher(NyaaClient(nyaa_url), state_path=state_path)
+    with requests_mock.mock() as m:
+        m.get(nyaa_url, text=get_page_contents(
+            'search_love_live_seeders_descending.html'))
+        new_stubs = list(watcher.poll())
+        assert m.call_count == 1
+        assert m.last_request.qs['sort'] == ['1']
+
+        # nothing new on the next poll, which only costs one request
+        assert list(watcher.poll()) == []
+        assert m.call_count == 2
+
+    assert len(new_stubs) == 100
+    assert watcher.last_seen_tid == 659625
+    with open(state_path) as f:
+        assert json.load(f) == {'last_seen_tid': 659625, 'gaps': []}
+    assert NewTorrentWatcher(
+        NyaaClient(nyaa_url), state_path=state_path).last_seen_tid == 659625
+
+
+def test_poll_stops_in_the_middle_of_a_page():
+    pages, tids = date_ordered_pages()
+    watcher = NewTorrentWatcher(NyaaClient(nyaa_url))
+    watcher.last_seen_tid = tids[19]
+    with requests_mock.mock() as m:
+        mock_pages(m, pages)
+        new_stubs = list(watcher.poll())
+        assert m.call_count == 1
+
+    assert [int(stub.tid) for stub in new_stubs] == tids[:19]
+    assert watcher.last_seen_tid == tids[0]
+    assert watcher.gaps == []
+
+
+def test_poll_walks_pages_until_seen_torrents(tmpdir):
+    state_path = str(tmpdir.join('state.json'))
+    pages, tids = date_ordered_pages()
+    watcher = NewTorrentWatcher(NyaaClient(nyaa_url), state_path=state_path,
+                                max_pages=3)
+    watcher.last_seen_tid = tids[50]
+    with requests_mock.mock() as m:
+        mock_pages(m, pages)
+        new_stubs = list(watcher.poll())
+        assert [r.qs['offset'] for r in m.request_history] == [['1'], ['2']]
+
+    assert [int(stub.tid) for stub in new_stubs] == tids[:50]
+    with open(state_path) as f:
+        assert json.load(f) == {'last_seen_tid': tids[0], 'gaps': []}
+
+
+def test_poll_catches_up_across_gaps(tmpdir):
+    state_path = str(tmpdir.join('state.json'))
+    pages, tids = date_ordered_pages()
+    watcher = NewTorrentWatcher(NyaaClient(nyaa_url), state_path=state_path,
+                                max_pages=2)
+    watcher.last_seen_tid = tids[80]
+    with requests_mock.mock() as m:
+        mock_pages(m, pages)
+        new_stubs = list(watcher.poll())
+        assert m.call_count == 2
+        assert [int(stub.tid) for stub in new_stubs] == tids[:68]
+        # the torrents that were not read are recorded, and the mark
+        # advances past them
+        assert watcher.gaps == [(tids[80], tids[67])]
+        assert watcher.last_seen_tid == tids[0]
+
+        # so the next poll does not yield the same torrents again
+        assert list(watcher.poll()) == []
+        assert m.call_count == 3
+
+    assert watcher.gaps == [(tids[80], tids[67])]
+    with open(state_path) as f:
+        assert json.load(f) == {
+            'last_seen_tid': tids[0], 'gaps': [[tids[80], tids[67]]]}
+    assert NewTorrentWatcher(
+        NyaaClient(nyaa_url), state_path=state_path).gaps == watcher.gaps